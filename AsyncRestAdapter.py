@@ -0,0 +1,310 @@
+import asyncio
+import json
+import ssl
+import time
+import aiohttp
+from collections import deque
+from Pagination import Pagination
+from RateLimiter import RateLimiter
+from RetryPolicy import RetryPolicy
+from Tracer import Tracer
+
+
+class AsyncResponse:
+    status_code = 0
+    text = ""
+    headers = {}
+
+    def __init__(self, status_code, text, headers):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers
+
+
+class AsyncRestAdapter:
+    url = ""
+    url_int = ""
+    version = ""
+    api_token = ""
+    pool_size = 100
+    verify = True
+    session = None
+    rate_limiter = None
+    pagination = None
+    metrics = None
+    tracer = None
+    cache = None
+    retry_policy = None
+    name = ""
+
+    def __init__(
+        self,
+        hostname,
+        version,
+        api_token,
+        pool_size=100,
+        verify=True,
+        rate_limiter=None,
+        metrics=None,
+        tracer=None,
+        cache=None,
+        retry_policy=None,
+        name="",
+    ):
+        base_url = hostname
+        if not base_url.startswith("http://") and not base_url.startswith("https://"):
+            base_url = f"https://{hostname}"
+        self.url = f"{base_url}/api/{version}"
+        self.url_int = f"{base_url}/internal"
+        self.version = version
+        self.api_token = api_token
+        self.pool_size = pool_size
+        self.verify = verify
+        self.headers = {
+            "Authorization": f"{self.api_token}",
+            "Content-Type": "application/json",
+        }
+        if rate_limiter is None:
+            rate_limiter = RateLimiter()
+        self.rate_limiter = rate_limiter
+        self.pagination = Pagination()
+        self.metrics = metrics
+        if tracer is None:
+            tracer = Tracer()
+        self.tracer = tracer
+        self.cache = cache
+        if retry_policy is None:
+            retry_policy = RetryPolicy()
+        self.retry_policy = retry_policy
+        self.name = name
+
+    ##################################################
+    # Open and close the pooled session
+    ##################################################
+
+    # aiohttp sessions must be created inside the running event loop
+    async def open(self):
+        ssl_context = None
+        if self.verify is False:
+            ssl_context = False
+        elif isinstance(self.verify, str):
+            ssl_context = ssl.create_default_context(cafile=self.verify)
+        connector = aiohttp.TCPConnector(limit=self.pool_size, ssl=ssl_context)
+        self.session = aiohttp.ClientSession(connector=connector)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    ##################################################
+    # Page through a listing, yielding results as they arrive
+    ##################################################
+
+    async def paginate(self, path, beta=False, internal=False):
+        async for page in self.paginate_pages(path, beta=beta, internal=internal):
+            for item in page:
+                yield item
+
+    # After the first page, the rest are fetched up to pool_size at a time
+    # by offset and yielded in order
+    async def paginate_pages(self, path, beta=False, internal=False):
+        path = self.pagination.first_path(path)
+        data = await self.get_page(path, beta, internal)
+        yield data.get("items", [])
+
+        paths = self.pagination.offset_paths(path, data)
+        if paths is None:
+            path = self.pagination.next_path(data, self.version)
+            while path is not None:
+                data = await self.get_page(path, beta, internal)
+                yield data.get("items", [])
+                path = self.pagination.next_path(data, self.version)
+            return
+
+        pending = deque()
+        try:
+            for path in paths:
+                if len(pending) == self.pool_size:
+                    yield (await pending.popleft()).get("items", [])
+                pending.append(
+                    asyncio.ensure_future(self.get_page(path, beta, internal))
+                )
+            while len(pending) > 0:
+                yield (await pending.popleft()).get("items", [])
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def get_page(self, path, beta=False, internal=False):
+        response = await self.get(path, beta=beta, internal=internal)
+        return json.loads(response.text)
+
+    async def get(self, path, params=None, json=None, beta=False, internal=False):
+        return await self.request(
+            "GET", path, params=params, json=json, beta=beta, internal=internal
+        )
+
+    async def post(self, path, params=None, json=None, beta=False, internal=False):
+        return await self.request(
+            "POST", path, params=params, json=json, beta=beta, internal=internal
+        )
+
+    async def put(self, path, params=None, json=None, beta=False, internal=False):
+        return await self.request(
+            "PUT", path, params=params, json=json, beta=beta, internal=internal
+        )
+
+    async def delete(self, path, params=None, json=None, beta=False, internal=False):
+        return await self.request(
+            "DELETE", path, params=params, json=json, beta=beta, internal=internal
+        )
+
+    async def patch(self, path, params=None, json=None, beta=False, internal=False):
+        return await self.request(
+            "PATCH", path, params=params, json=json, beta=beta, internal=internal
+        )
+
+    async def request(
+        self, http_method, path, params=None, json=None, beta=False, internal=False
+    ):
+        new_path = path
+        if not new_path.startswith("/"):
+            new_path = "/" + new_path
+
+        url = f"{self.url}{new_path}"
+        if internal:
+            url = f"{self.url_int}{new_path}"
+        temp_headers = self.headers.copy()
+        if beta:
+            temp_headers["LD-API-Version"] = "beta"
+
+        route = self.rate_limiter.normalize_route(
+            http_method, ("/internal" if internal else "") + new_path
+        )
+
+        # A GET seen before is sent with its validators
+        cache_key = None
+        cache_entry = None
+        if self.cache is not None and http_method == "GET":
+            cache_key = self.cache.key(url, params, temp_headers)
+            cache_entry = self.cache.prepare(cache_key, temp_headers)
+
+        with self.tracer.span(route, "http", host=self.name, path=new_path) as span:
+            throttled = 0
+            attempt = 1
+            slept = 0.0
+            while True:
+                probed = 0.0
+                wait = self.rate_limiter.reserve(route)
+                # Another request is learning the budget
+                while wait is None:
+                    await asyncio.sleep(self.rate_limiter.probe_interval)
+                    probed += self.rate_limiter.probe_interval
+                    wait = self.rate_limiter.reserve(route)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                wait += probed
+                if self.metrics is not None:
+                    self.metrics.record_wait(self.name, route, wait)
+                self.tracer.record("rate limit wait", "wait", wait)
+
+                response = None
+                error = None
+                try:
+                    started = time.time()
+                    async with self.session.request(
+                        http_method,
+                        url,
+                        headers=temp_headers,
+                        params=params,
+                        json=json if json else None,
+                    ) as res:
+                        body = await res.read()
+                        text = await res.text()
+                        response = AsyncResponse(res.status, text, res.headers)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    error = e
+
+                if response is not None:
+                    if self.metrics is not None:
+                        self.metrics.record_response(
+                            self.name,
+                            route,
+                            response.status_code,
+                            time.time() - started,
+                            self.metrics.body_size(json),
+                            len(body),
+                        )
+
+                    #########################
+                    # Rate limiting Logic
+                    #########################
+
+                    self.rate_limiter.update(route, response.headers, started)
+                    if response.status_code == 429:
+                        # Throttled requests are not applied, so they are safe to resend
+                        throttled += 1
+                        self.rate_limiter.throttle(route, response.headers)
+                else:
+                    self.rate_limiter.end_probe(route)
+
+                #########################
+                # Retry Logic
+                #########################
+
+                # Raises a RequestError when there is no response to return
+                delay = self.retry_policy.get_delay(
+                    http_method,
+                    new_path,
+                    attempt,
+                    slept,
+                    status_code=None if response is None else response.status_code,
+                    headers=None if response is None else response.headers,
+                    error=error,
+                    sent=not isinstance(error, aiohttp.ClientConnectorError),
+                )
+                if delay is None:
+                    break
+
+                if response is not None and response.status_code == 429:
+                    if self.metrics is not None:
+                        self.metrics.record_wait(self.name, route, delay)
+                    await asyncio.sleep(delay)
+                    self.tracer.record("rate limit wait", "wait", delay)
+                else:
+                    reason = str(error) if response is None else str(response.status_code)
+                    print(
+                        "!!! Request failed ("
+                        + reason
+                        + "). Retrying in "
+                        + str(round(delay, 1))
+                        + " seconds..."
+                    )
+                    if self.metrics is not None:
+                        self.metrics.record_retry(self.name, route, delay)
+                    await asyncio.sleep(delay)
+                    self.tracer.record("retry sleep", "wait", delay)
+                slept += delay
+                attempt += 1
+
+            span.set("status", response.status_code)
+            if throttled > 0:
+                span.set("throttled", throttled)
+            if attempt > 1:
+                span.set("attempts", attempt)
+
+            if cache_key is not None:
+                content = self.cache.update(
+                    cache_key,
+                    cache_entry,
+                    response.status_code,
+                    response.headers,
+                    body,
+                )
+                # Not modified: callers get the cached body as a 200
+                if content is not None:
+                    response = AsyncResponse(200, content.decode(), response.headers)
+                    span.set("cache", "hit")
+
+        return response
@@ -0,0 +1,204 @@
+import contextlib
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from LDMigrate import LDMigrate
+from RateLimiter import SharedRateLimiter
+
+# State of a worker process, set up once by init_worker()
+worker = {}
+
+
+class BatchMigrate:
+    settings = {}
+    projects = []
+    workers = 4
+    options = {}
+    result_totals = [
+        "total_context_kinds",
+        "total_payload_filters",
+        "total_environments",
+        "total_metrics",
+        "total_metric_groups",
+        "total_segments",
+        "total_flags",
+        "total_target_rules",
+        "total_unchanged",
+    ]
+
+    # Migrates (source project key, target project key) pairs between the
+    # two accounts in app.ini, up to workers projects at a time, each in its
+    # own process. Target members are listed once, and every process paces its
+    # requests against one shared rate limit budget per account. Keyword
+    # arguments are passed on to every LDMigrate, e.g. source_host
+    def __init__(self, settings, projects, workers=4, **options):
+        self.settings = settings
+        self.projects = projects
+        self.workers = max(1, min(workers, len(projects)))
+        self.options = options
+
+    ##################################################
+    # Migrate every project pair
+    ##################################################
+
+    def migrate(self):
+        # Spawned rather than forked, as the parent has open connection pools
+        context = multiprocessing.get_context("spawn")
+        source_state, target_state = self.create_rate_limit_states(context)
+        target_members = self.get_target_members(source_state, target_state)
+
+        print(
+            "Migrating "
+            + str(len(self.projects))
+            + " projects with "
+            + str(self.workers)
+            + " workers...",
+            end="\n\n",
+            flush=True,
+        )
+        started = time.time()
+        projects = []
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=init_worker,
+            initargs=(
+                self.settings,
+                self.options,
+                source_state,
+                target_state,
+                target_members,
+            ),
+        ) as executor:
+            futures = {
+                executor.submit(migrate_project, source_key, target_key): (
+                    source_key,
+                    target_key,
+                )
+                for source_key, target_key in self.projects
+            }
+            for future in as_completed(futures):
+                source_key, target_key = futures[future]
+                projects.append(self.get_project_result(future, source_key, target_key))
+
+        # Report in the order the projects were listed
+        order = [target_key for _, target_key in self.projects]
+        projects.sort(key=lambda p: order.index(p["target_project_key"]))
+        return self.get_result(projects, time.time() - started)
+
+    # The source and target share a budget when they are the same account
+    def create_rate_limit_states(self, context):
+        source_state = SharedRateLimiter.create_state(context)
+        target_state = SharedRateLimiter.create_state(context)
+        if (
+            self.settings["source_api_token"] == self.settings["target_api_token"]
+            and self.settings["source_is_federal"] == self.settings["target_is_federal"]
+        ):
+            target_state = source_state
+        return source_state, target_state
+
+    # Read from the member cache when it holds a fresh listing
+    def get_target_members(self, source_state, target_state):
+        print("Getting target members...", end="", flush=True)
+        source_key, target_key = self.projects[0]
+        migrator = LDMigrate.from_settings(
+            self.settings,
+            project_key_source=source_key,
+            project_key_target=target_key,
+            source_rate_limiter=SharedRateLimiter(source_state),
+            target_rate_limiter=SharedRateLimiter(target_state),
+            **self.options,
+        )
+        target_members = migrator.get_target_members()
+        migrator.members.save()
+        print("done. Got " + str(len(target_members)) + " members.", end="\n\n")
+        return target_members
+
+    ##################################################
+    # Combined result
+    ##################################################
+
+    def get_project_result(self, future, source_key, target_key):
+        project = {
+            "source_project_key": source_key,
+            "target_project_key": target_key,
+            "log": get_project_path("migration.log", target_key),
+        }
+        try:
+            project.update(future.result())
+            project["status"] = "migrated"
+            print("Migrated " + source_key + " to " + target_key + ".", flush=True)
+        # exit() in a worker arrives as SystemExit
+        except (Exception, SystemExit) as e:
+            project["status"] = "failed"
+            project["error"] = type(e).__name__ + ": " + str(e)
+            print(
+                "!!! Migrating "
+                + source_key
+                + " to "
+                + target_key
+                + " failed. See "
+                + project["log"]
+                + ".",
+                flush=True,
+            )
+        return project
+
+    def get_result(self, projects, wall_time):
+        totals = {name: 0 for name in self.result_totals}
+        for project in projects:
+            for name in self.result_totals:
+                totals[name] += project.get(name, 0)
+        return {
+            "projects": projects,
+            "totals": totals,
+            "migrated": len([p for p in projects if p["status"] == "migrated"]),
+            "failed": len([p for p in projects if p["status"] == "failed"]),
+            "wall_time": round(wall_time, 3),
+        }
+
+
+##################################################
+# Worker processes
+##################################################
+
+
+def init_worker(settings, options, source_state, target_state, target_members):
+    worker["settings"] = settings
+    worker["options"] = options
+    worker["source_rate_limiter"] = SharedRateLimiter(source_state)
+    worker["target_rate_limiter"] = SharedRateLimiter(target_state)
+    if target_state is source_state:
+        worker["target_rate_limiter"] = worker["source_rate_limiter"]
+    worker["target_members"] = target_members
+
+
+# Each project writes its output to its own log, so the projects running
+# at the same time do not interleave
+def migrate_project(source_key, target_key):
+    settings = worker["settings"]
+    with open(get_project_path("migration.log", target_key), "w") as log:
+        with contextlib.redirect_stdout(log):
+            migrator = LDMigrate.from_settings(
+                settings,
+                project_key_source=source_key,
+                project_key_target=target_key,
+                journal_path=get_project_path(settings["journal_path"], target_key),
+                metrics_path=get_project_path(settings["metrics_path"], target_key),
+                trace_path=get_project_path(settings["trace_path"], target_key),
+                source_rate_limiter=worker["source_rate_limiter"],
+                target_rate_limiter=worker["target_rate_limiter"],
+                target_members=worker["target_members"],
+                **worker["options"],
+            )
+            return migrator.migrate()
+
+
+# migration.log for support-service is migration-support-service.log.
+# Without a path, the migrator's own default is used
+def get_project_path(path, project_key):
+    if path is None:
+        return None
+    stem, ext = os.path.splitext(path)
+    return stem + "-" + project_key + ext
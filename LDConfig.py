@@ -29,7 +29,7 @@ class LDConfig:
         self.config_file = config_file
         self.config = configparser.ConfigParser()
         self.required_sections = ["SourceConfiguration", "TargetConfiguration"]
-        self.optional_sections = ["Options"]
+        self.optional_sections = ["Options", "Batch"]
 
     def get_config(self):
         self.read_config()
@@ -68,7 +68,10 @@ class LDConfig:
             if source["SourceProjectKey"] == "":
                 self.error_messages.append("SourceProjectKey cannot be empty")
         
-        if not source["SourceApiToken"]:
+        if "SourceSnapshot" in source and source["SourceSnapshot"] != "":
+            if not os.path.isfile(os.path.join(source["SourceSnapshot"], "index.json")):
+                self.error_messages.append("SourceSnapshot not found: " + source["SourceSnapshot"])
+        elif "SourceApiToken" not in source or not source["SourceApiToken"]:
             self.error_messages.append("SourceApiToken is required")
         else:
             if source["SourceApiToken"] == "":
@@ -80,6 +83,10 @@ class LDConfig:
             if target["TargetApiToken"] == "":
                 self.error_messages.append("TargetApiToken cannot be empty")
 
+        if "Engine" in options:
+            if options["Engine"].lower() not in ["sync", "async"]:
+                self.error_messages.append("Engine must be either sync or async.")
+
         if "MigrationMode" in options:
             if options["MigrationMode"].lower() == "merge":
                 if target["TargetProjectKey"] == source["SourceProjectKey"]:
@@ -87,10 +94,48 @@ class LDConfig:
                 if target["TargetProjectKey"].strip() == "":
                     self.error_messages.append("TargetProjectKey cannot be empty for merge mode.")
 
+        if "Batch" in self.sections:
+            self.validate_batch(source, options)
+
         if len(self.error_messages) == 0:
             self.is_valid = True
         return
 
+    # Worker processes cannot ask to confirm a merge, and a snapshot holds a
+    # single project
+    def validate_batch(self, source, options):
+        batch = self.config["Batch"]
+        projects = self.get_batch_projects(batch)
+        if len(projects) == 0:
+            self.error_messages.append("Batch Projects cannot be empty")
+        targets = [target for _, target in projects]
+        if len(set(targets)) != len(targets):
+            self.error_messages.append("Batch Projects cannot share a target project key")
+        if "Workers" in batch and int(batch["Workers"]) < 1:
+            self.error_messages.append("Batch Workers must be at least 1")
+        if "SourceSnapshot" in source and source["SourceSnapshot"] != "":
+            self.error_messages.append("SourceSnapshot cannot be used with Batch")
+        if "MigrationMode" in options and options["MigrationMode"].lower() == "merge":
+            for name in ["IgnoreDuplicateFlagNames", "IgnoreDuplicateSegmentNames"]:
+                if name not in options or not self.to_bool[options[name]]:
+                    self.error_messages.append(
+                        name + " must be true to merge a batch of projects."
+                    )
+
+    # One source project key per line or comma, optionally followed by
+    # :target-project-key
+    def get_batch_projects(self, batch):
+        projects = []
+        for entry in batch.get("Projects", "").replace(",", "\n").split("\n"):
+            entry = entry.strip()
+            if entry == "":
+                continue
+            source_key, _, target_key = entry.partition(":")
+            source_key = source_key.strip()
+            target_key = target_key.strip()
+            projects.append((source_key, target_key if target_key != "" else source_key))
+        return projects
+
     def get_settings(self):
         if not self.is_valid:
             return
@@ -102,7 +147,8 @@ class LDConfig:
             options = self.config["Options"]
         settings = {
             "source_project_key": source["SourceProjectKey"],
-            "source_api_token": source["SourceApiToken"],
+            "source_api_token": source.get("SourceApiToken", ""),
+            "source_snapshot": None,
             "source_is_federal": False,
             "target_api_token": target["TargetApiToken"],
             "target_is_federal": False,
@@ -114,6 +160,21 @@ class LDConfig:
             "migrate_metrics": True,
             "ignore_duplicate_flags": False,
             "ignore_duplicate_segments": False,
+            "connection_pool_size": 10,
+            "concurrency": 5,
+            "engine": "sync",
+            "journal_path": None,
+            "max_patch_size": 256 * 1024,
+            "metrics_path": None,
+            "trace_path": None,
+            "member_cache_path": None,
+            "member_cache_ttl": 86400,
+            "response_cache_path": None,
+            "response_cache_size": 256 * 1024 * 1024,
+            "max_retries": 5,
+            "retry_budget": 1000,
+            "batch_projects": [],
+            "batch_workers": 4,
         }
         if "TargetProjectKey" in target:
             settings["target_project_key"] = target["TargetProjectKey"]
@@ -131,6 +192,40 @@ class LDConfig:
             settings["ignore_duplicate_flags"] = self.to_bool[options["IgnoreDuplicateFlagNames"]]
         if "IgnoreDuplicateSegmentNames" in options:
             settings["ignore_duplicate_segments"] = self.to_bool[options["IgnoreDuplicateSegmentNames"]]
+        if "ConnectionPoolSize" in options:
+            settings["connection_pool_size"] = int(options["ConnectionPoolSize"])
+        if "Concurrency" in options:
+            settings["concurrency"] = int(options["Concurrency"])
+        if "Engine" in options:
+            settings["engine"] = options["Engine"].lower()
+        if "SourceSnapshot" in source and source["SourceSnapshot"] != "":
+            settings["source_snapshot"] = source["SourceSnapshot"]
+        if "JournalFile" in options and options["JournalFile"] != "":
+            settings["journal_path"] = options["JournalFile"]
+        if "MaxPatchSize" in options:
+            settings["max_patch_size"] = int(options["MaxPatchSize"])
+        if "MetricsFile" in options and options["MetricsFile"] != "":
+            settings["metrics_path"] = options["MetricsFile"]
+        if "TraceFile" in options and options["TraceFile"] != "":
+            settings["trace_path"] = options["TraceFile"]
+        if "MemberCacheFile" in options and options["MemberCacheFile"] != "":
+            settings["member_cache_path"] = options["MemberCacheFile"]
+        if "MemberCacheTTL" in options:
+            settings["member_cache_ttl"] = int(options["MemberCacheTTL"])
+        if "ResponseCacheDir" in options and options["ResponseCacheDir"] != "":
+            settings["response_cache_path"] = options["ResponseCacheDir"]
+        if "ResponseCacheSize" in options:
+            # In megabytes
+            settings["response_cache_size"] = int(options["ResponseCacheSize"]) * 1024 * 1024
+        if "MaxRetries" in options:
+            settings["max_retries"] = int(options["MaxRetries"])
+        if "RetryBudget" in options:
+            settings["retry_budget"] = int(options["RetryBudget"])
+        if "Batch" in self.sections:
+            batch = self.config["Batch"]
+            settings["batch_projects"] = self.get_batch_projects(batch)
+            if "Workers" in batch:
+                settings["batch_workers"] = int(batch["Workers"])
         if "SourceIsFederal" in source:
             settings["source_is_federal"] = self.to_bool[source["SourceIsFederal"]]
         if "TargetIsFederal" in target:
@@ -1,6 +1,24 @@
+import asyncio
+import copy
 import json
+import queue
+import threading
 import time
 from RestAdapter import RestAdapter
+from RateLimiter import RateLimiter
+from RequestMetrics import ContextExecutor, RequestMetrics
+from Tracer import Tracer
+from PhaseScheduler import PhaseScheduler
+from SourceSnapshot import SourceSnapshot
+from MigrationJournal import MigrationJournal
+from MemberDirectory import MemberDirectory
+from ResponseCache import ResponseCache
+from RetryPolicy import RetryPolicy
+from MigrationPlanner import MigrationPlanner
+from PatchDiff import PatchDiff
+from PatchChunker import PatchChunker
+from SegmentGraph import SegmentGraph
+from SnapshotStore import SnapshotAdapter, SnapshotExporter, SnapshotReader
 from enum import Enum
 
 
@@ -26,8 +44,6 @@ class LDMigrate:
     target_segment_keys = []
     env_keys = []
     target_env_keys = []
-    source_members = {}
-    target_members = {}
     total_context_kinds = 0
     total_payload_filters = 0
     total_environments = 0
@@ -36,8 +52,20 @@ class LDMigrate:
     total_segments = 0
     total_flags = 0
     total_target_rules = 0
+    total_unchanged = 0
+    phase_timings = {}
     http_source = None
     http_target = None
+    snapshot = None
+    journal = None
+    members = None
+    patch_diff = None
+    patch_chunker = None
+    metrics = None
+    metrics_path = None
+    tracer = None
+    response_cache = None
+    retry_policy = None
     migrate_flag_templates = True
     migrate_payload_filters = True
     migrate_context_kinds = True
@@ -46,6 +74,36 @@ class LDMigrate:
     ignore_pauses = False
     ignore_duplicate_flags = False
     ignore_duplicate_segments = False
+    connection_pool_size = 10
+    concurrency = 5
+    environment_patch_attempts = 5
+    counter_lock = None
+    engine = "sync"
+    metric_fields = [
+        "key",
+        "name",
+        "description",
+        "kind",
+        "isActive",
+        "isNumeric",
+        "tags",
+        "randomizationUnits",
+        "unitAggregationType",
+        "analysisType",
+        "eventDefault",
+    ]
+    segment_fields = [
+        "key",
+        "name",
+        "tags",
+        "included",
+        "excluded",
+        "includedContexts",
+        "excludedContexts",
+        "rules",
+    ]
+    src_host = "app.launchdarkly.com"
+    tgt_host = "app.launchdarkly.com"
 
     def __init__(
         self,
@@ -66,6 +124,25 @@ class LDMigrate:
         ignore_pauses=False,
         ignore_duplicate_flags=False,
         ignore_duplicate_segments=False,
+        connection_pool_size=10,
+        concurrency=5,
+        engine="sync",
+        source_host=None,
+        target_host=None,
+        source_snapshot=None,
+        journal_path=None,
+        max_patch_size=256 * 1024,
+        metrics_path=None,
+        trace_path=None,
+        source_rate_limiter=None,
+        target_rate_limiter=None,
+        target_members=None,
+        member_cache_path=None,
+        member_cache_ttl=86400,
+        response_cache_path=None,
+        response_cache_size=256 * 1024 * 1024,
+        max_retries=5,
+        retry_budget=1000,
     ):
         self.api_key_src = api_key_src
         self.api_key_tgt = api_key_tgt
@@ -79,14 +156,83 @@ class LDMigrate:
         if flags_to_migrate is not None:
             self.flags_to_migrate = flags_to_migrate
         self.migration_mode = migration_mode
+        self.concurrency = max(1, concurrency)
+        # Every worker needs its own connection, so the pool follows concurrency
+        self.connection_pool_size = max(connection_pool_size, self.concurrency)
+        self.counter_lock = threading.Lock()
+        self.snapshot = SourceSnapshot()
+        self.journal = MigrationJournal(journal_path)
+        self.patch_diff = PatchDiff()
+        self.patch_chunker = PatchChunker(max_patch_size)
+        self.metrics = RequestMetrics()
+        self.metrics_path = metrics_path
+        self.tracer = Tracer(trace_path)
+        # Source GETs are revalidated rather than downloaded again by reruns
+        if response_cache_path is not None:
+            self.response_cache = ResponseCache(response_cache_path, response_cache_size)
+        # One budget of retries for every request of the migration
+        self.retry_policy = RetryPolicy(
+            max_attempts=max_retries + 1, max_run_retries=retry_budget
+        )
+        self.engine = engine
         src_host = "app.launchdarkly.com"
         if source_is_federal:
             src_host = "app.launchdarkly.us"
+        if source_host is not None:
+            src_host = source_host
         tgt_host = "app.launchdarkly.com"
         if target_is_federal:
             tgt_host = "app.launchdarkly.us"
-        self.http_source = RestAdapter(src_host, "v2", self.api_key_src)
-        self.http_target = RestAdapter(tgt_host, "v2", self.api_key_tgt)
+        if target_host is not None:
+            tgt_host = target_host
+        self.src_host = src_host
+        self.tgt_host = tgt_host
+        # Rate limits are tracked per account, so share them when the source
+        # and target are the same account
+        src_limiter = RateLimiter()
+        tgt_limiter = RateLimiter()
+        if src_host == tgt_host and self.api_key_src == self.api_key_tgt:
+            tgt_limiter = src_limiter
+        # Batch workers pass limiters shared with the other worker processes
+        if source_rate_limiter is not None:
+            src_limiter = source_rate_limiter
+        if target_rate_limiter is not None:
+            tgt_limiter = target_rate_limiter
+        self.http_source = RestAdapter(
+            src_host,
+            "v2",
+            self.api_key_src,
+            pool_size=self.connection_pool_size,
+            rate_limiter=src_limiter,
+            metrics=self.metrics,
+            tracer=self.tracer,
+            cache=self.response_cache,
+            retry_policy=self.retry_policy,
+            name="source",
+        )
+        self.http_target = RestAdapter(
+            tgt_host,
+            "v2",
+            self.api_key_tgt,
+            pool_size=self.connection_pool_size,
+            rate_limiter=tgt_limiter,
+            metrics=self.metrics,
+            tracer=self.tracer,
+            retry_policy=self.retry_policy,
+            name="target",
+        )
+        # A snapshot written by export_snapshot() stands in for the source API
+        if source_snapshot is not None:
+            self.http_source = SnapshotAdapter(SnapshotReader(source_snapshot))
+        # Target members resolve flag maintainers, and are listed once for a
+        # batch of projects
+        self.members = MemberDirectory(
+            tgt_host + " " + self.api_key_tgt,
+            path=member_cache_path,
+            ttl=member_cache_ttl,
+        )
+        if target_members is not None:
+            self.members.store_all(target_members)
         self.migrate_flag_templates = migrate_flag_templates
         self.migrate_context_kinds = migrate_context_kinds
         self.migrate_payload_filters = migrate_payload_filters
@@ -96,7 +242,57 @@ class LDMigrate:
         self.ignore_duplicate_flags = ignore_duplicate_flags
         self.ignore_duplicate_segments = ignore_duplicate_segments
 
+    # Builds a migrator from the settings LDConfig reads from app.ini. Any
+    # keyword argument overrides the matching setting
+    @classmethod
+    def from_settings(cls, settings, **kwargs):
+        options = {
+            "project_key_target": settings["target_project_key"],
+            "source_is_federal": settings["source_is_federal"],
+            "target_is_federal": settings["target_is_federal"],
+            "ignore_pauses": settings["ignore_pauses"],
+            "flags_to_ignore": settings["flags_to_ignore"],
+            "flags_to_migrate": settings["flags_to_migrate"],
+            "migration_mode": settings["migration_mode"],
+            "migrate_flag_templates": settings["migrate_flag_templates"],
+            "migrate_context_kinds": settings["migrate_context_kinds"],
+            "migrate_payload_filters": settings["migrate_payload_filters"],
+            "migrate_segments": settings["migrate_segments"],
+            "migrate_metrics": settings["migrate_metrics"],
+            "ignore_duplicate_flags": settings["ignore_duplicate_flags"],
+            "ignore_duplicate_segments": settings["ignore_duplicate_segments"],
+            "connection_pool_size": settings["connection_pool_size"],
+            "concurrency": settings["concurrency"],
+            "engine": settings["engine"],
+            "source_snapshot": settings["source_snapshot"],
+            "journal_path": settings["journal_path"],
+            "max_patch_size": settings["max_patch_size"],
+            "metrics_path": settings["metrics_path"],
+            "trace_path": settings["trace_path"],
+            "member_cache_path": settings["member_cache_path"],
+            "member_cache_ttl": settings["member_cache_ttl"],
+            "response_cache_path": settings["response_cache_path"],
+            "response_cache_size": settings["response_cache_size"],
+            "max_retries": settings["max_retries"],
+            "retry_budget": settings["retry_budget"],
+        }
+        options.update(kwargs)
+        project_key_source = options.pop(
+            "project_key_source", settings["source_project_key"]
+        )
+        return cls(
+            settings["source_api_token"],
+            project_key_source,
+            settings["target_api_token"],
+            **options,
+        )
+
     def migrate(self):
+        if self.engine == "async":
+            from LDMigrateAsync import LDMigrateAsync
+
+            return asyncio.run(LDMigrateAsync(self).migrate())
+
         dup_flags = []
         dup_segs = []
         ask_continue = False
@@ -109,21 +305,19 @@ class LDMigrate:
         #############################
         # Setting up data structures
         #############################
-        print("Getting source flag keys...", end="", flush=True)
-        self.flag_keys = self.get_source_flag_keys()
-        print("done. Got " + str(len(self.flag_keys)) + " flag keys.", end="\n\n")
-
-        print("Getting source environment keys...", end="", flush=True)
-        self.env_keys = self.get_source_environment_keys()
-        print("done. Got " + str(len(self.env_keys)) + " environment keys.", end="\n\n")
-
-        print("Getting source members...", end="", flush=True)
-        self.source_members = self.get_source_members()
-        print("done.", end="\n\n")
-
-        print("Getting target members...", end="", flush=True)
-        self.target_members = self.get_target_members()
-        print("done.", end="\n\n")
+        print("Getting source flag keys and environment keys...", flush=True)
+        setup = PhaseScheduler(self.tracer)
+        setup.add("source flag keys", self.load_source_flag_keys)
+        setup.add("source environment keys", self.load_source_environment_keys)
+        setup.run()
+        print(
+            "Got "
+            + str(len(self.flag_keys))
+            + " flag keys and "
+            + str(len(self.env_keys))
+            + " environment keys.",
+            end="\n\n",
+        )
 
         if self.migration_mode == MigrationMode.MERGE:
             if not self.ignore_duplicate_flags:
@@ -132,15 +326,7 @@ class LDMigrate:
                 self.target_flag_keys = self.get_target_flag_keys()
                 print("done. Got " + str(len(self.target_flag_keys)) + " flag keys.", end="\n\n")
                 dup_flags = set(self.flag_keys).intersection(self.target_flag_keys)
-                if len(dup_flags) > 0:
-                    print(
-                        "Warning: Found "
-                        + str(len(dup_flags))
-                        + " duplicate flags in target project."
-                    )
-                    for df in dup_flags:
-                        print("  - " + df)
-                    print("")
+                self.print_duplicates("flags", dup_flags)
 
             if not self.ignore_duplicate_segments:
                 ask_continue = True
@@ -157,93 +343,222 @@ class LDMigrate:
                 print("done. Got " + str(len(self.target_segment_keys)) + " segment keys.", end="\n\n")
 
                 dup_segs = set(self.segment_keys).intersection(self.target_segment_keys)
-                if len(dup_segs) > 0:
-                    print(
-                        "Warning: Found "
-                        + str(len(dup_segs))
-                        + " duplicate segments in target project."
-                    )
-                    for ds in dup_segs:
-                        print("  - " + ds)
-                    print("")
-            
-            if ask_continue:
-                if len(dup_flags) == 0 and len(dup_segs) == 0:
-                    print("No duplicate flags or segments found.\n\n")
+                self.print_duplicates("segments", dup_segs)
 
-                user_input = input("Do you want to continue? (y/n): ")
-                if user_input.lower() != "y":
-                    print("Exiting migration.")
-                    exit(0)
+            if ask_continue:
+                self.confirm_merge(dup_flags, dup_segs)
 
         ##########################
         # Starting migration
         ##########################
-        print("Creating target project...", flush=True)
-        self.create_target_project()
-        print("Done.", end="\n\n")
+        scheduler = PhaseScheduler(self.tracer)
+        self.add_migration_phases(scheduler, self)
+        self.open_journal()
+        try:
+            self.phase_timings = scheduler.run()
+        finally:
+            self.close_journal()
+            self.members.save()
+            self.write_metrics()
+            self.tracer.close()
+        scheduler.print_report()
+        self.metrics.print_report(scheduler.order)
+        if self.response_cache is not None:
+            self.response_cache.print_report()
+
+        return self.get_result()
+
+    ##################################################
+    # Journal of completed resources, replayed by MigrateRetry
+    ##################################################
+
+    def open_journal(self):
+        resume = self.migration_mode == MigrationMode.RETRY
+        num = self.journal.open(resume=resume)
+        if self.journal.path is None:
+            if resume:
+                print(
+                    "No JournalFile is set, so every resource is migrated again.",
+                    end="\n\n",
+                )
+        elif resume:
+            print(
+                "Resuming from "
+                + self.journal.path
+                + " with "
+                + str(num)
+                + " completed resources.",
+                end="\n\n",
+            )
+        elif self.journal.replaced > 0:
+            print(
+                "Starting a new journal in "
+                + self.journal.path
+                + ", replacing the "
+                + str(self.journal.replaced)
+                + " completed resources of an earlier run.",
+                end="\n\n",
+            )
+
+    def close_journal(self):
+        self.journal.close()
+        if self.journal.skipped > 0:
+            print(
+                "Skipped "
+                + str(self.journal.skipped)
+                + " resources completed by an earlier run.",
+                end="\n\n",
+            )
+
+    ##################################################
+    # Request metrics, written even when a phase fails
+    ##################################################
+
+    def write_metrics(self):
+        if self.metrics_path is None:
+            return
+        self.metrics.write_prometheus(self.metrics_path)
+        print("Wrote request metrics to " + self.metrics_path + ".", end="\n\n")
+
+    # A conflict means an earlier run created the resource but did not get
+    # to journal it
+    def is_applied(self, response):
+        return response.status_code < 400 or response.status_code == 409
+
+    ##################################################
+    # Patch a target resource in size-bounded chunks
+    ##################################################
+
+    # The chunks are applied in order and the first which fails is returned.
+    # Every op replaces or re-adds a value, so a failed patch can simply be
+    # sent again
+    def patch_target(self, path, payload):
+        response = None
+        for chunk in self.patch_chunker.chunk(payload):
+            response = self.http_target.patch(path, json=chunk)
+            if response.status_code != 200:
+                return response
+        return response
+
+    ##################################################
+    # Export the source project to an on-disk snapshot
+    ##################################################
+
+    def export_snapshot(self, path):
+        return SnapshotExporter(self).export(path)
+
+    ##################################################
+    # Estimate the API calls and wall time without migrating
+    ##################################################
+
+    def plan(self):
+        return MigrationPlanner(self).plan()
+
+    def get_result(self):
+        result = {
+            "total_context_kinds": self.total_context_kinds,
+            "total_payload_filters": self.total_payload_filters,
+            "total_environments": self.total_environments,
+            "total_metrics": self.total_metrics,
+            "total_metric_groups": self.total_metric_groups,
+            "total_segments": self.total_segments,
+            "total_flags": self.total_flags,
+            "total_target_rules": self.total_target_rules,
+            "total_unchanged": self.total_unchanged,
+            "phase_timings": self.phase_timings,
+            "phase_requests": self.metrics.get_phases(),
+        }
+        if self.response_cache is not None:
+            result["response_cache"] = self.response_cache.get_stats()
+        return result
+
+    ##################################################
+    # Load the data every phase relies on
+    ##################################################
+
+    def load_source_flag_keys(self):
+        self.flag_keys = self.get_source_flag_keys()
+
+    def load_source_environment_keys(self):
+        self.env_keys = self.get_source_environment_keys()
+
+    ##################################################
+    # Migration phases and their dependencies
+    ##################################################
+
+    # The engine is either this instance or the async engine, which both
+    # provide the same create_target_* phases
+    def add_migration_phases(self, scheduler, engine):
+        scheduler.add("project", engine.create_target_project)
 
         if self.migrate_flag_templates:
-            print("Updating flag templates...", flush=True)
-            self.create_target_flag_templates()
-            print("Done.", end="\n\n")
+            scheduler.add(
+                "flag templates", engine.create_target_flag_templates, ["project"]
+            )
         else:
             print("Skipping flag templates migration per app.ini.", end="\n\n")
 
         if self.migrate_context_kinds:
-            print("Creating context kinds...", flush=True)
-            self.create_target_context_kinds()
-            print("Done.", end="\n\n")
+            scheduler.add(
+                "context kinds", engine.create_target_context_kinds, ["project"]
+            )
         else:
             print("Skipping context kinds migration per app.ini.", end="\n\n")
 
         if self.migrate_payload_filters:
-            print("Creating payload filters...", flush=True)
-            self.create_target_payload_filters()
-            print("Done.", end="\n\n")
+            scheduler.add(
+                "payload filters", engine.create_target_payload_filters, ["project"]
+            )
         else:
             print("Skipping payload filters migration per app.ini.", end="\n\n")
 
-        print("Creating environments...", flush=True)
-        self.create_target_environments()
-        print("Done.", end="\n\n")
+        scheduler.add("environments", engine.create_target_environments, ["project"])
 
         if self.migrate_metrics:
-            print("Creating metrics...", flush=True)
-            self.create_target_metrics()
-            print("Done.", end="\n\n")
-
-            print("Creating metric groups...", flush=True)
-            self.create_target_metric_groups()
-            print("Done.", end="\n\n")
+            scheduler.add("metrics", engine.create_target_metrics, ["project"])
+            scheduler.add(
+                "metric groups", engine.create_target_metric_groups, ["metrics"]
+            )
         else:
             print("Skipping metrics migration per app.ini.", end="\n\n")
 
         if self.migrate_segments:
-            print("Creating segments...", flush=True)
-            self.create_target_segments()
-            print("Done.", end="\n\n")
+            scheduler.add("segments", engine.create_target_segments, ["environments"])
         else:
             print("Skipping segments migration per app.ini.", end="\n\n")
 
-        print("Creating flags...", flush=True)
-        self.create_target_flags()
-        print("Done.", end="\n\n")
+        scheduler.add(
+            "flags", engine.create_target_flags, ["environments", "segments"]
+        )
+        scheduler.add(
+            "targeting rules", engine.create_target_flag_environments, ["flags"]
+        )
 
-        print("Creating targeting rules...", flush=True)
-        self.create_target_flag_environments()
-        print("Done.", end="\n\n")
+    ##################################################
+    # Report duplicates found when merging
+    ##################################################
 
-        return {
-            "total_context_kinds": self.total_context_kinds,
-            "total_payload_filters": self.total_payload_filters,
-            "total_environments": self.total_environments,
-            "total_metrics": self.total_metrics,
-            "total_metric_groups": self.total_metric_groups,
-            "total_segments": self.total_segments,
-            "total_flags": self.total_flags,
-            "total_target_rules": self.total_target_rules,
-        }
+    def print_duplicates(self, kind, duplicates):
+        if len(duplicates) > 0:
+            print(
+                "Warning: Found "
+                + str(len(duplicates))
+                + " duplicate "
+                + kind
+                + " in target project."
+            )
+            for dup in duplicates:
+                print("  - " + dup)
+            print("")
+
+    def confirm_merge(self, dup_flags, dup_segs):
+        if len(dup_flags) == 0 and len(dup_segs) == 0:
+            print("No duplicate flags or segments found.\n\n")
+
+        user_input = input("Do you want to continue? (y/n): ")
+        if user_input.lower() != "y":
+            print("Exiting migration.")
+            exit(0)
 
     # This function checks to see if rate limiting headers are present
     # and will delay the request if the rate limit is reached
@@ -317,316 +632,206 @@ class LDMigrate:
     ##################################################
 
     def get_source_payload_filters(self):
-        payload_filters = []
         path = "/projects/" + self.project_key_source + "/payload-filters?limit=20"
-        keep_going = True
-        while keep_going:
-            response = self.http_source.get(path, beta=True)
-            data = json.loads(response.text)
-
-            # Append items to the payload_filters list
-            if "iems" in data:
-                for item in data["items"]:
-                    payload_filters.append(item)
-
-            # Check if there is a next page
-            if "_links" in data:
-                if "next" not in data["_links"]:
-                    keep_going = False
-                else:
-                    path = data["_links"]["next"]["href"].replace("/api/v2", "")
-            else:
-                keep_going = False
-
-        return payload_filters
+        return self.http_source.paginate(path, beta=True)
 
     ##################################################
     # Get source environments
     ##################################################
 
     def get_source_environments(self):
-        all_envs = []
-        path = "/projects/" + self.project_key_source + "/environments?limit=20"
-        keep_going = True
-        while keep_going:
-            response = self.http_source.get(path)
-            data = json.loads(response.text)
+        return self.snapshot.get("environments", self.list_source_environments)
 
-            for item in data["items"]:
-                all_envs.append(item)
-
-            if "next" not in data["_links"]:
-                keep_going = False
-            else:
-                path = data["_links"]["next"]["href"].replace("/api/v2", "")
-
-        return all_envs
+    def list_source_environments(self):
+        path = "/projects/" + self.project_key_source + "/environments?limit=20"
+        return list(self.http_source.paginate(path))
 
     ##################################################
     # Get source environment keys
     ##################################################
 
     def get_source_environment_keys(self):
-        env_keys = []
-        path = "/projects/" + self.project_key_source + "/environments?limit=20"
-        keep_going = True
-        while keep_going:
-            response = self.http_source.get(path)
-            data = json.loads(response.text)
-
-            for item in data["items"]:
-                env_keys.append(item["key"])
-
-            if "next" not in data["_links"]:
-                keep_going = False
-            else:
-                path = data["_links"]["next"]["href"].replace("/api/v2", "")
-
-        return env_keys
+        return [env["key"] for env in self.get_source_environments()]
 
     ##################################################
     # Get target environment keys
     ##################################################
 
+    # Listed once, before any environments are created in the target
     def get_target_environment_keys(self):
-        env_keys = []
-        path = "/projects/" + self.project_key_target + "/environments?limit=20"
-        keep_going = True
-        while keep_going:
-            response = self.http_target.get(path)
-            data = json.loads(response.text)
+        return list(self.get_target_environments().keys())
 
-            for item in data["items"]:
-                env_keys.append(item["key"])
-
-            if "next" not in data["_links"]:
-                keep_going = False
-            else:
-                path = data["_links"]["next"]["href"].replace("/api/v2", "")
+    def get_target_environments(self):
+        return self.snapshot.get(
+            "target environments", self.list_target_environments
+        )
 
-        return env_keys
+    def list_target_environments(self):
+        path = "/projects/" + self.project_key_target + "/environments?limit=20"
+        return {item["key"]: item for item in self.http_target.paginate(path)}
 
     ##################################################
     # Get source metrics
     ##################################################
 
     def get_source_metrics(self):
-        metrics = []
+        with ContextExecutor(max_workers=self.concurrency) as executor:
+            for page in self.list_source_metric_pages():
+                yield from executor.map(self.get_source_metric, page)
+
+    # Yields each page of the listing as soon as it arrives
+    def list_source_metric_pages(self):
         path = "/metrics/" + self.project_key_source + "?limit=20"
-        keep_going = True
-        total = 0
-        num = 0
-        while keep_going:
-            response = self.http_source.get(path)
-            data = json.loads(response.text)
-            total = data["totalCount"]
+        return self.http_source.paginate_pages(path)
 
-            for item in data["items"]:
-                num += 1
-                res = self.http_source.get(
-                    "/metrics/" + self.project_key_source + "/" + item["key"]
-                )
-                details = json.loads(res.text)
-                new_metric = {
-                    "key": details["key"],
-                    "name": details["name"],
-                    "description": details["description"],
-                    "kind": details["kind"],
-                    "isActive": details["isActive"],
-                    "isNumeric": details["isNumeric"],
-                    "tags": details["tags"],
-                    "randomizationUnits": details["randomizationUnits"],
-                    "unitAggregationType": details["unitAggregationType"],
-                    "analysisType": details["analysisType"],
-                    "eventDefault": details["eventDefault"],
-                }
-                if "selector" in details:
-                    new_metric["selector"] = details["selector"]
-                if "urls" in details:
-                    new_metric["urls"] = details["urls"]
-                if "percentileValue" in details:
-                    new_metric["percentileValue"] = details["percentileValue"]
-                if "unit" in details:
-                    new_metric["unit"] = details["unit"]
-                if "eventKey" in details:
-                    new_metric["eventKey"] = details["eventKey"]
-                if "successCriteria" in details:
-                    new_metric["successCriteria"] = details["successCriteria"]
-                metrics.append(new_metric)
-                if not self.ignore_pauses:
-                    time.sleep(0.5)
-
-            if "next" not in data["_links"]:
-                keep_going = False
-            else:
-                path = data["_links"]["next"]["href"].replace("/api/v2", "")
+    # Metrics are only fetched on their own when the listing leaves out
+    # fields the payload needs
+    def get_source_metric(self, item):
+        if self.has_metric_details(item):
+            return self.build_metric_payload(item)
+        response = self.http_source.get(
+            "/metrics/" + self.project_key_source + "/" + item["key"]
+        )
+        return self.build_metric_payload(json.loads(response.text))
+
+    # The optional fields the payload copies count too: without them the
+    # metric would be created without its unit or success criteria
+    def has_metric_details(self, item):
+        fields = list(self.metric_fields) + ["successCriteria"]
+        if item.get("isNumeric"):
+            fields.append("unit")
+        if item.get("analysisType") == "percentile":
+            fields.append("percentileValue")
+        if item["kind"] in ["pageview", "click"]:
+            fields.append("urls")
+        if item["kind"] == "click":
+            fields.append("selector")
+        if item["kind"] == "custom":
+            fields.append("eventKey")
+        return all(field in item for field in fields)
+
+    def build_metric_payload(self, details):
+        new_metric = {
+            "key": details["key"],
+            "name": details["name"],
+            "description": details["description"],
+            "kind": details["kind"],
+            "isActive": details["isActive"],
+            "isNumeric": details["isNumeric"],
+            "tags": details["tags"],
+            "randomizationUnits": details["randomizationUnits"],
+            "unitAggregationType": details["unitAggregationType"],
+            "analysisType": details["analysisType"],
+            "eventDefault": details["eventDefault"],
+        }
+        if "selector" in details:
+            new_metric["selector"] = details["selector"]
+        if "urls" in details:
+            new_metric["urls"] = details["urls"]
+        if "percentileValue" in details:
+            new_metric["percentileValue"] = details["percentileValue"]
+        if "unit" in details:
+            new_metric["unit"] = details["unit"]
+        if "eventKey" in details:
+            new_metric["eventKey"] = details["eventKey"]
+        if "successCriteria" in details:
+            new_metric["successCriteria"] = details["successCriteria"]
+        return new_metric
 
-        return metrics
 
     ##################################################
     # Get source metric groups
     ##################################################
 
     def get_source_metric_groups(self):
-        metric_groups = []
         path = "/projects/" + self.project_key_source + "/metric-groups?limit=20"
-        keep_going = True
-        total = 0
-        num = 0
-        while keep_going:
-            response = self.http_source.get(path)
-            data = json.loads(response.text)
-            total = data["totalCount"]
-
-            for item in data["items"]:
-                num += 1
-                metric_groups.append(item)
-                if not self.ignore_pauses:
-                    time.sleep(0.5)
-
-            if "next" not in data["_links"]:
-                keep_going = False
-            else:
-                path = data["_links"]["next"]["href"].replace("/api/v2", "")
-
-        return metric_groups
+        return self.http_source.paginate(path)
 
     ##################################################
     # Get source segment keys
     ##################################################
 
+    # The duplicate check holds on to the segments it lists, so the segments
+    # phase reuses them instead of listing them again
     def get_source_segment_keys(self):
-        pagination = 50
         source_segment_keys = []
-        num = 0
-        for env in self.env_keys:
-            path = "/segments/" + self.project_key_source + "/" + env + "?limit=" + str(pagination)
-            keep_going = True
-            while keep_going:
-                response = self.http_source.get(path)
-                data = json.loads(response.text)
-
-                for item in data["items"]:
-                    source_segment_keys.append(env + "|" +item["key"])
-                if "next" not in data["_links"]:
-                    keep_going = False
-                else:
-                    path = data["_links"]["next"]["href"].replace("/api/v2", "")
-                    num += pagination
-
+        for env in self.snapshot.get("segments", self.load_source_segments):
+            for item in env["segments"]:
+                source_segment_keys.append(env["environment"] + "|" + item["key"])
         return source_segment_keys
 
     ##################################################
     # Get source segments
     ##################################################
 
+    # Each environment's segments are streamed a page at a time
     def get_source_segments(self):
-        limit = 20
-        segments = []
-        total_segments = 0
+        return self.snapshot.iter("segments", self.list_source_segments)
+
+    def list_source_segments(self):
         for env in self.env_keys:
-            num = 0
-            path = (
-                "/segments/"
-                + self.project_key_source
-                + "/"
-                + env
-                + "?expand=flags&limit="
-                + str(limit)
-            )
-            keep_going = True
-            env_segments = []
-            while keep_going:
-                response = self.http_source.get(path)
-                data = json.loads(response.text)
-
-                if data["totalCount"] > 0:
-                    for item in data["items"]:
-                        num += 1
-                        env_segments.append(item)
-
-                # if "items" not in data:
-                #     keep_going = False
-                # else:
-                #     # Update the offset parameter to get the next page
-                #     current_offset = len(env_segments)
-                #     path = (
-                #         "/segments/" + self.project_key_source + "/" + env +
-                #         "?limit=" + str(limit) + "&offset=" + str(current_offset)
-                #     )
-                if "next" not in data["_links"]:
-                    keep_going = False
-                else:
-                    path = data["_links"]["next"]["href"].replace("/api/v2", "")
-            total_segments += num
-            if num > 0:
-                segments.append({"environment": env, "segments": env_segments})
-            if not self.ignore_pauses:
-                time.sleep(0.5)
+            yield {"environment": env, "segments": self.list_source_env_segments(env)}
 
-        return segments
+    def list_source_env_segments(self, env):
+        path = "/segments/" + self.project_key_source + "/" + env + "?expand=flags&limit=20"
+        return self.http_source.paginate(path)
+
+    # Every environment is listed at the same time
+    def load_source_segments(self):
+        def load_env(env):
+            return {"environment": env, "segments": list(self.list_source_env_segments(env))}
+
+        with ContextExecutor(max_workers=self.concurrency) as executor:
+            return list(executor.map(load_env, self.env_keys))
+
+    ##################################################
+    # Get source segment details
+    ##################################################
+
+    # The listing already holds every field the segment payloads use, so a
+    # segment is only fetched on its own when some are missing (e.g. big
+    # segments). Payload builders modify the rules, so they get a copy
+    def get_source_segment_details(self, env, segment):
+        if self.has_segment_details(segment):
+            return copy.deepcopy(segment)
+        response = self.http_source.get(
+            "/segments/" + self.project_key_source + "/" + env + "/" + segment["key"]
+        )
+        return json.loads(response.text)
+
+    def has_segment_details(self, segment):
+        return all(field in segment for field in self.segment_fields)
 
     ##################################################
     # Get source flags
     ##################################################
 
+    # The flags are listed once, for their keys, and the flags phase creates
+    # them from the same listing
     def get_source_flags(self):
-        pagination = 50
-        flags = []
-        num = 0
-        path = "/flags/" + self.project_key_source + "?limit=" + str(pagination)
-        ignore_flags = True if len(self.flags_to_ignore) > 0 else False
-        migrate_flags = True if len(self.flags_to_migrate) > 0 else False
-        keep_going = True
-        while keep_going:
-            response = self.http_source.get(path)
-            data = json.loads(response.text)
-
-            for item in data["items"]:
-                if ignore_flags and item["key"] in self.flags_to_ignore:
-                    continue
-                if migrate_flags and item["key"] not in self.flags_to_migrate:
-                    continue
-                flags.append(item)
-
-            if "next" not in data["_links"]:
-                keep_going = False
-            else:
-                path = data["_links"]["next"]["href"].replace("/api/v2", "")
-                num += pagination
-
-        return flags
+        return iter(self.snapshot.get("flags", self.list_source_flags))
+
+    def list_source_flags(self):
+        path = "/flags/" + self.project_key_source + "?limit=50"
+        return [
+            item
+            for item in self.http_source.paginate(path)
+            if self.is_flag_selected(item["key"])
+        ]
+
+    def is_flag_selected(self, flag_key):
+        if len(self.flags_to_ignore) > 0 and flag_key in self.flags_to_ignore:
+            return False
+        if len(self.flags_to_migrate) > 0 and flag_key not in self.flags_to_migrate:
+            return False
+        return True
 
     ##################################################
     # Get source flag keys
     ##################################################
 
     def get_source_flag_keys(self):
-        pagination = 50
-        flag_keys = []
-        num = 0
-        path = "/flags/" + self.project_key_source + "?limit=" + str(pagination)
-        ignore_flags = True if len(self.flags_to_ignore) > 0 else False
-        migrate_flags = True if len(self.flags_to_migrate) > 0 else False
-        keep_going = True
-        while keep_going:
-            response = self.http_source.get(path)
-            data = json.loads(response.text)
-
-            for item in data["items"]:
-                if ignore_flags and item["key"] in self.flags_to_ignore:
-                    continue
-                if migrate_flags and item["key"] not in self.flags_to_migrate:
-                    continue
-                flag_keys.append(item["key"])
-
-            if "next" not in data["_links"]:
-                keep_going = False
-            else:
-                path = data["_links"]["next"]["href"].replace("/api/v2", "")
-                num += pagination
-
-        return flag_keys
+        return [flag["key"] for flag in self.get_source_flags()]
 
     ##################################################
     # Get source flag details
@@ -655,53 +860,136 @@ class LDMigrate:
         return data
 
     ##################################################
-    # Get source members
+    # Get target members
     ##################################################
 
-    def get_source_members(self):
-        keep_going = True
-        source_members = {}
-        path = "/members"
-        while keep_going:
-            response = self.http_source.get(path)
-            data = json.loads(response.text)
-            for member in data["items"]:
-                source_members[member["_id"]] = member["email"]
+    # The target _id of a flag or metric maintainer, or None when the
+    # maintainer has no member in the target account
+    # Metrics and flags name their maintainer in _maintainer, metric groups
+    # in maintainer
+    def get_maintainer_id(self, item, field="_maintainer"):
+        if "email" not in (item.get(field) or {}):
+            return None
+        return self.members.resolve(
+            item[field]["email"],
+            self.find_target_member,
+            self.list_target_members,
+        )
 
-            if "next" not in data["_links"]:
-                keep_going = False
-            else:
-                path = data["_links"]["next"]["href"].replace("/api/v2", "")
+    def find_target_member(self, email):
+        response = self.http_target.get(
+            "/members", params={"filter": "query:" + email, "limit": 20}
+        )
+        for member in json.loads(response.text).get("items", []):
+            if member["email"].lower() == email.lower():
+                return member["_id"]
+        return None
+
+    # Every target member as {email: _id}
+    def get_target_members(self):
+        return self.members.get_all(self.list_target_members)
 
-        return source_members
+    def list_target_members(self):
+        target_members = {}
+        for member in self.http_target.paginate("/members"):
+            target_members[member["email"]] = member["_id"]
+        return target_members
 
     ##################################################
-    # Get target members
+    # Get target state to diff against when merging
     ##################################################
 
-    def get_target_members(self):
-        keep_going = True
-        target_members = {}
-        path = "/members"
-        while keep_going:
-            response = self.http_target.get(path)
-            data = json.loads(response.text)
-            for member in data["items"]:
-                target_members[member["email"]] = member["_id"]
-
-            if "next" not in data["_links"]:
-                keep_going = False
-            else:
-                path = data["_links"]["next"]["href"].replace("/api/v2", "")
+    def get_target_flags(self):
+        return self.snapshot.get("target flags", self.list_target_flags)
 
-        return target_members
+    # summary=0 includes the targeting of every environment
+    def list_target_flags(self):
+        path = "/flags/" + self.project_key_target + "?summary=0&limit=50"
+        return {item["key"]: item for item in self.http_target.paginate(path)}
+
+    def get_target_segments(self):
+        return self.snapshot.get("target segments", self.list_target_segments)
+
+    def list_target_segments(self):
+        segments = {}
+        envs = self.get_target_environment_keys()
+        for env, items in zip(envs, self.list_target_env_segments(envs)):
+            for item in items:
+                segments[env + "/" + item["key"]] = item
+        return segments
+
+    # Every environment is listed at the same time
+    def list_target_env_segments(self, envs):
+        def list_env(env):
+            path = "/segments/" + self.project_key_target + "/" + env + "?limit=50"
+            return list(self.http_target.paginate(path))
+
+        with ContextExecutor(max_workers=self.concurrency) as executor:
+            return list(executor.map(list_env, envs))
+
+    def get_target_metrics(self):
+        return self.snapshot.get("target metrics", self.list_target_metrics)
+
+    def list_target_metrics(self):
+        path = "/metrics/" + self.project_key_target + "?limit=20"
+        return {item["key"]: item for item in self.http_target.paginate(path)}
+
+    ##################################################
+    # Merge resources which already exist in the target
+    ##################################################
+
+    def is_merge(self):
+        return self.migration_mode == MigrationMode.MERGE
+
+    # Resources already in sync with the source cost no write at all
+    def count_unchanged(self):
+        with self.counter_lock:
+            self.total_unchanged += 1
+
+    def build_flag_merge_payload(self, flag):
+        payload = []
+        for field in [
+            "name",
+            "description",
+            "tags",
+            "temporary",
+            "clientSideAvailability",
+            "customProperties",
+        ]:
+            if field in flag:
+                payload.append(
+                    {"op": "replace", "path": "/" + field, "value": flag[field]}
+                )
+        payload.extend(self.build_flag_update_payload(flag))
+        return payload
+
+    def build_metric_merge_payload(self, metric):
+        payload = []
+        for field, value in metric.items():
+            if field in ["key", "maintainerId", "_maintainer"]:
+                continue
+            payload.append({"op": "replace", "path": "/" + field, "value": value})
+        return payload
 
     ##################################################
     # Create target project
     ##################################################
 
     def create_target_project(self):
+        if self.journal.skip("project", self.project_key_target):
+            print("...target project exists, resuming migration")
+            return
         project = self.get_source_project()
+        payload = self.build_project_payload(project)
+        response = self.http_target.post("/projects", json=payload)
+
+        data = json.loads(response.text)
+        self.check_target_project_response(data)
+        if self.is_applied(response):
+            self.journal.record("project", self.project_key_target)
+        return data
+
+    def build_project_payload(self, project):
         project_name = project["name"]
         if self.api_key_tgt == self.api_key_src:
             project_name = project_name + " (copy)"
@@ -720,10 +1008,9 @@ class LDMigrate:
             if "prefix" in project["namingConvention"]:
                 info_payload["prefix"] = project["namingConvention"]["prefix"]
             payload["namingConvention"] = info_payload
+        return payload
 
-        response = self.http_target.post("/projects", json=payload)
-
-        data = json.loads(response.text)
+    def check_target_project_response(self, data):
         if "code" in data:
             if data["code"] == "conflict":
                 match self.migration_mode:
@@ -736,57 +1023,25 @@ class LDMigrate:
                         print("...target project exists, starting merge")
         else:
             print("...created target project")
-        return data
 
     ##################################################
     # Get target flag keys
     ##################################################
 
     def get_target_flag_keys(self):
-        pagination = 50
-        target_flag_keys = []
-        num = 0
-        path = "/flags/" + self.project_key_target + "?limit=" + str(pagination)
-        keep_going = True
-        while keep_going:
-            response = self.http_target.get(path)
-            data = json.loads(response.text)
-
-            for item in data["items"]:
-                target_flag_keys.append(item["key"])
-
-            if "next" not in data["_links"]:
-                keep_going = False
-            else:
-                path = data["_links"]["next"]["href"].replace("/api/v2", "")
-                num += pagination
-
-        return target_flag_keys
+        path = "/flags/" + self.project_key_target + "?limit=50"
+        return [item["key"] for item in self.http_target.paginate(path)]
 
     ##################################################
     # Get target segment keys
     ##################################################
 
     def get_target_segment_keys(self):
-        pagination = 50
         target_segment_keys = []
-        num = 0
-        for env in self.target_env_keys:
-            path = "/segments/" + self.project_key_target + "/" + env + "?limit=" + str(pagination)
-            keep_going = True
-            while keep_going:
-                response = self.http_target.get(path)
-                data = json.loads(response.text)
-
-                for item in data["items"]:
-                    target_segment_keys.append(env + "|" +item["key"])
-
-                if "next" not in data["_links"]:
-                    keep_going = False
-                else:
-                    path = data["_links"]["next"]["href"].replace("/api/v2", "")
-                    num += pagination
-
+        envs = self.target_env_keys
+        for env, items in zip(envs, self.list_target_env_segments(envs)):
+            for item in items:
+                target_segment_keys.append(env + "|" + item["key"])
         return target_segment_keys
 
     ##################################################
@@ -799,42 +1054,10 @@ class LDMigrate:
         for template in flag_templates["items"]:
             if template["key"] in ["ai-prompt", "ai-model"]:
                 continue
+            if self.journal.skip("flag templates", template["key"]):
+                continue
 
-            if template["key"] in ["experiment", "migration"]:
-                payload = [
-                    {"op": "replace", "path": "/tags", "value": template["tags"]}
-                ]
-            else:
-                payload = [
-                    {
-                        "op": "replace",
-                        "path": "/temporary",
-                        "value": template["temporary"],
-                    },
-                    {
-                        "op": "replace",
-                        "path": "/defaultVariations/onVariation",
-                        "value": template["defaultVariations"]["onVariation"],
-                    },
-                    {
-                        "op": "replace",
-                        "path": "/defaultVariations/offVariation",
-                        "value": template["defaultVariations"]["offVariation"],
-                    },
-                    {"op": "replace", "path": "/tags", "value": template["tags"]},
-                ]
-                var_num = 0
-                for variation in template["variations"]:
-                    if "name" in variation:
-                        payload.append(
-                            {
-                                "op": "add",
-                                "path": "/variations/" + str(var_num) + "/name",
-                                "value": variation["name"],
-                            }
-                        )
-                    var_num += 1
-
+            payload = self.build_flag_template_payload(template)
             response = self.http_target.patch(
                 "/projects/"
                 + self.project_key_target
@@ -844,9 +1067,48 @@ class LDMigrate:
                 beta=True,
                 internal=True,
             )
+            if self.is_applied(response):
+                self.journal.record("flag templates", template["key"])
         print("...updated flag templates")
         return
 
+    def build_flag_template_payload(self, template):
+        if template["key"] in ["experiment", "migration"]:
+            payload = [
+                {"op": "replace", "path": "/tags", "value": template["tags"]}
+            ]
+        else:
+            payload = [
+                {
+                    "op": "replace",
+                    "path": "/temporary",
+                    "value": template["temporary"],
+                },
+                {
+                    "op": "replace",
+                    "path": "/defaultVariations/onVariation",
+                    "value": template["defaultVariations"]["onVariation"],
+                },
+                {
+                    "op": "replace",
+                    "path": "/defaultVariations/offVariation",
+                    "value": template["defaultVariations"]["offVariation"],
+                },
+                {"op": "replace", "path": "/tags", "value": template["tags"]},
+            ]
+            var_num = 0
+            for variation in template["variations"]:
+                if "name" in variation:
+                    payload.append(
+                        {
+                            "op": "add",
+                            "path": "/variations/" + str(var_num) + "/name",
+                            "value": variation["name"],
+                        }
+                    )
+                var_num += 1
+        return payload
+
     ##################################################
     # Create target context kinds
     ##################################################
@@ -856,14 +1118,10 @@ class LDMigrate:
         num_ctx = 0
 
         for kind in context_kinds["items"]:
-            payload = {
-                "name": kind["name"],
-                "description": kind["description"],
-            }
-            if "hideInTargeting" in kind:
-                payload["hideInTargeting"] = kind["hideInTargeting"]
-            if "archived" in kind:
-                payload["archived"] = kind["archived"]
+            num_ctx += 1
+            if self.journal.skip("context kinds", kind["key"]):
+                continue
+            payload = self.build_context_kind_payload(kind)
             response = self.http_target.put(
                 "/projects/"
                 + self.project_key_target
@@ -871,19 +1129,34 @@ class LDMigrate:
                 + kind["key"],
                 json=payload,
             )
-            num_ctx += 1
+            if self.is_applied(response):
+                self.journal.record("context kinds", kind["key"])
 
-        exp_settings = self.get_source_experiment_settings()
-        payload = {"randomizationUnits": exp_settings["randomizationUnits"]}
-        response = self.http_target.put(
-            "/projects/" + self.project_key_target + "/experimentation-settings",
-            json=payload,
-            beta=True,
-        )
+        if not self.journal.skip("experiment settings", self.project_key_target):
+            exp_settings = self.get_source_experiment_settings()
+            payload = {"randomizationUnits": exp_settings["randomizationUnits"]}
+            response = self.http_target.put(
+                "/projects/" + self.project_key_target + "/experimentation-settings",
+                json=payload,
+                beta=True,
+            )
+            if self.is_applied(response):
+                self.journal.record("experiment settings", self.project_key_target)
         self.total_context_kinds = num_ctx
         print("...created " + str(num_ctx) + " context kinds")
         return
 
+    def build_context_kind_payload(self, kind):
+        payload = {
+            "name": kind["name"],
+            "description": kind["description"],
+        }
+        if "hideInTargeting" in kind:
+            payload["hideInTargeting"] = kind["hideInTargeting"]
+        if "archived" in kind:
+            payload["archived"] = kind["archived"]
+        return payload
+
     ##################################################
     # Create target payload filters
     ##################################################
@@ -893,226 +1166,315 @@ class LDMigrate:
         payload_filters = self.get_source_payload_filters()
 
         for filter in payload_filters:
-            payload = {
-                "name": filter["name"],
-                "key": filter["key"],
-                "enabled": filter["enabled"],
-                "rules": filter["rules"],
-            }
-            if "archived" in filter:
-                payload["archived"] = filter["archived"]
-            if "description" in filter:
-                payload["description"] = filter["description"]
-
+            num_filters += 1
+            if self.journal.skip("payload filters", filter["key"]):
+                continue
+            payload = self.build_payload_filter_payload(filter)
             response = self.http_target.post(
                 "/projects/" + self.project_key_target + "/payload-filters",
                 json=payload,
                 beta=True,
             )
-            num_filters += 1
+            if self.is_applied(response):
+                self.journal.record("payload filters", filter["key"])
         self.total_payload_filters = num_filters
         print("...created " + str(num_filters) + " payload filters")
         return
 
+    def build_payload_filter_payload(self, filter):
+        payload = {
+            "name": filter["name"],
+            "key": filter["key"],
+            "enabled": filter["enabled"],
+            "rules": filter["rules"],
+        }
+        if "archived" in filter:
+            payload["archived"] = filter["archived"]
+        if "description" in filter:
+            payload["description"] = filter["description"]
+        return payload
+
     ##################################################
     # Create target environments
     ##################################################
 
+    # Environments are created on the worker pool. Approval settings cannot
+    # be sent with a new environment, so they follow in a patch, and only
+    # where they differ from the defaults the environment was created with
     def create_target_environments(self):
         num = 0
         environments = self.get_source_environments()
-        existing_keys = self.get_target_environment_keys()
+        existing = self.get_target_environments()
         total_envs = len(environments)
 
-        for env in environments:
-            num += 1
-            if env["key"] in existing_keys:
-                payload = [
-                    {"op": "replace", "path": "/name", "value": env["name"]},
-                    {"op": "replace", "path": "/color", "value": env["color"]},
-                    {
-                        "op": "replace",
-                        "path": "/defaultTtl",
-                        "value": env["defaultTtl"],
-                    },
-                    {"op": "replace", "path": "/tags", "value": env["tags"]},
-                    {
-                        "op": "replace",
-                        "path": "/secureMode",
-                        "value": env["secureMode"],
-                    },
-                    {
-                        "op": "replace",
-                        "path": "/defaultTrackEvents",
-                        "value": env["defaultTrackEvents"],
-                    },
-                    {
-                        "op": "replace",
-                        "path": "/confirmChanges",
-                        "value": env["confirmChanges"],
-                    },
-                    {
-                        "op": "replace",
-                        "path": "/requireComments",
-                        "value": env["requireComments"],
-                    },
-                    {"op": "replace", "path": "/critical", "value": env["critical"]},
-                ]
-
-                response = self.http_target.patch(
-                    "/projects/"
-                    + self.project_key_target
-                    + "/environments/"
-                    + env["key"],
-                    json=payload,
+        with ContextExecutor(max_workers=self.concurrency) as executor:
+            futures = []
+            for env in environments:
+                futures.append(
+                    executor.submit(self.create_target_environment, env, existing)
                 )
-            else:
-                payload = {
-                    "name": env["name"],
-                    "key": env["key"],
-                    "color": env["color"],
-                    "defaultTtl": env["defaultTtl"],
-                    "tags": env["tags"],
-                    "secureMode": env["secureMode"],
-                    "defaultTrackEvents": env["defaultTrackEvents"],
-                    "confirmChanges": env["confirmChanges"],
-                    "requireComments": env["requireComments"],
-                    "critical": env["critical"],
-                }
+            for future in futures:
+                future.result()
+                num += 1
+                if num % 10 == 0:
+                    print(
+                        "...reached "
+                        + str(num)
+                        + " of "
+                        + str(total_envs)
+                        + " environments."
+                    )
+        print("...created " + str(num) + " environments")
+        self.total_environments = num
 
+    def create_target_environment(self, env, existing):
+        if self.journal.skip("environments", env["key"]):
+            return
+        with self.tracer.span(env["key"], "environment") as span:
+            approvals = self.build_environment_approvals_payload(env)
+            if env["key"] in existing:
+                payload = self.build_environment_patch_payload(env)
+                if self.is_merge():
+                    target_env = existing[env["key"]]
+                    payload = self.patch_diff.diff(target_env, payload)
+                    approvals = self.patch_diff.diff(target_env, approvals)
+                # An existing environment takes its approvals in the same patch
+                payload = payload + approvals
+                if len(payload) == 0:
+                    self.count_unchanged()
+                    self.journal.record("environments", env["key"])
+                    span.set("status", "unchanged")
+                    return
+                response = self.patch_target_environment(env["key"], payload)
+            else:
                 response = self.http_target.post(
                     "/projects/" + self.project_key_target + "/environments",
-                    json=payload,
-                )
-
-            approvals = [
-                {
-                    "op": "replace",
-                    "path": "/approvalSettings/required",
-                    "value": env["approvalSettings"]["required"],
-                },
-                {
-                    "op": "replace",
-                    "path": "/approvalSettings/bypassApprovalsForPendingChanges",
-                    "value": env["approvalSettings"][
-                        "bypassApprovalsForPendingChanges"
-                    ],
-                },
-                {
-                    "op": "replace",
-                    "path": "/approvalSettings/minNumApprovals",
-                    "value": env["approvalSettings"]["minNumApprovals"],
-                },
-                {
-                    "op": "replace",
-                    "path": "/approvalSettings/canReviewOwnRequest",
-                    "value": env["approvalSettings"]["canReviewOwnRequest"],
-                },
-                {
-                    "op": "replace",
-                    "path": "/approvalSettings/canApplyDeclinedChanges",
-                    "value": env["approvalSettings"]["canApplyDeclinedChanges"],
-                },
-                {
-                    "op": "replace",
-                    "path": "/approvalSettings/requiredApprovalTags",
-                    "value": env["approvalSettings"]["requiredApprovalTags"],
-                },
-                {
-                    "op": "replace",
-                    "path": "/resourceApprovalSettings/segment/required",
-                    "value": env["resourceApprovalSettings"]["segment"]["required"],
-                },
-                {
-                    "op": "replace",
-                    "path": "/resourceApprovalSettings/segment/bypassApprovalsForPendingChanges",
-                    "value": env["resourceApprovalSettings"]["segment"][
-                        "bypassApprovalsForPendingChanges"
-                    ],
-                },
-                {
-                    "op": "replace",
-                    "path": "/resourceApprovalSettings/segment/minNumApprovals",
-                    "value": env["resourceApprovalSettings"]["segment"][
-                        "minNumApprovals"
-                    ],
-                },
-                {
-                    "op": "replace",
-                    "path": "/resourceApprovalSettings/segment/canReviewOwnRequest",
-                    "value": env["resourceApprovalSettings"]["segment"][
-                        "canReviewOwnRequest"
-                    ],
-                },
-                {
-                    "op": "replace",
-                    "path": "/resourceApprovalSettings/segment/canApplyDeclinedChanges",
-                    "value": env["resourceApprovalSettings"]["segment"][
-                        "canApplyDeclinedChanges"
-                    ],
-                },
-                {
-                    "op": "replace",
-                    "path": "/resourceApprovalSettings/segment/requiredApprovalTags",
-                    "value": env["resourceApprovalSettings"]["segment"][
-                        "requiredApprovalTags"
-                    ],
-                },
-            ]
-
-            status_code = 0
-            while status_code != 200:
-                response = self.http_target.patch(
-                    "/projects/"
-                    + self.project_key_target
-                    + "/environments/"
-                    + env["key"],
-                    json=approvals,
+                    json=self.build_environment_post_payload(env),
                 )
-                if response.status_code != 200:
-                    if not self.ignore_pauses:
-                        time.sleep(0.5)
-                status_code = response.status_code
-
-            if num % 10 == 0:
-                if not self.ignore_pauses:
-                    time.sleep(5)
-                print(
-                    "...reached "
-                    + str(num)
-                    + " of "
-                    + str(total_envs)
-                    + " environments."
-                )
-        print("...created " + str(num) + " environments")
-        self.total_environments = num
+                if self.is_applied(response):
+                    approvals = self.build_new_environment_approvals_payload(
+                        approvals, response
+                    )
+                    if len(approvals) > 0:
+                        response = self.patch_target_environment(env["key"], approvals)
+            span.set("status", response.status_code)
+            if self.is_applied(response):
+                self.journal.record("environments", env["key"])
+            else:
+                print("...error creating environment " + env["key"])
+
+    # A new environment can refuse patches while it is being set up, so a
+    # failed patch is resent a few times with backoff. Every op replaces a
+    # value, so resending is safe
+    def patch_target_environment(self, env_key, payload):
+        path = "/projects/" + self.project_key_target + "/environments/" + env_key
+        attempt = 1
+        while True:
+            response = self.http_target.patch(path, json=payload)
+            if (
+                response.status_code == 200
+                or attempt >= self.environment_patch_attempts
+            ):
+                return response
+            delay = self.retry_policy.backoff(attempt, response.headers)
+            self.metrics.record_pause(delay)
+            time.sleep(delay)
+            self.tracer.record("pause", "wait", delay)
+            attempt += 1
+
+    def build_environment_patch_payload(self, env):
+        payload = [
+            {"op": "replace", "path": "/name", "value": env["name"]},
+            {"op": "replace", "path": "/color", "value": env["color"]},
+            {
+                "op": "replace",
+                "path": "/defaultTtl",
+                "value": env["defaultTtl"],
+            },
+            {"op": "replace", "path": "/tags", "value": env["tags"]},
+            {
+                "op": "replace",
+                "path": "/secureMode",
+                "value": env["secureMode"],
+            },
+            {
+                "op": "replace",
+                "path": "/defaultTrackEvents",
+                "value": env["defaultTrackEvents"],
+            },
+            {
+                "op": "replace",
+                "path": "/confirmChanges",
+                "value": env["confirmChanges"],
+            },
+            {
+                "op": "replace",
+                "path": "/requireComments",
+                "value": env["requireComments"],
+            },
+            {"op": "replace", "path": "/critical", "value": env["critical"]},
+        ]
+        return payload
+
+    def build_environment_post_payload(self, env):
+        payload = {
+            "name": env["name"],
+            "key": env["key"],
+            "color": env["color"],
+            "defaultTtl": env["defaultTtl"],
+            "tags": env["tags"],
+            "secureMode": env["secureMode"],
+            "defaultTrackEvents": env["defaultTrackEvents"],
+            "confirmChanges": env["confirmChanges"],
+            "requireComments": env["requireComments"],
+            "critical": env["critical"],
+        }
+        return payload
+
+    # The created environment is returned, so only the approvals which
+    # differ from its defaults are patched
+    def build_new_environment_approvals_payload(self, approvals, response):
+        if response.status_code not in [200, 201]:
+            return approvals
+        return self.patch_diff.diff(json.loads(response.text), approvals)
+
+    def build_environment_approvals_payload(self, env):
+        payload = [
+            {
+                "op": "replace",
+                "path": "/approvalSettings/required",
+                "value": env["approvalSettings"]["required"],
+            },
+            {
+                "op": "replace",
+                "path": "/approvalSettings/bypassApprovalsForPendingChanges",
+                "value": env["approvalSettings"][
+                    "bypassApprovalsForPendingChanges"
+                ],
+            },
+            {
+                "op": "replace",
+                "path": "/approvalSettings/minNumApprovals",
+                "value": env["approvalSettings"]["minNumApprovals"],
+            },
+            {
+                "op": "replace",
+                "path": "/approvalSettings/canReviewOwnRequest",
+                "value": env["approvalSettings"]["canReviewOwnRequest"],
+            },
+            {
+                "op": "replace",
+                "path": "/approvalSettings/canApplyDeclinedChanges",
+                "value": env["approvalSettings"]["canApplyDeclinedChanges"],
+            },
+            {
+                "op": "replace",
+                "path": "/approvalSettings/requiredApprovalTags",
+                "value": env["approvalSettings"]["requiredApprovalTags"],
+            },
+            {
+                "op": "replace",
+                "path": "/resourceApprovalSettings/segment/required",
+                "value": env["resourceApprovalSettings"]["segment"]["required"],
+            },
+            {
+                "op": "replace",
+                "path": "/resourceApprovalSettings/segment/bypassApprovalsForPendingChanges",
+                "value": env["resourceApprovalSettings"]["segment"][
+                    "bypassApprovalsForPendingChanges"
+                ],
+            },
+            {
+                "op": "replace",
+                "path": "/resourceApprovalSettings/segment/minNumApprovals",
+                "value": env["resourceApprovalSettings"]["segment"][
+                    "minNumApprovals"
+                ],
+            },
+            {
+                "op": "replace",
+                "path": "/resourceApprovalSettings/segment/canReviewOwnRequest",
+                "value": env["resourceApprovalSettings"]["segment"][
+                    "canReviewOwnRequest"
+                ],
+            },
+            {
+                "op": "replace",
+                "path": "/resourceApprovalSettings/segment/canApplyDeclinedChanges",
+                "value": env["resourceApprovalSettings"]["segment"][
+                    "canApplyDeclinedChanges"
+                ],
+            },
+            {
+                "op": "replace",
+                "path": "/resourceApprovalSettings/segment/requiredApprovalTags",
+                "value": env["resourceApprovalSettings"]["segment"][
+                    "requiredApprovalTags"
+                ],
+            },
+        ]
+        return payload
 
     ##################################################
     # Create target metrics
     ##################################################
 
+    # Metrics are created as each page of the listing arrives, with the
+    # detail fetches and creates for a page running on the worker pool
     def create_target_metrics(self):
         num_metrics = 0
-        metrics = self.get_source_metrics()
-        for metric in metrics:
-            new_metric = metric.copy()
-            if "_maintainer" in new_metric:
-                del new_metric["_maintainer"]
-            if "_maintainer" in metric:
-                new_metric["maintainerId"] = self.target_members[
-                    metric["_maintainer"]["email"]
-                ]
-            response = self.http_target.post(
-                "/metrics/" + self.project_key_target,
-                json=metric,
-            )
-            if not self.ignore_pauses:
-                time.sleep(0.5)
-            num_metrics += 1
+        if self.is_merge():
+            self.get_target_metrics()
+        with ContextExecutor(max_workers=self.concurrency) as executor:
+            futures = []
+            for page in self.list_source_metric_pages():
+                for item in page:
+                    futures.append(executor.submit(self.create_target_metric, item))
+            for future in futures:
+                future.result()
+                num_metrics += 1
         print("...created " + str(num_metrics) + " metrics")
         self.total_metrics = num_metrics
         return
 
+    # The source maintainer is replaced by the target member with the same
+    # email, or left to the API's default when there is none
+    def build_metric_post_payload(self, metric, maintainer_id):
+        payload = metric.copy()
+        if maintainer_id is not None:
+            payload["maintainerId"] = maintainer_id
+        return payload
+
+    def create_target_metric(self, item):
+        if self.journal.skip("metrics", item["key"]):
+            return
+        with self.tracer.span(item["key"], "metric") as span:
+            metric = self.get_source_metric(item)
+            if self.is_merge() and metric["key"] in self.get_target_metrics():
+                payload = self.patch_diff.diff(
+                    self.get_target_metrics()[metric["key"]],
+                    self.build_metric_merge_payload(metric),
+                )
+                if len(payload) == 0:
+                    self.count_unchanged()
+                    self.journal.record("metrics", metric["key"])
+                    span.set("status", "unchanged")
+                    return
+                response = self.http_target.patch(
+                    "/metrics/" + self.project_key_target + "/" + metric["key"],
+                    json=payload,
+                )
+            else:
+                response = self.http_target.post(
+                    "/metrics/" + self.project_key_target,
+                    json=self.build_metric_post_payload(
+                        metric, self.get_maintainer_id(item)
+                    ),
+                )
+            span.set("status", response.status_code)
+            if self.is_applied(response):
+                self.journal.record("metrics", metric["key"])
+
     ##################################################
     # Create target metric groups
     ##################################################
@@ -1121,165 +1483,269 @@ class LDMigrate:
         num_groups = 0
         metric_groups = self.get_source_metric_groups()
         for metric_group in metric_groups:
-            metrics = []
-            for metric in metric_group["metrics"]:
-                metrics.append(
-                    {
-                        "key": metric["key"],
-                        "nameInGroup": metric["nameInGroup"],
-                    }
-                )
-            new_group = {
-                "key": metric_group["key"],
-                "name": metric_group["name"],
-                "kind": metric_group["kind"],
-                "description": metric_group["description"],
-                "maintainerId": metric_group["maintainer"]["key"],
-                "tags": metric_group["tags"],
-                "metrics": metrics,
-            }
+            num_groups += 1
+            if self.journal.skip("metric groups", metric_group["key"]):
+                continue
             response = self.http_target.post(
                 "/projects/" + self.project_key_target + "/metric-groups",
-                json=metric_group,
+                json=self.build_metric_group_payload(
+                    metric_group, self.get_maintainer_id(metric_group, "maintainer")
+                ),
                 beta=True,
             )
-            num_groups += 1
-            if not self.ignore_pauses:
-                time.sleep(0.5)
+            if self.is_applied(response):
+                self.journal.record("metric groups", metric_group["key"])
         print("...created " + str(num_groups) + " metric groups")
         self.total_metric_groups = num_groups
         return
 
+    # Only the fields a new group takes, with the maintainer found as for
+    # metrics
+    def build_metric_group_payload(self, metric_group, maintainer_id):
+        metrics = []
+        for metric in metric_group["metrics"]:
+            metrics.append(
+                {
+                    "key": metric["key"],
+                    "nameInGroup": metric["nameInGroup"],
+                }
+            )
+        payload = {
+            "key": metric_group["key"],
+            "name": metric_group["name"],
+            "kind": metric_group["kind"],
+            "description": metric_group["description"],
+            "tags": metric_group["tags"],
+            "metrics": metrics,
+        }
+        if maintainer_id is not None:
+            payload["maintainerId"] = maintainer_id
+        return payload
+
     ##################################################
     # Create target segments
     ##################################################
 
+    # Each environment's segments are created level by level in the order
+    # of SegmentGraph, with a level at a time on the worker pool. A segment
+    # is then created with its rules in one pass, as the segments they match
+    # already exist. Segments in or behind a reference cycle cannot be
+    # ordered, so they are reported and get their rules once all exist
     def create_target_segments(self):
-        segments = self.get_source_segments()
         total_segments = 0
-        for env in segments:
-            add_last = []
-            for segment in env["segments"]:
-                response = self.http_source.get(
-                    "/segments/"
-                    + self.project_key_source
-                    + "/"
-                    + env["environment"]
-                    + "/"
-                    + segment["key"]
-                )
-                segment_data = json.loads(response.text)
-                payload = {
-                    "key": segment_data["key"],
-                    "name": segment_data["name"],
-                    "tags": segment_data["tags"],
-                    "unbounded": False,
-                }
-                response = self.http_target.post(
-                    "/segments/" + self.project_key_target + "/" + env["environment"],
-                    json=payload,
-                )
-                payload = []
-                if "description" in segment_data:
-                    payload.append(
-                        {
-                            "op": "add",
-                            "path": "/description",
-                            "value": segment_data["description"],
-                        }
-                    )
-                payload.append(
-                    {
-                        "op": "replace",
-                        "path": "/included",
-                        "value": segment_data["included"],
-                    }
-                )
-                payload.append(
-                    {
-                        "op": "replace",
-                        "path": "/excluded",
-                        "value": segment_data["excluded"],
-                    }
-                )
-                payload.append(
-                    {
-                        "op": "replace",
-                        "path": "/includedContexts",
-                        "value": segment_data["includedContexts"],
-                    }
-                )
-                payload.append(
-                    {
-                        "op": "replace",
-                        "path": "/excludedContexts",
-                        "value": segment_data["excludedContexts"],
-                    }
-                )
-                rules = []
-                for_later = False
-                for rule in segment_data["rules"]:
-                    del rule["_id"]
-                    clauses = []
-                    for clause in rule["clauses"]:
-                        del clause["_id"]
-                        if clause["attribute"] == "segmentMatch":
-                            for_later = True
-                        clauses.append(clause)
-                    rule["clauses"] = clauses
-                    rules.append(rule)
-                if for_later:
-                    add_last.append(
-                        {
-                            "path": env["environment"] + "/" + segment["key"],
-                            "payload": {
-                                "op": "replace",
-                                "path": "/rules",
-                                "value": rules,
-                            },
-                        }
-                    )
-                else:
-                    payload.append(
-                        {
-                            "op": "replace",
-                            "path": "/rules",
-                            "value": rules,
-                        }
-                    )
-                response = self.http_target.patch(
-                    "/segments/"
-                    + self.project_key_target
-                    + "/"
-                    + env["environment"]
-                    + "/"
-                    + segment["key"],
-                    json=payload,
-                )
-                if response.status_code != 200:
-                    print(
-                        "...error updating segment: "
-                        + env["environment"]
-                        + "/"
-                        + segment["key"]
+        with ContextExecutor(max_workers=self.concurrency) as executor:
+            for env in self.get_source_segments():
+                environment = env["environment"]
+                segments = []
+                for segment in env["segments"]:
+                    total_segments += 1
+                    if not self.journal.skip(
+                        "segments", environment + "/" + segment["key"]
+                    ):
+                        segments.append(segment)
+
+                # The details hold the rules the graph is built from
+                futures = [
+                    executor.submit(
+                        self.get_source_segment_details, environment, segment
                     )
+                    for segment in segments
+                ]
+                details = {}
+                for future in futures:
+                    segment_data = future.result()
+                    details[segment_data["key"]] = segment_data
+                graph = SegmentGraph(details.values())
+                self.print_segment_cycles(environment, graph)
+
+                for level in graph.levels:
+                    futures = [
+                        executor.submit(
+                            self.create_target_segment, environment, details[key], True
+                        )
+                        for key in level
+                    ]
+                    for future in futures:
+                        future.result()
 
-                total_segments += 1
+                futures = [
+                    executor.submit(
+                        self.create_target_segment, environment, details[key], False
+                    )
+                    for key in graph.unordered
+                ]
+                deferred = []
+                for key, future in zip(graph.unordered, futures):
+                    rules_payload = future.result()
+                    if rules_payload is not None:
+                        deferred.append((environment + "/" + key, rules_payload))
+                futures = [
+                    executor.submit(self.patch_target_segment_rules, path, rules_payload)
+                    for path, rules_payload in deferred
+                ]
+                for future in futures:
+                    future.result()
 
-                if total_segments % 10 == 0:
-                    print("...reached " + str(total_segments) + " segments.")
-                    if not self.ignore_pauses:
-                        time.sleep(2.5)
-            for item in add_last:
-                response = self.http_target.patch(
-                    "/segments/" + self.project_key_target + item["path"],
-                    json=item["payload"],
-                )
+                print("...reached " + str(total_segments) + " segments.")
 
         print("...created " + str(total_segments) + " segments")
         self.total_segments = total_segments
         return
 
+    def print_segment_cycles(self, environment, graph):
+        for cycle in graph.cycles:
+            print(
+                "...segments in "
+                + environment
+                + " reference each other in a cycle: "
+                + ", ".join(cycle)
+            )
+        if len(graph.unordered) > 0:
+            print(
+                "..."
+                + str(len(graph.unordered))
+                + " segments in "
+                + environment
+                + " cannot be ordered, so their rules are patched last"
+            )
+
+    # Ordered segments are patched with their rules. Otherwise the rules
+    # which match other segments are returned to be patched later
+    def create_target_segment(self, environment, segment_data, ordered):
+        segment_path = environment + "/" + segment_data["key"]
+        with self.tracer.span(segment_path, "segment") as span:
+            target_segment = None
+            if self.is_merge():
+                target_segment = self.get_target_segments().get(segment_path)
+            if target_segment is None:
+                payload = self.build_segment_post_payload(segment_data)
+                response = self.http_target.post(
+                    "/segments/" + self.project_key_target + "/" + environment,
+                    json=payload,
+                )
+            payload, rules_payload = self.build_segment_patch_payload(segment_data)
+            if target_segment is not None:
+                payload, rules_payload = self.build_segment_merge_payload(
+                    target_segment, segment_data, payload, rules_payload
+                )
+            if ordered and rules_payload is not None:
+                payload = payload + rules_payload
+                rules_payload = None
+            if len(payload) > 0:
+                response = self.patch_target(
+                    "/segments/" + self.project_key_target + "/" + segment_path,
+                    payload,
+                )
+                span.set("status", response.status_code)
+                if response.status_code != 200:
+                    print("...error updating segment: " + segment_path)
+                    return None
+            if rules_payload is None:
+                self.journal.record("segments", segment_path)
+            return rules_payload
+
+    def patch_target_segment_rules(self, segment_path, rules_payload):
+        with self.tracer.span(segment_path, "segment rules") as span:
+            response = self.patch_target(
+                "/segments/" + self.project_key_target + "/" + segment_path,
+                rules_payload,
+            )
+            span.set("status", response.status_code)
+            if response.status_code == 200:
+                self.journal.record("segments", segment_path)
+
+    # The POST is skipped for segments the target already has, so their name
+    # and tags are diffed along with the rest of the segment
+    def build_segment_merge_payload(
+        self, target_segment, segment_data, payload, rules_payload
+    ):
+        payload = [
+            {"op": "replace", "path": "/name", "value": segment_data["name"]},
+            {"op": "replace", "path": "/tags", "value": segment_data["tags"]},
+        ] + payload
+        payload = self.patch_diff.diff(target_segment, payload)
+        if rules_payload is not None:
+            rules_payload = self.patch_diff.diff(target_segment, rules_payload)
+            if len(rules_payload) == 0:
+                rules_payload = None
+        if len(payload) == 0 and rules_payload is None:
+            self.count_unchanged()
+        return payload, rules_payload
+
+    def build_segment_post_payload(self, segment_data):
+        payload = {
+            "key": segment_data["key"],
+            "name": segment_data["name"],
+            "tags": segment_data["tags"],
+            "unbounded": False,
+        }
+        return payload
+
+    # Rules that match other segments are returned separately, so segments
+    # which cannot be ordered get them once every segment in the environment
+    # exists
+    def build_segment_patch_payload(self, segment_data):
+        payload = []
+        if "description" in segment_data:
+            payload.append(
+                {
+                    "op": "add",
+                    "path": "/description",
+                    "value": segment_data["description"],
+                }
+            )
+        payload.append(
+            {
+                "op": "replace",
+                "path": "/included",
+                "value": segment_data["included"],
+            }
+        )
+        payload.append(
+            {
+                "op": "replace",
+                "path": "/excluded",
+                "value": segment_data["excluded"],
+            }
+        )
+        payload.append(
+            {
+                "op": "replace",
+                "path": "/includedContexts",
+                "value": segment_data["includedContexts"],
+            }
+        )
+        payload.append(
+            {
+                "op": "replace",
+                "path": "/excludedContexts",
+                "value": segment_data["excludedContexts"],
+            }
+        )
+        rules = []
+        for_later = False
+        for rule in segment_data["rules"]:
+            del rule["_id"]
+            clauses = []
+            for clause in rule["clauses"]:
+                del clause["_id"]
+                if clause["attribute"] == "segmentMatch":
+                    for_later = True
+                clauses.append(clause)
+            rule["clauses"] = clauses
+            rules.append(rule)
+        rules_payload = [
+            {
+                "op": "replace",
+                "path": "/rules",
+                "value": rules,
+            }
+        ]
+        if for_later:
+            return payload, rules_payload
+        payload.extend(rules_payload)
+        return payload, None
+
     ##################################################
     # Create target flags
     ##################################################
@@ -1290,60 +1756,35 @@ class LDMigrate:
         num = 0
         for flag in flags:
             num += 1
-            payload = {
-                "key": flag["key"],
-                "name": flag["name"],
-                "kind": flag["kind"],
-                "clientSideAvailability": flag["clientSideAvailability"],
-                "variations": flag["variations"],
-                "temporary": flag["temporary"],
-                "tags": flag["tags"],
-            }
-            if "defaults" in flag:
-                payload["defaults"] = flag["defaults"]
-            if "description" in flag:
-                payload["description"] = flag["description"]
-            if "customProperties" in flag:
-                payload["customProperties"] = flag["customProperties"]
-            if "_purpose" in flag:
-                payload["purpose"] = flag["_purpose"]
-            if "_maintainer" in flag:
-                if flag["_maintainer"]["email"] in self.target_members:
-                    payload["maintainerId"] = self.target_members[
-                        flag["_maintainer"]["email"]
-                    ]
-
-            response = self.http_target.post(
-                "/flags/" + self.project_key_target,
-                json=payload,
-            )
-
-            update_payload = []
-            if "archived" in flag:
-                update_payload.append(
-                    {"op": "replace", "path": "/archived", "value": flag["archived"]}
-                )
-            if "deprecated" in flag:
-                update_payload.append(
-                    {
-                        "op": "replace",
-                        "path": "/deprecated",
-                        "value": flag["deprecated"],
-                    }
-                )
-            if "migrationSettings" in flag:
-                update_payload.append(
-                    {
-                        "op": "replace",
-                        "path": "/migrationSettings",
-                        "value": flag["migrationSettings"],
-                    }
-                )
+            if self.journal.skip("flags", flag["key"]):
+                continue
+            with self.tracer.span(flag["key"], "flag") as span:
+                if self.is_merge() and flag["key"] in self.get_target_flags():
+                    update_payload = self.patch_diff.diff(
+                        self.get_target_flags()[flag["key"]],
+                        self.build_flag_merge_payload(flag),
+                    )
+                    if len(update_payload) == 0:
+                        self.count_unchanged()
+                        self.journal.record("flags", flag["key"])
+                        span.set("status", "unchanged")
+                        continue
+                else:
+                    payload = self.build_flag_payload(flag)
+                    response = self.http_target.post(
+                        "/flags/" + self.project_key_target,
+                        json=payload,
+                    )
+                    update_payload = self.build_flag_update_payload(flag)
 
-            response = self.http_target.patch(
-                "/flags/" + self.project_key_target + "/" + flag["key"],
-                json=payload,
-            )
+                if len(update_payload) > 0:
+                    response = self.http_target.patch(
+                        "/flags/" + self.project_key_target + "/" + flag["key"],
+                        json=update_payload,
+                    )
+                span.set("status", response.status_code)
+                if self.is_applied(response):
+                    self.journal.record("flags", flag["key"])
 
             # response = self.http_source.get(
             #     "/projects/"
@@ -1370,13 +1811,58 @@ class LDMigrate:
             #             beta=True,
             #         )
             if num % 10 == 0:
-                if not self.ignore_pauses:
-                    time.sleep(5)
                 print("...reached " + str(num) + " flags.")
         print("...created " + str(num) + " flags")
         self.total_flags = num
         return
 
+    def build_flag_payload(self, flag):
+        payload = {
+            "key": flag["key"],
+            "name": flag["name"],
+            "kind": flag["kind"],
+            "clientSideAvailability": flag["clientSideAvailability"],
+            "variations": flag["variations"],
+            "temporary": flag["temporary"],
+            "tags": flag["tags"],
+        }
+        if "defaults" in flag:
+            payload["defaults"] = flag["defaults"]
+        if "description" in flag:
+            payload["description"] = flag["description"]
+        if "customProperties" in flag:
+            payload["customProperties"] = flag["customProperties"]
+        if "_purpose" in flag:
+            payload["purpose"] = flag["_purpose"]
+        maintainer_id = self.get_maintainer_id(flag)
+        if maintainer_id is not None:
+            payload["maintainerId"] = maintainer_id
+        return payload
+
+    def build_flag_update_payload(self, flag):
+        update_payload = []
+        if "archived" in flag:
+            update_payload.append(
+                {"op": "replace", "path": "/archived", "value": flag["archived"]}
+            )
+        if "deprecated" in flag:
+            update_payload.append(
+                {
+                    "op": "replace",
+                    "path": "/deprecated",
+                    "value": flag["deprecated"],
+                }
+            )
+        if "migrationSettings" in flag:
+            update_payload.append(
+                {
+                    "op": "replace",
+                    "path": "/migrationSettings",
+                    "value": flag["migrationSettings"],
+                }
+            )
+        return update_payload
+
     ##################################################
     # Create target flag environments
     ##################################################
@@ -1384,13 +1870,16 @@ class LDMigrate:
     def create_target_flag_environments(self):
         retry = 5
         num_flags = len(self.flag_keys)
-        error_flags = []
-        while retry > 0:
+        error_flags = [
+            flag
+            for flag in self.flag_keys
+            if not self.journal.skip("targeting rules", flag)
+        ]
+        self.total_target_rules = num_flags - len(error_flags)
+        while retry > 0 and len(error_flags) > 0:
             error_flags = self.create_target_flag_environments_runner(
                 retry_flags=error_flags
             )
-            if len(error_flags) == 0:
-                break
             retry -= 1
         if len(error_flags) > 0:
             print(
@@ -1398,13 +1887,22 @@ class LDMigrate:
                 + str(error_flags)
                 + "."
             )
-        self.total_target_rules = num_flags - len(error_flags)
-        print("...created targeting rules for " + str(num_flags) + " flags")
+        print(
+            "...created targeting rules for "
+            + str(self.total_target_rules)
+            + " of "
+            + str(num_flags)
+            + " flags"
+        )
 
     ##################################################
     # Create target flag environments runner
     ##################################################
 
+    # Readers prefetch source flag details into a bounded queue while writers
+    # drain it into the target, so the source and target hosts are used at
+    # the same time. At most 4 * concurrency flags are held in memory: one
+    # per reader waiting to queue, 2 * concurrency queued and one per writer
     def create_target_flag_environments_runner(self, retry_flags=None):
         num = 0
         flags_list = []
@@ -1413,116 +1911,179 @@ class LDMigrate:
         else:
             flags_list = self.flag_keys
         error_flags = []
+        prefetched = queue.Queue(maxsize=self.concurrency * 2)
+        results = queue.Queue()
+
+        def read(flag):
+            try:
+                with self.tracer.span(flag, "flag details"):
+                    details = self.get_source_flag_details(flag)
+                prefetched.put((flag, details))
+            except Exception as e:
+                print("...error reading flag " + flag + ": " + str(e))
+                results.put((flag, False))
+
+        def write():
+            while True:
+                item = prefetched.get()
+                if item is None:
+                    return
+                flag, flag_details = item
+                try:
+                    updated = self.create_target_flag_environment(flag, flag_details)
+                except Exception as e:
+                    print("...error updating flag " + flag + ": " + str(e))
+                    updated = False
+                results.put((flag, updated))
+
+        with ContextExecutor(max_workers=self.concurrency) as writers:
+            for _ in range(self.concurrency):
+                writers.submit(write)
+            with ContextExecutor(max_workers=self.concurrency) as readers:
+                for flag in flags_list:
+                    readers.submit(read, flag)
+
+                for _ in flags_list:
+                    flag, updated = results.get()
+                    num += 1
+                    if updated:
+                        print(
+                            "...updated environments for flag "
+                            + flag
+                            + " ("
+                            + str(num)
+                            + ")"
+                        )
+                    else:
+                        error_flags.append(flag)
+                        print("...error updating flag " + flag + ". Will retry later.")
 
-        for flag in flags_list:
-            num += 1
-            flag_details = self.get_source_flag_details(flag)
-            payload = []
-            for env in self.env_keys:
-                env_details = flag_details["environments"][env]
-                payload.append(
-                    {
-                        "op": "replace",
-                        "path": "/environments/" + env + "/on",
-                        "value": env_details["on"],
-                    }
-                )
-                payload.append(
-                    {
-                        "op": "replace",
-                        "path": "/environments/" + env + "/archived",
-                        "value": env_details["archived"],
-                    }
-                )
-                payload.append(
-                    {
-                        "op": "replace",
-                        "path": "/environments/" + env + "/targets",
-                        "value": env_details["targets"],
-                    }
-                )
-                payload.append(
-                    {
-                        "op": "replace",
-                        "path": "/environments/" + env + "/contextTargets",
-                        "value": env_details["contextTargets"],
-                    }
-                )
-                payload.append(
-                    {
-                        "op": "replace",
-                        "path": "/environments/" + env + "/fallthrough",
-                        "value": env_details["fallthrough"],
-                    }
-                )
-                if "offVariation" in env_details:
-                    payload.append(
-                        {
-                            "op": "replace",
-                            "path": "/environments/" + env + "/offVariation",
-                            "value": env_details["offVariation"],
-                        }
-                    )
-                payload.append(
-                    {
-                        "op": "replace",
-                        "path": "/environments/" + env + "/prerequisites",
-                        "value": env_details["prerequisites"],
-                    }
-                )
-                payload.append(
-                    {
-                        "op": "replace",
-                        "path": "/environments/" + env + "/trackEvents",
-                        "value": env_details["trackEvents"],
-                    }
-                )
-                payload.append(
-                    {
-                        "op": "replace",
-                        "path": "/environments/" + env + "/trackEventsFallthrough",
-                        "value": env_details["trackEventsFallthrough"],
-                    }
+            for _ in range(self.concurrency):
+                prefetched.put(None)
+
+        return error_flags
+
+    ##################################################
+    # Create target flag environment for a single flag
+    ##################################################
+
+    def create_target_flag_environment(self, flag, flag_details):
+        with self.tracer.span(flag, "targeting rules") as span:
+            payload = self.build_flag_environments_payload(flag_details)
+            if self.is_merge() and flag in self.get_target_flags():
+                payload = self.patch_diff.diff(self.get_target_flags()[flag], payload)
+            span.set("ops", len(payload))
+            if len(payload) == 0:
+                self.count_unchanged()
+                span.set("status", "unchanged")
+            else:
+                response = self.patch_target(
+                    "/flags/" + self.project_key_target + "/" + flag, payload
                 )
-                rules_to_del = []
-                for i, rule in enumerate(env_details["rules"]):
-                    del rule["_id"]
-                    need_to_del = []
-                    for idx, clause in enumerate(rule["clauses"]):
-                        del clause["_id"]
-                        if (
-                            clause["attribute"] in ["segmentMatch", "not-segmentMatch"]
-                            and not self.migrate_segments
-                        ):
-                            need_to_del.append(idx)
-                    if len(need_to_del) > 0:
-                        for idx in reversed(need_to_del):
-                            del rule["clauses"][idx]
-                    if len(rule["clauses"]) == 0:
-                        rules_to_del.append(i)
-                for x in reversed(rules_to_del):
-                    del env_details["rules"][x]
+                span.set("status", response.status_code)
+                if response.status_code != 200:
+                    return False
+
+        self.journal.record("targeting rules", flag)
+        with self.counter_lock:
+            self.total_target_rules += 1
+        return True
+
+    ##################################################
+    # Build the targeting rules payload for a flag
+    ##################################################
+
+    def build_flag_environments_payload(self, flag_details):
+        payload = []
+        for env in self.env_keys:
+            env_details = flag_details["environments"][env]
+            payload.append(
+                {
+                    "op": "replace",
+                    "path": "/environments/" + env + "/on",
+                    "value": env_details["on"],
+                }
+            )
+            payload.append(
+                {
+                    "op": "replace",
+                    "path": "/environments/" + env + "/archived",
+                    "value": env_details["archived"],
+                }
+            )
+            payload.append(
+                {
+                    "op": "replace",
+                    "path": "/environments/" + env + "/targets",
+                    "value": env_details["targets"],
+                }
+            )
+            payload.append(
+                {
+                    "op": "replace",
+                    "path": "/environments/" + env + "/contextTargets",
+                    "value": env_details["contextTargets"],
+                }
+            )
+            payload.append(
+                {
+                    "op": "replace",
+                    "path": "/environments/" + env + "/fallthrough",
+                    "value": env_details["fallthrough"],
+                }
+            )
+            if "offVariation" in env_details:
                 payload.append(
                     {
                         "op": "replace",
-                        "path": "/environments/" + env + "/rules",
-                        "value": env_details["rules"],
+                        "path": "/environments/" + env + "/offVariation",
+                        "value": env_details["offVariation"],
                     }
                 )
-            response = self.http_target.patch(
-                "/flags/" + self.project_key_target + "/" + flag,
-                json=payload,
+            payload.append(
+                {
+                    "op": "replace",
+                    "path": "/environments/" + env + "/prerequisites",
+                    "value": env_details["prerequisites"],
+                }
             )
-            if response.status_code != 200:
-                error_flags.append(flag)
-                print(json.dumps(payload))
-                print("...error updating flag " + flag + ". Will retry later.")
-                exit(1)
-            else:
-                print(
-                    "...updated environments for flag " + flag + " (" + str(num) + ")"
-                )
-            if not self.ignore_pauses:
-                time.sleep(3)
-
-        return error_flags
+            payload.append(
+                {
+                    "op": "replace",
+                    "path": "/environments/" + env + "/trackEvents",
+                    "value": env_details["trackEvents"],
+                }
+            )
+            payload.append(
+                {
+                    "op": "replace",
+                    "path": "/environments/" + env + "/trackEventsFallthrough",
+                    "value": env_details["trackEventsFallthrough"],
+                }
+            )
+            rules_to_del = []
+            for i, rule in enumerate(env_details["rules"]):
+                del rule["_id"]
+                need_to_del = []
+                for idx, clause in enumerate(rule["clauses"]):
+                    del clause["_id"]
+                    if (
+                        clause["attribute"] in ["segmentMatch", "not-segmentMatch"]
+                        and not self.migrate_segments
+                    ):
+                        need_to_del.append(idx)
+                if len(need_to_del) > 0:
+                    for idx in reversed(need_to_del):
+                        del rule["clauses"][idx]
+                if len(rule["clauses"]) == 0:
+                    rules_to_del.append(i)
+            for x in reversed(rules_to_del):
+                del env_details["rules"][x]
+            payload.append(
+                {
+                    "op": "replace",
+                    "path": "/environments/" + env + "/rules",
+                    "value": env_details["rules"],
+                }
+            )
+        return payload
@@ -0,0 +1,888 @@
+import asyncio
+import copy
+import json
+from AsyncRestAdapter import AsyncRestAdapter
+from LDMigrate import MigrationMode
+from PhaseScheduler import PhaseScheduler
+from SegmentGraph import SegmentGraph
+from SnapshotStore import AsyncSnapshotAdapter, SnapshotAdapter
+
+
+class LDMigrateAsync:
+    migrator = None
+    http_source = None
+    http_target = None
+    semaphore = None
+
+    # Settings, counters and payload builders are shared with the LDMigrate
+    # instance, so both engines migrate resources identically
+    def __init__(self, migrator):
+        self.migrator = migrator
+        self.http_source = AsyncRestAdapter(
+            migrator.src_host,
+            "v2",
+            migrator.api_key_src,
+            pool_size=migrator.connection_pool_size,
+            verify=migrator.http_source.verify,
+            rate_limiter=migrator.http_source.rate_limiter,
+            metrics=migrator.metrics,
+            tracer=migrator.tracer,
+            cache=migrator.response_cache,
+            retry_policy=migrator.retry_policy,
+            name="source",
+        )
+        self.http_target = AsyncRestAdapter(
+            migrator.tgt_host,
+            "v2",
+            migrator.api_key_tgt,
+            pool_size=migrator.connection_pool_size,
+            verify=migrator.http_target.verify,
+            rate_limiter=migrator.http_target.rate_limiter,
+            metrics=migrator.metrics,
+            tracer=migrator.tracer,
+            retry_policy=migrator.retry_policy,
+            name="target",
+        )
+        if isinstance(migrator.http_source, SnapshotAdapter):
+            self.http_source = AsyncSnapshotAdapter(migrator.http_source)
+
+    async def migrate(self):
+        self.semaphore = asyncio.Semaphore(self.migrator.concurrency)
+        await self.http_source.open()
+        await self.http_target.open()
+        try:
+            await self.run()
+        finally:
+            await self.http_source.close()
+            await self.http_target.close()
+        return self.migrator.get_result()
+
+    async def run(self):
+        m = self.migrator
+
+        if m.migration_mode == MigrationMode.MERGE and not await self.target_project_exists():
+            print("Target project does not exist. Try migration instead.")
+            exit(1)
+
+        #############################
+        # Setting up data structures
+        #############################
+        print("Getting source flag keys and environment keys...", flush=True)
+        m.flag_keys, m.env_keys = await asyncio.gather(
+            self.get_source_flag_keys(),
+            self.get_source_environment_keys(),
+        )
+        print(
+            "done. Got "
+            + str(len(m.flag_keys))
+            + " flag keys and "
+            + str(len(m.env_keys))
+            + " environment keys.",
+            end="\n\n",
+        )
+
+        if m.migration_mode == MigrationMode.MERGE:
+            dup_flags = []
+            dup_segs = []
+            if not m.ignore_duplicate_flags:
+                m.target_flag_keys = await self.get_target_flag_keys()
+                dup_flags = set(m.flag_keys).intersection(m.target_flag_keys)
+                m.print_duplicates("flags", dup_flags)
+
+            if not m.ignore_duplicate_segments:
+                m.target_env_keys = await self.get_target_environment_keys()
+                m.segment_keys, m.target_segment_keys = await asyncio.gather(
+                    self.get_source_segment_keys(),
+                    self.get_target_segment_keys(),
+                )
+                dup_segs = set(m.segment_keys).intersection(m.target_segment_keys)
+                m.print_duplicates("segments", dup_segs)
+
+            if not m.ignore_duplicate_flags or not m.ignore_duplicate_segments:
+                m.confirm_merge(dup_flags, dup_segs)
+
+        ##########################
+        # Starting migration
+        ##########################
+        scheduler = PhaseScheduler(m.tracer)
+        m.add_migration_phases(scheduler, self)
+        m.open_journal()
+        try:
+            m.phase_timings = await scheduler.run_async()
+        finally:
+            m.close_journal()
+            m.members.save()
+            m.write_metrics()
+            m.tracer.close()
+        scheduler.print_report()
+        m.metrics.print_report(scheduler.order)
+        if m.response_cache is not None:
+            m.response_cache.print_report()
+
+    ##################################################
+    # Run a coroutine for every item, bounded by concurrency
+    ##################################################
+
+    async def gather_bounded(self, func, items):
+        return await asyncio.gather(*[self.run_bounded(func, item) for item in items])
+
+    async def run_bounded(self, func, item):
+        async with self.semaphore:
+            return await func(item)
+
+    # Items are taken from a streamed listing only as a slot frees up, so a
+    # long listing is never held as a list of pending tasks. Returns the
+    # number of items
+    async def stream_bounded(self, func, items):
+        count = 0
+        tasks = set()
+        errors = []
+
+        def done(task):
+            tasks.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                errors.append(task.exception())
+
+        async for item in items:
+            await self.semaphore.acquire()
+            task = asyncio.ensure_future(self.run_released(func, item))
+            tasks.add(task)
+            task.add_done_callback(done)
+            count += 1
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if len(errors) > 0:
+            raise errors[0]
+        return count
+
+    async def run_released(self, func, item):
+        try:
+            return await func(item)
+        finally:
+            self.semaphore.release()
+
+    ##################################################
+    # Patch a target resource in size-bounded chunks, as in the sync engine
+    ##################################################
+
+    async def patch_target(self, path, payload):
+        response = None
+        for chunk in self.migrator.patch_chunker.chunk(payload):
+            response = await self.http_target.patch(path, json=chunk)
+            if response.status_code != 200:
+                return response
+        return response
+
+    ##################################################
+    # Collect every item of a listing
+    ##################################################
+
+    async def get_all_items(self, http, path, beta=False):
+        return [item async for item in http.paginate(path, beta=beta)]
+
+    ##################################################
+    # Source and target listings
+    ##################################################
+
+    async def target_project_exists(self):
+        response = await self.http_target.get(
+            "/projects/" + self.migrator.project_key_target
+        )
+        data = json.loads(response.text)
+        return "message" not in data
+
+    async def get_source_project(self):
+        path = "/projects/" + self.migrator.project_key_source
+        response = await self.http_source.get(path)
+        return json.loads(response.text)
+
+    async def get_source_flag_templates(self):
+        path = "/projects/" + self.migrator.project_key_source + "/flag-templates"
+        response = await self.http_source.get(path, beta=True, internal=True)
+        return json.loads(response.text)
+
+    async def get_source_experiment_settings(self):
+        path = (
+            "/projects/" + self.migrator.project_key_source + "/experimentation-settings"
+        )
+        response = await self.http_source.get(path, beta=True)
+        return json.loads(response.text)
+
+    async def get_source_context_kinds(self):
+        path = "/projects/" + self.migrator.project_key_source + "/context-kinds"
+        response = await self.http_source.get(path)
+        return json.loads(response.text)
+
+    def get_source_payload_filters(self):
+        path = (
+            "/projects/" + self.migrator.project_key_source + "/payload-filters?limit=20"
+        )
+        return self.http_source.paginate(path, beta=True)
+
+    async def get_source_environments(self):
+        return await self.migrator.snapshot.get_async(
+            "environments", self.list_source_environments
+        )
+
+    async def list_source_environments(self):
+        path = "/projects/" + self.migrator.project_key_source + "/environments?limit=20"
+        return await self.get_all_items(self.http_source, path)
+
+    async def get_source_environment_keys(self):
+        environments = await self.get_source_environments()
+        return [env["key"] for env in environments]
+
+    async def get_target_environment_keys(self):
+        return list((await self.get_target_environments()).keys())
+
+    async def get_target_environments(self):
+        return await self.migrator.snapshot.get_async(
+            "target environments", self.list_target_environments
+        )
+
+    async def list_target_environments(self):
+        path = "/projects/" + self.migrator.project_key_target + "/environments?limit=20"
+        environments = await self.get_all_items(self.http_target, path)
+        return {env["key"]: env for env in environments}
+
+    def list_source_metrics(self):
+        path = "/metrics/" + self.migrator.project_key_source + "?limit=20"
+        return self.http_source.paginate(path)
+
+    async def get_source_metric(self, item):
+        m = self.migrator
+        if m.has_metric_details(item):
+            return m.build_metric_payload(item)
+        response = await self.http_source.get(
+            "/metrics/" + m.project_key_source + "/" + item["key"]
+        )
+        return m.build_metric_payload(json.loads(response.text))
+
+    def get_source_metric_groups(self):
+        path = "/projects/" + self.migrator.project_key_source + "/metric-groups?limit=20"
+        return self.http_source.paginate(path)
+
+    # The duplicate check holds on to the segments it lists, so the segments
+    # phase reuses them instead of listing them again
+    async def get_source_segment_keys(self):
+        segment_keys = []
+        segments = await self.migrator.snapshot.get_async(
+            "segments", self.load_source_segments
+        )
+        for env in segments:
+            for item in env["segments"]:
+                segment_keys.append(env["environment"] + "|" + item["key"])
+        return segment_keys
+
+    async def get_target_segment_keys(self):
+        m = self.migrator
+
+        async def get_env_keys(env):
+            path = "/segments/" + m.project_key_target + "/" + env + "?limit=50"
+            items = await self.get_all_items(self.http_target, path)
+            return [env + "|" + item["key"] for item in items]
+
+        keys = await self.gather_bounded(get_env_keys, m.target_env_keys)
+        return [key for env_keys in keys for key in env_keys]
+
+    # Each environment's segments are paged on their own, so an environment
+    # is created as soon as its own listing is done
+    async def get_source_env_segments(self, env):
+        m = self.migrator
+        if m.snapshot.has("segments"):
+            for listed in m.snapshot.iter("segments", list):
+                if listed["environment"] == env:
+                    return listed["segments"]
+        return await self.run_bounded(self.list_source_env_segments, env)
+
+    async def list_source_env_segments(self, env):
+        path = (
+            "/segments/" + self.migrator.project_key_source + "/" + env
+            + "?expand=flags&limit=20"
+        )
+        return await self.get_all_items(self.http_source, path)
+
+    async def load_source_segments(self):
+        async def load_env(env):
+            return {"environment": env, "segments": await self.list_source_env_segments(env)}
+
+        return await self.gather_bounded(load_env, self.migrator.env_keys)
+
+    async def get_source_segment_details(self, env, segment):
+        if self.migrator.has_segment_details(segment):
+            return copy.deepcopy(segment)
+        response = await self.http_source.get(
+            "/segments/" + self.migrator.project_key_source + "/" + env + "/" + segment["key"]
+        )
+        return json.loads(response.text)
+
+    # The flags are listed once, for their keys, and the flags phase creates
+    # them from the same listing
+    async def get_source_flags(self):
+        flags = await self.migrator.snapshot.get_async("flags", self.list_source_flags)
+        for flag in flags:
+            yield flag
+
+    async def list_source_flags(self):
+        path = "/flags/" + self.migrator.project_key_source + "?limit=50"
+        return [
+            item
+            async for item in self.http_source.paginate(path)
+            if self.migrator.is_flag_selected(item["key"])
+        ]
+
+    async def get_source_flag_keys(self):
+        return [flag["key"] async for flag in self.get_source_flags()]
+
+    async def get_target_flag_keys(self):
+        path = "/flags/" + self.migrator.project_key_target + "?limit=50"
+        flags = await self.get_all_items(self.http_target, path)
+        return [flag["key"] for flag in flags]
+
+    async def get_source_flag_details(self, flag_key):
+        response = await self.http_source.get(
+            "/flags/" + self.migrator.project_key_source + "/" + flag_key
+        )
+        return json.loads(response.text)
+
+    async def get_target_flags(self):
+        return await self.migrator.snapshot.get_async(
+            "target flags", self.list_target_flags
+        )
+
+    async def list_target_flags(self):
+        path = "/flags/" + self.migrator.project_key_target + "?summary=0&limit=50"
+        flags = await self.get_all_items(self.http_target, path)
+        return {flag["key"]: flag for flag in flags}
+
+    async def get_target_segments(self):
+        return await self.migrator.snapshot.get_async(
+            "target segments", self.list_target_segments
+        )
+
+    async def list_target_segments(self):
+        m = self.migrator
+
+        async def get_env_segments(env):
+            path = "/segments/" + m.project_key_target + "/" + env + "?limit=50"
+            items = await self.get_all_items(self.http_target, path)
+            return {env + "/" + item["key"]: item for item in items}
+
+        segments = {}
+        envs = await self.get_target_environment_keys()
+        for env_segments in await self.gather_bounded(get_env_segments, envs):
+            segments.update(env_segments)
+        return segments
+
+    async def get_target_metrics(self):
+        return await self.migrator.snapshot.get_async(
+            "target metrics", self.list_target_metrics
+        )
+
+    async def list_target_metrics(self):
+        path = "/metrics/" + self.migrator.project_key_target + "?limit=20"
+        metrics = await self.get_all_items(self.http_target, path)
+        return {metric["key"]: metric for metric in metrics}
+
+    # Looked up ahead of the payload builders, which then read the resolved
+    # maintainer from the directory without a request
+    async def resolve_maintainer(self, item, field="_maintainer"):
+        if "email" not in (item.get(field) or {}):
+            return None
+        return await self.migrator.members.resolve_async(
+            item[field]["email"],
+            self.find_target_member,
+            self.list_target_members,
+        )
+
+    async def find_target_member(self, email):
+        response = await self.http_target.get(
+            "/members", params={"filter": "query:" + email, "limit": 20}
+        )
+        for member in json.loads(response.text).get("items", []):
+            if member["email"].lower() == email.lower():
+                return member["_id"]
+        return None
+
+    async def get_target_members(self):
+        return await self.migrator.members.get_all_async(self.list_target_members)
+
+    async def list_target_members(self):
+        members = await self.get_all_items(self.http_target, "/members")
+        return {member["email"]: member["_id"] for member in members}
+
+    ##################################################
+    # Create target project
+    ##################################################
+
+    async def create_target_project(self):
+        m = self.migrator
+        if m.journal.skip("project", m.project_key_target):
+            print("...target project exists, resuming migration")
+            return
+        project = await self.get_source_project()
+        payload = m.build_project_payload(project)
+        response = await self.http_target.post("/projects", json=payload)
+        data = json.loads(response.text)
+        m.check_target_project_response(data)
+        if m.is_applied(response):
+            m.journal.record("project", m.project_key_target)
+        return data
+
+    ##################################################
+    # Create target flag templates
+    ##################################################
+
+    async def create_target_flag_templates(self):
+        m = self.migrator
+        flag_templates = await self.get_source_flag_templates()
+        templates = [
+            template
+            for template in flag_templates["items"]
+            if template["key"] not in ["ai-prompt", "ai-model"]
+        ]
+
+        async def update_template(template):
+            if m.journal.skip("flag templates", template["key"]):
+                return
+            response = await self.http_target.patch(
+                "/projects/"
+                + m.project_key_target
+                + "/flag-templates/"
+                + template["key"],
+                json=m.build_flag_template_payload(template),
+                beta=True,
+                internal=True,
+            )
+            if m.is_applied(response):
+                m.journal.record("flag templates", template["key"])
+
+        await self.gather_bounded(update_template, templates)
+        print("...updated flag templates")
+
+    ##################################################
+    # Create target context kinds
+    ##################################################
+
+    async def create_target_context_kinds(self):
+        m = self.migrator
+        context_kinds = await self.get_source_context_kinds()
+
+        async def put_kind(kind):
+            if m.journal.skip("context kinds", kind["key"]):
+                return
+            response = await self.http_target.put(
+                "/projects/" + m.project_key_target + "/context-kinds/" + kind["key"],
+                json=m.build_context_kind_payload(kind),
+            )
+            if m.is_applied(response):
+                m.journal.record("context kinds", kind["key"])
+
+        await self.gather_bounded(put_kind, context_kinds["items"])
+
+        if not m.journal.skip("experiment settings", m.project_key_target):
+            exp_settings = await self.get_source_experiment_settings()
+            payload = {"randomizationUnits": exp_settings["randomizationUnits"]}
+            response = await self.http_target.put(
+                "/projects/" + m.project_key_target + "/experimentation-settings",
+                json=payload,
+                beta=True,
+            )
+            if m.is_applied(response):
+                m.journal.record("experiment settings", m.project_key_target)
+        m.total_context_kinds = len(context_kinds["items"])
+        print("...created " + str(m.total_context_kinds) + " context kinds")
+
+    ##################################################
+    # Create target payload filters
+    ##################################################
+
+    async def create_target_payload_filters(self):
+        m = self.migrator
+        async def post_filter(filter):
+            if m.journal.skip("payload filters", filter["key"]):
+                return
+            response = await self.http_target.post(
+                "/projects/" + m.project_key_target + "/payload-filters",
+                json=m.build_payload_filter_payload(filter),
+                beta=True,
+            )
+            if m.is_applied(response):
+                m.journal.record("payload filters", filter["key"])
+
+        m.total_payload_filters = await self.stream_bounded(
+            post_filter, self.get_source_payload_filters()
+        )
+        print("...created " + str(m.total_payload_filters) + " payload filters")
+
+    ##################################################
+    # Create target environments
+    ##################################################
+
+    async def create_target_environments(self):
+        m = self.migrator
+        environments, existing = await asyncio.gather(
+            self.get_source_environments(),
+            self.get_target_environments(),
+        )
+        env_path = "/projects/" + m.project_key_target + "/environments"
+
+        async def create_environment(env):
+            if m.journal.skip("environments", env["key"]):
+                return
+            with m.tracer.span(env["key"], "environment") as span:
+                approvals = m.build_environment_approvals_payload(env)
+                if env["key"] in existing:
+                    payload = m.build_environment_patch_payload(env)
+                    if m.is_merge():
+                        target_env = existing[env["key"]]
+                        payload = m.patch_diff.diff(target_env, payload)
+                        approvals = m.patch_diff.diff(target_env, approvals)
+                    # An existing environment takes its approvals in the same patch
+                    payload = payload + approvals
+                    if len(payload) == 0:
+                        m.count_unchanged()
+                        m.journal.record("environments", env["key"])
+                        span.set("status", "unchanged")
+                        return
+                    response = await self.patch_target_environment(
+                        env["key"], payload
+                    )
+                else:
+                    response = await self.http_target.post(
+                        env_path, json=m.build_environment_post_payload(env)
+                    )
+                    if m.is_applied(response):
+                        approvals = m.build_new_environment_approvals_payload(
+                            approvals, response
+                        )
+                        if len(approvals) > 0:
+                            response = await self.patch_target_environment(
+                                env["key"], approvals
+                            )
+                span.set("status", response.status_code)
+                if m.is_applied(response):
+                    m.journal.record("environments", env["key"])
+                else:
+                    print("...error creating environment " + env["key"])
+
+        await self.gather_bounded(create_environment, environments)
+        m.total_environments = len(environments)
+        print("...created " + str(m.total_environments) + " environments")
+
+    # Resent a few times with backoff, as in the sync engine
+    async def patch_target_environment(self, env_key, payload):
+        m = self.migrator
+        path = "/projects/" + m.project_key_target + "/environments/" + env_key
+        attempt = 1
+        while True:
+            response = await self.http_target.patch(path, json=payload)
+            if (
+                response.status_code == 200
+                or attempt >= m.environment_patch_attempts
+            ):
+                return response
+            delay = m.retry_policy.backoff(attempt, response.headers)
+            m.metrics.record_pause(delay)
+            await asyncio.sleep(delay)
+            m.tracer.record("pause", "wait", delay)
+            attempt += 1
+
+    ##################################################
+    # Create target metrics
+    ##################################################
+
+    async def create_target_metrics(self):
+        m = self.migrator
+        target_metrics = await self.get_target_metrics() if m.is_merge() else {}
+
+        async def post_metric(item):
+            if m.journal.skip("metrics", item["key"]):
+                return
+            with m.tracer.span(item["key"], "metric") as span:
+                metric = await self.get_source_metric(item)
+                if metric["key"] in target_metrics:
+                    payload = m.patch_diff.diff(
+                        target_metrics[metric["key"]], m.build_metric_merge_payload(metric)
+                    )
+                    if len(payload) == 0:
+                        m.count_unchanged()
+                        m.journal.record("metrics", metric["key"])
+                        span.set("status", "unchanged")
+                        return
+                    response = await self.http_target.patch(
+                        "/metrics/" + m.project_key_target + "/" + metric["key"],
+                        json=payload,
+                    )
+                else:
+                    maintainer_id = await self.resolve_maintainer(item)
+                    response = await self.http_target.post(
+                        "/metrics/" + m.project_key_target,
+                        json=m.build_metric_post_payload(metric, maintainer_id),
+                    )
+                span.set("status", response.status_code)
+                if m.is_applied(response):
+                    m.journal.record("metrics", metric["key"])
+
+        # Metrics are created while later pages of the listing are fetched
+        m.total_metrics = await self.stream_bounded(post_metric, self.list_source_metrics())
+        print("...created " + str(m.total_metrics) + " metrics")
+
+    ##################################################
+    # Create target metric groups
+    ##################################################
+
+    async def create_target_metric_groups(self):
+        m = self.migrator
+        async def post_group(metric_group):
+            if m.journal.skip("metric groups", metric_group["key"]):
+                return
+            maintainer_id = await self.resolve_maintainer(metric_group, "maintainer")
+            response = await self.http_target.post(
+                "/projects/" + m.project_key_target + "/metric-groups",
+                json=m.build_metric_group_payload(metric_group, maintainer_id),
+                beta=True,
+            )
+            if m.is_applied(response):
+                m.journal.record("metric groups", metric_group["key"])
+
+        m.total_metric_groups = await self.stream_bounded(
+            post_group, self.get_source_metric_groups()
+        )
+        print("...created " + str(m.total_metric_groups) + " metric groups")
+
+    ##################################################
+    # Create target segments
+    ##################################################
+
+    async def create_target_segments(self):
+        m = self.migrator
+        # Listed before fanning out, as the listing shares the same semaphore
+        target_segments = await self.get_target_segments() if m.is_merge() else {}
+
+        # Ordered segments are patched with their rules, as in the sync engine
+        async def create_segment(item):
+            env, segment_data, ordered = item
+            segment_path = env + "/" + segment_data["key"]
+            with m.tracer.span(segment_path, "segment") as span:
+                path = "/segments/" + m.project_key_target + "/" + env
+                target_segment = target_segments.get(segment_path)
+                if target_segment is None:
+                    await self.http_target.post(
+                        path, json=m.build_segment_post_payload(segment_data)
+                    )
+                payload, rules_payload = m.build_segment_patch_payload(segment_data)
+                if target_segment is not None:
+                    payload, rules_payload = m.build_segment_merge_payload(
+                        target_segment, segment_data, payload, rules_payload
+                    )
+                if ordered and rules_payload is not None:
+                    payload = payload + rules_payload
+                    rules_payload = None
+                if len(payload) == 0:
+                    if rules_payload is None:
+                        m.journal.record("segments", segment_path)
+                    return rules_payload
+                response = await self.patch_target(
+                    path + "/" + segment_data["key"], payload
+                )
+                span.set("status", response.status_code)
+                if response.status_code != 200:
+                    print("...error updating segment: " + segment_path)
+                elif rules_payload is None:
+                    m.journal.record("segments", segment_path)
+                return rules_payload
+
+        async def patch_rules(item):
+            segment_path, rules_payload = item
+            with m.tracer.span(segment_path, "segment rules") as span:
+                response = await self.patch_target(
+                    "/segments/" + m.project_key_target + "/" + segment_path,
+                    rules_payload,
+                )
+                span.set("status", response.status_code)
+                if response.status_code == 200:
+                    m.journal.record("segments", segment_path)
+
+        async def get_details(item):
+            env, segment = item
+            return await self.get_source_segment_details(env, segment)
+
+        # Levels of SegmentGraph are created one after another
+        async def create_env_segments(env_key):
+            segments = await self.get_source_env_segments(env_key)
+            items = [
+                (env_key, segment)
+                for segment in segments
+                if not m.journal.skip("segments", env_key + "/" + segment["key"])
+            ]
+            details = {
+                segment_data["key"]: segment_data
+                for segment_data in await self.gather_bounded(get_details, items)
+            }
+            graph = SegmentGraph(details.values())
+            m.print_segment_cycles(env_key, graph)
+            for level in graph.levels:
+                await self.gather_bounded(
+                    create_segment, [(env_key, details[key], True) for key in level]
+                )
+
+            rules = await self.gather_bounded(
+                create_segment,
+                [(env_key, details[key], False) for key in graph.unordered],
+            )
+            deferred = [
+                (env_key + "/" + key, rules_payload)
+                for key, rules_payload in zip(graph.unordered, rules)
+                if rules_payload is not None
+            ]
+            await self.gather_bounded(patch_rules, deferred)
+            return len(segments)
+
+        totals = await asyncio.gather(
+            *[create_env_segments(env) for env in m.env_keys]
+        )
+        m.total_segments = sum(totals)
+        print("...created " + str(m.total_segments) + " segments")
+
+    ##################################################
+    # Create target flags
+    ##################################################
+
+    async def create_target_flags(self):
+        m = self.migrator
+        target_flags = await self.get_target_flags() if m.is_merge() else {}
+
+        async def create_flag(flag):
+            if m.journal.skip("flags", flag["key"]):
+                return
+            with m.tracer.span(flag["key"], "flag") as span:
+                if flag["key"] in target_flags:
+                    update_payload = m.patch_diff.diff(
+                        target_flags[flag["key"]], m.build_flag_merge_payload(flag)
+                    )
+                    if len(update_payload) == 0:
+                        m.count_unchanged()
+                        m.journal.record("flags", flag["key"])
+                        span.set("status", "unchanged")
+                        return
+                else:
+                    await self.resolve_maintainer(flag)
+                    response = await self.http_target.post(
+                        "/flags/" + m.project_key_target, json=m.build_flag_payload(flag)
+                    )
+                    update_payload = m.build_flag_update_payload(flag)
+                if len(update_payload) > 0:
+                    response = await self.http_target.patch(
+                        "/flags/" + m.project_key_target + "/" + flag["key"],
+                        json=update_payload,
+                    )
+                span.set("status", response.status_code)
+                if m.is_applied(response):
+                    m.journal.record("flags", flag["key"])
+
+        m.total_flags = await self.stream_bounded(create_flag, self.get_source_flags())
+        print("...created " + str(m.total_flags) + " flags")
+
+    ##################################################
+    # Create target flag environments
+    ##################################################
+
+    async def create_target_flag_environments(self):
+        m = self.migrator
+        retry = 5
+        error_flags = [
+            flag for flag in m.flag_keys if not m.journal.skip("targeting rules", flag)
+        ]
+        m.total_target_rules = len(m.flag_keys) - len(error_flags)
+        while retry > 0 and len(error_flags) > 0:
+            error_flags = await self.create_target_flag_environments_runner(
+                error_flags
+            )
+            retry -= 1
+        if len(error_flags) > 0:
+            print(
+                "...the environments for the following flags could not be updated:"
+                + str(error_flags)
+                + "."
+            )
+        print(
+            "...created targeting rules for "
+            + str(m.total_target_rules)
+            + " of "
+            + str(len(m.flag_keys))
+            + " flags"
+        )
+
+    # Readers prefetch source flag details into a bounded queue which the
+    # writers drain into the target, as in the sync engine. There are as many
+    # readers as the concurrency, each taking the next flag only once the
+    # last one is queued, so memory stays flat however many flags there are
+    async def create_target_flag_environments_runner(self, flags_list):
+        m = self.migrator
+        prefetched = asyncio.Queue(maxsize=m.concurrency * 2)
+        pending = iter(flags_list)
+        error_flags = []
+
+        async def read():
+            for flag in pending:
+                try:
+                    with m.tracer.span(flag, "flag details"):
+                        flag_details = await self.run_bounded(
+                            self.get_source_flag_details, flag
+                        )
+                except Exception as e:
+                    print("...error reading flag " + flag + ": " + str(e))
+                    error_flags.append(flag)
+                    continue
+                await prefetched.put((flag, flag_details))
+
+        async def write():
+            while True:
+                item = await prefetched.get()
+                if item is None:
+                    return
+                flag, flag_details = item
+                try:
+                    updated = await self.create_target_flag_environment(
+                        flag, flag_details
+                    )
+                except Exception as e:
+                    print("...error updating flag " + flag + ": " + str(e))
+                    updated = False
+                if not updated:
+                    error_flags.append(flag)
+
+        writers = [asyncio.ensure_future(write()) for _ in range(m.concurrency)]
+        try:
+            await asyncio.gather(*[read() for _ in range(m.concurrency)])
+            for _ in writers:
+                await prefetched.put(None)
+            await asyncio.gather(*writers)
+        finally:
+            for writer in writers:
+                writer.cancel()
+        return error_flags
+
+    async def create_target_flag_environment(self, flag, flag_details):
+        m = self.migrator
+        with m.tracer.span(flag, "targeting rules") as span:
+            payload = m.build_flag_environments_payload(flag_details)
+            target_flags = await self.get_target_flags() if m.is_merge() else {}
+            if flag in target_flags:
+                payload = m.patch_diff.diff(target_flags[flag], payload)
+            span.set("ops", len(payload))
+            if len(payload) == 0:
+                m.count_unchanged()
+                span.set("status", "unchanged")
+            else:
+                response = await self.patch_target(
+                    "/flags/" + m.project_key_target + "/" + flag, payload
+                )
+                span.set("status", response.status_code)
+                if response.status_code != 200:
+                    print("...error updating flag " + flag + ". Will retry later.")
+                    return False
+            m.journal.record("targeting rules", flag)
+            m.total_target_rules += 1
+            print("...updated environments for flag " + flag)
+            return True
@@ -0,0 +1,224 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class MemberDirectory:
+    path = None
+    ttl = 86400
+    max_lookups = 25
+    account = ""
+    members = {}
+    listed_at = 0.0
+    listed = False
+    lookups = 0
+    invalidated = set()
+    changed = False
+    lock = None
+    list_lock = None
+    locks = {}
+    tasks = {}
+
+    # Maps member emails to their _id in one account, so flag maintainers
+    # can be set on the target. Members are looked up one at a time the
+    # first time a maintainer is needed, and after max_lookups the whole
+    # directory is listed once instead. With a path, the directory is kept
+    # on disk for ttl seconds, and older entries are looked up again when
+    # they are next used
+    def __init__(self, account, path=None, ttl=86400, max_lookups=25):
+        # Only a hash of the host and token is written to the file
+        self.account = hashlib.sha256(account.encode()).hexdigest()
+        self.path = path
+        self.ttl = ttl
+        self.max_lookups = max_lookups
+        self.members = {}
+        self.listed_at = 0.0
+        self.listed = False
+        self.lookups = 0
+        self.invalidated = set()
+        self.changed = False
+        self.lock = threading.Lock()
+        self.list_lock = threading.Lock()
+        self.locks = {}
+        self.tasks = {}
+        if path is not None:
+            self.load()
+
+    ##################################################
+    # Resolve an email to a member _id
+    ##################################################
+
+    # lookup(email) returns the _id or None, and list_all() returns every
+    # member as {email: _id}. Returns None for emails without a member
+    def resolve(self, email, lookup, list_all):
+        with self.lock:
+            if self.is_known(email):
+                return self.get(email)
+            if email not in self.locks:
+                self.locks[email] = threading.Lock()
+            email_lock = self.locks[email]
+
+        # Other flags with the same maintainer wait for this lookup
+        with email_lock:
+            if not self.is_known(email):
+                if self.should_list():
+                    # One listing settles every email
+                    with self.list_lock:
+                        if not self.is_known(email):
+                            self.store_all(list_all())
+                else:
+                    self.store(email, lookup(email))
+            return self.get(email)
+
+    async def resolve_async(self, email, lookup, list_all):
+        if self.is_known(email):
+            return self.get(email)
+        if email in self.tasks:
+            task = self.tasks[email]
+        elif None in self.tasks:
+            task = self.tasks[None]
+        elif self.should_list():
+            task = self.tasks[None] = asyncio.ensure_future(self.list_async(list_all))
+        else:
+            task = self.tasks[email] = asyncio.ensure_future(
+                self.lookup_async(email, lookup)
+            )
+        await task
+        return self.get(email)
+
+    async def lookup_async(self, email, lookup):
+        try:
+            self.store(email, await lookup(email))
+        finally:
+            del self.tasks[email]
+
+    async def list_async(self, list_all):
+        try:
+            self.store_all(await list_all())
+        finally:
+            del self.tasks[None]
+
+    # Every member, listed unless a full listing is still fresh
+    def get_all(self, list_all):
+        if time.time() - self.listed_at >= self.ttl:
+            self.store_all(list_all())
+        return self.get_members()
+
+    async def get_all_async(self, list_all):
+        if time.time() - self.listed_at >= self.ttl:
+            self.store_all(await list_all())
+        return self.get_members()
+
+    def get_members(self):
+        with self.lock:
+            return {
+                email: entry[0]
+                for email, entry in self.members.items()
+                if entry[0] is not None
+            }
+
+    ##################################################
+    # Entries and their age
+    ##################################################
+
+    # Once the directory has been listed in this run, an email missing from
+    # it has no member
+    def is_known(self, email):
+        entry = self.members.get(email)
+        if entry is None:
+            return self.listed
+        return time.time() - entry[1] < self.ttl
+
+    def get(self, email):
+        entry = self.members.get(email)
+        if entry is None:
+            return None
+        return entry[0]
+
+    # Single lookups stop paying off once there are many maintainers
+    def should_list(self):
+        with self.lock:
+            if self.lookups < self.max_lookups:
+                self.lookups += 1
+                return False
+            return True
+
+    # A miss is only remembered for this run, so a member added later is
+    # found by the next one
+    def store(self, email, member_id):
+        with self.lock:
+            self.members[email] = [member_id, time.time()]
+            if member_id is None:
+                self.invalidated.add(email)
+            else:
+                self.invalidated.discard(email)
+            self.changed = True
+
+    # Emails missing from a full listing no longer have a member
+    def store_all(self, members):
+        now = time.time()
+        with self.lock:
+            for email, entry in self.members.items():
+                if email not in members:
+                    entry[0] = None
+                    entry[1] = now
+                    self.invalidated.add(email)
+            for email, member_id in members.items():
+                self.members[email] = [member_id, now]
+                self.invalidated.discard(email)
+            self.listed_at = now
+            self.listed = True
+            self.changed = True
+
+    ##################################################
+    # On-disk cache
+    ##################################################
+
+    def load(self):
+        data = self.read()
+        with self.lock:
+            self.listed_at = data["listed_at"]
+            for email, entry in data["members"].items():
+                self.members[email] = list(entry)
+
+    def read(self):
+        empty = {"account": self.account, "listed_at": 0.0, "members": {}}
+        if not os.path.isfile(self.path):
+            return empty
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            print("Ignoring unreadable member cache " + self.path + ".")
+            return empty
+        # A cache of another account is replaced rather than merged
+        if data.get("account") != self.account:
+            return empty
+        return data
+
+    # Other processes may have saved the same cache since it was loaded, so
+    # their newer entries are kept. The file is replaced in one step
+    def save(self):
+        if self.path is None or not self.changed:
+            return
+        data = self.read()
+        with self.lock:
+            members = data["members"]
+            for email, entry in self.members.items():
+                if email in self.invalidated:
+                    members.pop(email, None)
+                elif entry[0] is not None:
+                    if email not in members or members[email][1] < entry[1]:
+                        members[email] = entry
+            data["listed_at"] = max(data["listed_at"], self.listed_at)
+            self.changed = False
+        directory = os.path.dirname(self.path)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+        temp_path = self.path + "." + str(os.getpid()) + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.path)
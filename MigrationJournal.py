@@ -0,0 +1,110 @@
+import json
+import os
+import threading
+import time
+
+
+class MigrationJournal:
+    path = None
+    completed = set()
+    buffer = []
+    batch_size = 100
+    flush_interval = 1.0
+    last_flush = 0.0
+    skipped = 0
+    replaced = 0
+    journal_file = None
+    lock = None
+
+    # Every completed resource is appended as a [kind, key] JSON line. Lines
+    # are written and fsynced in batches, so a crash loses at most one batch,
+    # and those resources are simply migrated again on the next retry.
+    # Without a path, completed resources are only kept for this run
+    def __init__(self, path=None, batch_size=100, flush_interval=1.0):
+        self.path = path
+        self.completed = set()
+        self.buffer = []
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.skipped = 0
+        self.replaced = 0
+        self.lock = threading.Lock()
+
+    ##################################################
+    # Open the journal, keeping earlier entries when resuming
+    ##################################################
+
+    # When resuming, returns the number of completed resources read back.
+    # Otherwise an earlier journal is started over and replaced counts it
+    def open(self, resume=False):
+        self.completed = set()
+        self.skipped = 0
+        self.replaced = 0
+        if self.path is None:
+            return 0
+        if not os.path.isfile(self.path):
+            self.journal_file = open(self.path, "w")
+            self.last_flush = time.time()
+            return 0
+
+        line = ""
+        entries = set()
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    kind, key = json.loads(line)
+                except ValueError:
+                    # A crash can leave the last line half written
+                    continue
+                entries.add((kind, key))
+        if resume:
+            self.completed = entries
+            self.journal_file = open(self.path, "a")
+            if line != "" and not line.endswith("\n"):
+                self.journal_file.write("\n")
+        else:
+            self.replaced = len(entries)
+            self.journal_file = open(self.path, "w")
+        self.last_flush = time.time()
+        return len(self.completed)
+
+    def close(self):
+        with self.lock:
+            if self.journal_file is None:
+                return
+            self.write_buffer()
+            self.journal_file.close()
+            self.journal_file = None
+
+    ##################################################
+    # Record and look up completed resources
+    ##################################################
+
+    def record(self, kind, key):
+        with self.lock:
+            self.completed.add((kind, key))
+            if self.journal_file is None:
+                return
+            self.buffer.append(json.dumps([kind, key]) + "\n")
+            if (
+                len(self.buffer) >= self.batch_size
+                or time.time() - self.last_flush >= self.flush_interval
+            ):
+                self.write_buffer()
+
+    # Returns True, and counts the skip, when an earlier run already
+    # completed the resource
+    def skip(self, kind, key):
+        with self.lock:
+            if (kind, key) not in self.completed:
+                return False
+            self.skipped += 1
+            return True
+
+    def write_buffer(self):
+        if len(self.buffer) > 0:
+            self.journal_file.write("".join(self.buffer))
+            self.journal_file.flush()
+            os.fsync(self.journal_file.fileno())
+            self.buffer = []
+        self.last_flush = time.time()
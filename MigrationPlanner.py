@@ -0,0 +1,371 @@
+import copy
+import math
+import statistics
+import time
+from Pagination import Pagination
+from PhaseScheduler import PhaseScheduler
+from SegmentGraph import SegmentGraph
+
+
+class MigrationPlanner:
+    migrator = None
+    pagination = None
+    phase = ""
+    calls = {}
+    payloads = []
+    latency = {}
+    rates = {}
+    estimates = {}
+    segment_widths = []
+    setup_time = 0.0
+    num_probes = 3
+    num_largest = 10
+    # Phases the sync engine runs on a worker pool. The async engine fans out
+    # every phase but the project
+    sync_parallel_phases = ["environments", "metrics", "segments", "targeting rules"]
+
+    # Works out what migrate() would do from the cheap listings only: no
+    # flag details are read and nothing is written to the target
+    def __init__(self, migrator):
+        self.migrator = migrator
+        self.pagination = Pagination()
+        self.calls = {}
+        self.payloads = []
+        self.latency = {}
+        self.rates = {}
+        self.estimates = {}
+        self.segment_widths = []
+
+    ##################################################
+    # Plan the migration
+    ##################################################
+
+    def plan(self):
+        m = self.migrator
+        print("Getting source flag keys and environment keys...", flush=True)
+        started = time.time()
+        setup = PhaseScheduler()
+        setup.add("source flag keys", m.load_source_flag_keys)
+        setup.add("source environment keys", m.load_source_environment_keys)
+        setup.run()
+        self.setup_time = time.time() - started
+
+        scheduler = PhaseScheduler()
+        m.add_migration_phases(scheduler, self)
+        for name in scheduler.order:
+            self.calls[name] = {}
+            print("Planning " + name + "...", flush=True)
+            self.phase = name
+            scheduler.phases[name].func()
+
+        self.measure_latency()
+        self.estimate(scheduler)
+        self.print_report(scheduler)
+        return self.get_result(scheduler)
+
+    ##################################################
+    # Count the calls and payloads of each phase
+    ##################################################
+
+    def count(self, host, method, num=1):
+        calls = self.calls[self.phase]
+        key = host + " " + method
+        calls[key] = calls.get(key, 0) + num
+
+    def count_pages(self, host, path, num_items):
+        limit = 20
+        resource = self.pagination.resource(path)
+        if resource is not None:
+            limit = self.pagination.page_limits[resource]
+        self.count(host, "GET", max(1, math.ceil(num_items / limit)))
+
+    def count_patch(self, key, payload):
+        chunks = self.migrator.patch_chunker.chunk(payload)
+        self.count("target", "PATCH", max(1, len(chunks)))
+        self.add_payload(key, payload, len(chunks))
+
+    def add_payload(self, key, payload, num_chunks=1):
+        self.payloads.append(
+            {
+                "phase": self.phase,
+                "key": key,
+                "bytes": self.migrator.patch_chunker.size(payload),
+                "requests": num_chunks,
+            }
+        )
+
+    def create_target_project(self):
+        m = self.migrator
+        self.count("source", "GET")
+        payload = m.build_project_payload(m.get_source_project())
+        self.count("target", "POST")
+        self.add_payload(m.project_key_target, payload)
+
+    def create_target_flag_templates(self):
+        m = self.migrator
+        self.count("source", "GET")
+        for template in m.get_source_flag_templates()["items"]:
+            if template["key"] in ["ai-prompt", "ai-model"]:
+                continue
+            self.count_patch(template["key"], m.build_flag_template_payload(template))
+
+    def create_target_context_kinds(self):
+        m = self.migrator
+        self.count("source", "GET", 2)
+        for kind in m.get_source_context_kinds()["items"]:
+            self.count("target", "PUT")
+            self.add_payload(kind["key"], m.build_context_kind_payload(kind))
+        self.count("target", "PUT")
+
+    def create_target_payload_filters(self):
+        m = self.migrator
+        path = "/projects/" + m.project_key_source + "/payload-filters?limit=20"
+        filters = list(m.get_source_payload_filters())
+        self.count_pages("source", path, len(filters))
+        for filter in filters:
+            self.count("target", "POST")
+            self.add_payload(filter["key"], m.build_payload_filter_payload(filter))
+
+    def create_target_environments(self):
+        m = self.migrator
+        existing = m.get_target_environments()
+        path = "/projects/" + m.project_key_target + "/environments"
+        self.count_pages("target", path, len(existing))
+        for env in m.get_source_environments():
+            approvals = m.build_environment_approvals_payload(env)
+            if env["key"] in existing:
+                self.count_patch(
+                    env["key"], m.build_environment_patch_payload(env) + approvals
+                )
+            else:
+                self.count("target", "POST")
+                self.add_payload(env["key"], m.build_environment_post_payload(env))
+                # At most: approvals matching the new environment's defaults
+                # are not patched
+                self.count_patch(env["key"], approvals)
+
+    def create_target_metrics(self):
+        m = self.migrator
+        path = "/metrics/" + m.project_key_source
+        num = 0
+        for page in m.list_source_metric_pages():
+            for item in page:
+                num += 1
+                self.count("target", "POST")
+                if m.has_metric_details(item):
+                    self.add_payload(item["key"], m.build_metric_payload(item))
+                else:
+                    self.count("source", "GET")
+        self.count_pages("source", path, num)
+
+    def create_target_metric_groups(self):
+        m = self.migrator
+        path = "/projects/" + m.project_key_source + "/metric-groups"
+        groups = list(m.get_source_metric_groups())
+        self.count_pages("source", path, len(groups))
+        for group in groups:
+            self.count("target", "POST")
+            self.add_payload(group["key"], group)
+
+    def create_target_segments(self):
+        m = self.migrator
+        for env in m.get_source_segments():
+            segments = list(env["segments"])
+            graph = SegmentGraph(segments)
+            # Only segments which cannot be ordered get their rules separately
+            unordered = graph.unordered
+            # The most segments of the environment created at once
+            self.segment_widths.append(
+                max([len(level) for level in graph.levels] + [len(unordered), 1])
+            )
+            for segment in segments:
+                key = env["environment"] + "/" + segment["key"]
+                self.count("target", "POST")
+                if not m.has_segment_details(segment):
+                    # Sized only once the details are read, so one PATCH each
+                    self.count("source", "GET")
+                    self.count("target", "PATCH")
+                    continue
+                payload, rules_payload = m.build_segment_patch_payload(
+                    copy.deepcopy(segment)
+                )
+                if rules_payload is not None and segment["key"] not in unordered:
+                    payload = payload + rules_payload
+                    rules_payload = None
+                if len(payload) > 0:
+                    self.count_patch(key, payload)
+                if rules_payload is not None:
+                    self.count_patch(key, rules_payload)
+            path = "/segments/" + m.project_key_source + "/" + env["environment"]
+            self.count_pages("source", path, len(segments))
+
+    def create_target_flags(self):
+        m = self.migrator
+        self.count_pages("source", "/flags/" + m.project_key_source, len(m.flag_keys))
+        for flag in m.get_source_flags():
+            self.count("target", "POST")
+            self.add_payload(flag["key"], m.build_flag_payload(flag))
+            if len(m.build_flag_update_payload(flag)) > 0:
+                self.count("target", "PATCH")
+
+    # Flag details are the expensive read, so the targeting is not sized and
+    # each flag counts as one PATCH
+    def create_target_flag_environments(self):
+        m = self.migrator
+        self.count("source", "GET", len(m.flag_keys))
+        self.count("target", "PATCH", len(m.flag_keys))
+
+    ##################################################
+    # Estimate the wall time of each phase
+    ##################################################
+
+    def measure_latency(self):
+        m = self.migrator
+        probes = {
+            "source": (m.http_source, "/projects/" + m.project_key_source),
+            "target": (m.http_target, "/members?limit=1"),
+        }
+        for host, (http, path) in probes.items():
+            timings = []
+            for _ in range(self.num_probes):
+                started = time.time()
+                http.get(path)
+                timings.append(time.time() - started)
+            self.latency[host] = statistics.median(timings)
+            self.rates[host] = None
+            if http.rate_limiter is not None:
+                self.rates[host] = http.rate_limiter.get_rate()
+
+    def get_parallel(self, name):
+        m = self.migrator
+        parallel = 1
+        if m.engine == "async" and name != "project":
+            parallel = m.concurrency
+        elif name in self.sync_parallel_phases:
+            parallel = m.concurrency
+        # Segments are created a level of SegmentGraph at a time. The sync
+        # engine goes through the environments one by one, and the async
+        # engine through all of them at once
+        if name == "segments" and len(self.segment_widths) > 0:
+            width = max(self.segment_widths)
+            if m.engine == "async":
+                width = sum(self.segment_widths)
+            parallel = min(parallel, width)
+        return parallel
+
+    # A phase takes as long as its requests at the measured latency spread
+    # over its workers, or as long as the rate limit allows, whichever is
+    # longer. Phases then start once the phases they depend on finish
+    def estimate(self, scheduler):
+        scheduler.started = 0.0
+        scheduler.finished = 0.0
+        for name in scheduler.order:
+            by_host = {"source": 0, "target": 0}
+            for key, num in self.calls[name].items():
+                by_host[key.split(" ")[0]] += num
+            latency_time = (
+                sum(by_host[host] * self.latency[host] for host in by_host)
+                / self.get_parallel(name)
+            )
+            # Each method is a separate route with its own budget
+            rate_time = 0.0
+            for key, num in self.calls[name].items():
+                rate = self.rates[key.split(" ")[0]]
+                if rate is not None and rate > 0:
+                    rate_time = max(rate_time, num / rate)
+            self.estimates[name] = max(latency_time, rate_time)
+
+            phase = scheduler.phases[name]
+            deps = scheduler.get_dependencies(name)
+            phase.started = max([scheduler.phases[dep].finished for dep in deps] + [0.0])
+            phase.finished = phase.started + self.estimates[name]
+            scheduler.finished = max(scheduler.finished, phase.finished)
+
+    ##################################################
+    # Report
+    ##################################################
+
+    def get_largest_payloads(self):
+        return sorted(self.payloads, key=lambda p: p["bytes"], reverse=True)[
+            : self.num_largest
+        ]
+
+    def print_report(self, scheduler):
+        m = self.migrator
+        print("")
+        print(
+            "Migration plan for "
+            + str(len(m.flag_keys))
+            + " flags in "
+            + str(len(m.env_keys))
+            + " environments ("
+            + m.engine
+            + " engine, concurrency "
+            + str(m.concurrency)
+            + "):"
+        )
+        for name in scheduler.order:
+            calls = ", ".join(
+                str(num) + " " + key for key, num in sorted(self.calls[name].items())
+            )
+            print(
+                "  - "
+                + name.ljust(24)
+                + str(round(scheduler.phases[name].started, 1)).rjust(9)
+                + "s start"
+                + str(round(self.estimates[name], 1)).rjust(9)
+                + "s   "
+                + calls
+            )
+        print(
+            "  Critical path: "
+            + " -> ".join(scheduler.get_critical_path())
+            + " ("
+            + str(round(scheduler.finished, 1))
+            + "s estimated wall time, plus "
+            + str(round(self.setup_time, 1))
+            + "s of setup listings)"
+        )
+        for host in ["source", "target"]:
+            rate = "no rate limit headers seen"
+            if self.rates[host] is not None:
+                rate = str(round(self.rates[host], 1)) + " requests/s allowed"
+            print(
+                "  "
+                + host.capitalize()
+                + ": "
+                + str(round(self.latency[host] * 1000))
+                + "ms per request, "
+                + rate
+            )
+        print("Largest payloads:")
+        for payload in self.get_largest_payloads():
+            print(
+                "  - "
+                + (payload["phase"] + " " + payload["key"]).ljust(48)
+                + str(payload["bytes"]).rjust(10)
+                + " bytes"
+                + str(payload["requests"]).rjust(5)
+                + " request(s)"
+            )
+        print("")
+
+    def get_result(self, scheduler):
+        phases = {}
+        for name in scheduler.order:
+            phases[name] = {
+                "calls": self.calls[name],
+                "start": round(scheduler.phases[name].started, 3),
+                "estimate": round(self.estimates[name], 3),
+            }
+        return {
+            "total_flags": len(self.migrator.flag_keys),
+            "total_environments": len(self.migrator.env_keys),
+            "total_calls": sum(
+                num for calls in self.calls.values() for num in calls.values()
+            ),
+            "phases": phases,
+            "critical_path": scheduler.get_critical_path(),
+            "estimated_wall_time": round(scheduler.finished + self.setup_time, 3),
+            "largest_payloads": self.get_largest_payloads(),
+        }
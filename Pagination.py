@@ -0,0 +1,70 @@
+from urllib.parse import parse_qsl, urlencode
+
+
+class Pagination:
+    # Largest page each list endpoint accepts. These endpoints also take an
+    # offset, so once the first page gives the totalCount every other page
+    # can be requested at the same time
+    page_limits = {
+        "flags": 100,
+        "environments": 100,
+        "segments": 50,
+        "metrics": 50,
+        "metric-groups": 50,
+        "members": 1000,
+    }
+
+    def resource(self, path):
+        parts = path.split("?")[0].strip("/").split("/")
+        match parts:
+            case ["flags", _]:
+                return "flags"
+            case ["projects", _, "environments"]:
+                return "environments"
+            case ["segments", _, _]:
+                return "segments"
+            case ["metrics", _]:
+                return "metrics"
+            case ["projects", _, "metric-groups"]:
+                return "metric-groups"
+            case ["members"]:
+                return "members"
+        return None
+
+    ##################################################
+    # Page paths
+    ##################################################
+
+    # The limit in a listing path is raised to the largest page the endpoint
+    # accepts
+    def first_path(self, path):
+        resource = self.resource(path)
+        if resource is None:
+            return path
+        return self.with_query(path, limit=self.page_limits[resource])
+
+    # Paths for every page after the first, in order, or None when the
+    # listing can only be followed through _links.next
+    def offset_paths(self, path, data):
+        if self.resource(path) is None or "totalCount" not in data:
+            return None
+        # The server may cap the limit, so the first page sets the page size
+        page_size = len(data.get("items", []))
+        if page_size == 0 or page_size >= data["totalCount"]:
+            return []
+        return [
+            self.with_query(path, limit=page_size, offset=offset)
+            for offset in range(page_size, data["totalCount"], page_size)
+        ]
+
+    def next_path(self, data, version):
+        if "next" not in data.get("_links", {}):
+            return None
+        return data["_links"]["next"]["href"].replace("/api/" + version, "")
+
+    def with_query(self, path, **params):
+        base, _, query = path.partition("?")
+        query = dict(parse_qsl(query, keep_blank_values=True))
+        for key, value in params.items():
+            query[key] = str(value)
+        return base + "?" + urlencode(query)
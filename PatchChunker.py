@@ -0,0 +1,136 @@
+import json
+
+
+class PatchChunker:
+    max_bytes = 256 * 1024
+    encoder = None
+
+    # Splits a JSON Patch into patches of at most max_bytes which are applied
+    # one after another. Ops for the same environment (or the same top-level
+    # field) are kept in one patch when they fit. An op that is too large on
+    # its own keeps as much of its value as fits in one patch, and the rest
+    # is added back by later ops, so long target lists are sent in slices
+    def __init__(self, max_bytes=256 * 1024):
+        self.max_bytes = max_bytes
+        # Sizes are measured the way the HTTP clients serialize json= bodies
+        self.encoder = json.JSONEncoder()
+
+    ##################################################
+    # Split a patch into bounded chunks
+    ##################################################
+
+    def chunk(self, ops):
+        chunks = []
+        current = []
+        current_size = 2
+        for group in self.groups(ops):
+            group = [split for op in group for split in self.split_op(op)]
+            # Start a new chunk rather than split a group that would fit in one
+            group_size = sum(op_size + 2 for _, op_size in group)
+            if len(current) > 0 and current_size + group_size > self.max_bytes:
+                chunks.append(current)
+                current = []
+                current_size = 2
+            for op, op_size in group:
+                if len(current) > 0 and current_size + op_size + 2 > self.max_bytes:
+                    chunks.append(current)
+                    current = []
+                    current_size = 2
+                current.append(op)
+                current_size += op_size + 2
+        if len(current) > 0:
+            chunks.append(current)
+        return chunks
+
+    # Consecutive ops on the same environment, or the same top-level field
+    def groups(self, ops):
+        groups = []
+        last_key = None
+        for op in ops:
+            key = self.group_key(op["path"])
+            if len(groups) == 0 or key != last_key:
+                groups.append([])
+                last_key = key
+            groups[-1].append(op)
+        return groups
+
+    def group_key(self, path):
+        parts = path.strip("/").split("/")
+        if parts[0] == "environments" and len(parts) > 1:
+            return "/".join(parts[:2])
+        return parts[0]
+
+    ##################################################
+    # Split a single op which is too large
+    ##################################################
+
+    # Returns (op, serialized size) pairs. An op which is too large must be
+    # sent in a chunk of its own, inside the [] of the patch
+    def split_op(self, op):
+        size = self.size(op)
+        if op["op"] not in ["add", "replace"] or not self.too_large(size):
+            return [(op, size)]
+        if not isinstance(op["value"], (list, dict)):
+            print(
+                "...patch op for "
+                + op["path"]
+                + " is "
+                + str(size)
+                + " bytes, over the limit of "
+                + str(self.max_bytes)
+            )
+            return [(op, size)]
+        empty = {"op": op["op"], "path": op["path"], "value": type(op["value"])()}
+        first, rest = self.shell(op["value"], self.max_bytes - 2 - self.size(empty))
+        first = {"op": op["op"], "path": op["path"], "value": first}
+        return [(first, self.size(first))] + self.fill(op["path"], rest)
+
+    # The value cut down to the budget, and what was left out of it. A list
+    # keeps the leading elements which fit and an object the members which fit
+    def shell(self, value, budget):
+        if isinstance(value, list):
+            length = self.shell_length(value, budget)
+            return value[:length], list(enumerate(value))[length:]
+        first = {}
+        rest = []
+        for key, item in value.items():
+            # The ": " and ", " around the member
+            item_size = self.size(key) + self.size(item) + 4
+            if item_size <= budget:
+                first[key] = item
+                budget -= item_size
+            else:
+                rest.append((self.escape(key), item))
+        return first, rest
+
+    # The ops which add back what shell() left out. List elements are added
+    # in order, so those which fit are appended
+    def fill(self, path, rest):
+        ops = []
+        for key, item in rest:
+            if isinstance(key, int):
+                op = {"op": "add", "path": path + "/-", "value": item}
+                size = self.size(op)
+                if not self.too_large(size):
+                    ops.append((op, size))
+                    continue
+            op = {"op": "add", "path": path + "/" + str(key), "value": item}
+            ops.extend(self.split_op(op))
+        return ops
+
+    def shell_length(self, items, budget):
+        for i, item in enumerate(items):
+            # The ", " between elements
+            budget -= self.size(item) + 2
+            if budget < 0:
+                return i
+        return len(items)
+
+    def too_large(self, size):
+        return size + 2 > self.max_bytes
+
+    def size(self, value):
+        return len(self.encoder.encode(value))
+
+    def escape(self, key):
+        return key.replace("~", "~0").replace("/", "~1")
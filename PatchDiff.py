@@ -0,0 +1,76 @@
+class PatchDiff:
+    # Keys the API generates (e.g. _id, _version, _links) are never sent by
+    # the migrator, so they are ignored when comparing
+    def normalize(self, value):
+        if isinstance(value, dict):
+            return {
+                key: self.normalize(item)
+                for key, item in value.items()
+                if not key.startswith("_")
+            }
+        if isinstance(value, list):
+            return [self.normalize(item) for item in value]
+        return value
+
+    ##################################################
+    # Drop the ops the target already matches
+    ##################################################
+
+    def diff(self, target, ops):
+        minimal = []
+        target = self.normalize(target)
+        for op in ops:
+            if op["op"] not in ["add", "replace"]:
+                minimal.append(op)
+                continue
+            found, current = self.resolve(target, op["path"])
+            if not found:
+                minimal.append(op)
+                continue
+            minimal.extend(
+                self.diff_value(op, op["path"], current, self.normalize(op["value"]))
+            )
+        return minimal
+
+    # Objects are compared key by key so only the changed fields are sent.
+    # Lists, or objects the target has extra keys in, are replaced whole
+    # exactly as the original op would have done
+    def diff_value(self, op, path, current, value):
+        if current == value:
+            return []
+        if (
+            not isinstance(current, dict)
+            or not isinstance(value, dict)
+            or not set(current).issubset(value)
+        ):
+            if path == op["path"]:
+                return [op]
+            return [{"op": "replace", "path": path, "value": value}]
+
+        ops = []
+        for key, item in value.items():
+            item_path = path + "/" + self.escape(key)
+            if key in current:
+                ops.extend(self.diff_value(op, item_path, current[key], item))
+            else:
+                ops.append({"op": "add", "path": item_path, "value": item})
+        return ops
+
+    ##################################################
+    # JSON Pointer helpers
+    ##################################################
+
+    def resolve(self, document, path):
+        current = document
+        for part in path.strip("/").split("/"):
+            part = part.replace("~1", "/").replace("~0", "~")
+            if isinstance(current, dict) and part in current:
+                current = current[part]
+            elif isinstance(current, list) and part.isdigit() and int(part) < len(current):
+                current = current[int(part)]
+            else:
+                return False, None
+        return True, current
+
+    def escape(self, key):
+        return key.replace("~", "~0").replace("/", "~1")
@@ -0,0 +1,206 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from RequestMetrics import current_phase
+from Tracer import Tracer
+
+
+class Phase:
+    name = ""
+    func = None
+    depends_on = []
+    started = 0.0
+    finished = 0.0
+
+    def __init__(self, name, func, depends_on=None):
+        self.name = name
+        self.func = func
+        self.depends_on = depends_on if depends_on is not None else []
+        self.started = 0.0
+        self.finished = 0.0
+
+    def duration(self):
+        return self.finished - self.started
+
+
+class PhaseScheduler:
+    phases = {}
+    order = []
+    started = 0.0
+    finished = 0.0
+    tracer = None
+
+    def __init__(self, tracer=None):
+        self.phases = {}
+        self.order = []
+        if tracer is None:
+            tracer = Tracer()
+        self.tracer = tracer
+
+    ##################################################
+    # Register a phase and the phases it waits for
+    ##################################################
+
+    def add(self, name, func, depends_on=None):
+        self.phases[name] = Phase(name, func, depends_on)
+        self.order.append(name)
+
+    # Dependencies on phases that were never added (e.g. disabled in
+    # app.ini) are treated as already satisfied
+    def get_dependencies(self, name):
+        return [dep for dep in self.phases[name].depends_on if dep in self.phases]
+
+    def get_ready(self, done, running):
+        ready = []
+        for name in self.order:
+            if name in done or name in running:
+                continue
+            if all(dep in done for dep in self.get_dependencies(name)):
+                ready.append(name)
+        return ready
+
+    def validate(self):
+        for name in self.order:
+            for dep in self.phases[name].depends_on:
+                if dep == name:
+                    raise ValueError("Phase " + name + " depends on itself")
+        # Every phase must become ready eventually
+        done = set()
+        while len(done) < len(self.order):
+            ready = self.get_ready(done, set())
+            if len(ready) == 0:
+                pending = [name for name in self.order if name not in done]
+                raise ValueError("Circular phase dependencies: " + ", ".join(pending))
+            done.update(ready)
+
+    ##################################################
+    # Run phases on threads as soon as their dependencies finish
+    ##################################################
+
+    def run(self, max_workers=None):
+        self.validate()
+        if max_workers is None:
+            max_workers = max(1, len(self.order))
+        done = set()
+        running = {}
+        self.started = time.time()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while len(done) < len(self.order):
+                for name in self.get_ready(done, running.values()):
+                    future = executor.submit(self.run_phase, self.phases[name])
+                    running[future] = name
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    # Surface the first failure instead of starting dependents
+                    future.result()
+                    done.add(name)
+        self.finished = time.time()
+        return self.get_timings()
+
+    # Requests made by the phase, including on the pools it starts, are
+    # attributed to it in RequestMetrics
+    def run_phase(self, phase):
+        token = current_phase.set(phase.name)
+        phase.started = time.time()
+        print("Starting " + phase.name + "...", flush=True)
+        try:
+            with self.tracer.span(phase.name, "phase"):
+                phase.func()
+        finally:
+            phase.finished = time.time()
+            current_phase.reset(token)
+        self.print_finished(phase)
+
+    def print_finished(self, phase):
+        print(
+            "Finished "
+            + phase.name
+            + " in "
+            + str(round(phase.duration(), 2))
+            + "s.",
+            end="\n\n",
+            flush=True,
+        )
+
+    ##################################################
+    # Run coroutine phases on the event loop
+    ##################################################
+
+    async def run_async(self):
+        self.validate()
+        tasks = {}
+        self.started = time.time()
+
+        async def run_phase(phase):
+            deps = [tasks[dep] for dep in self.get_dependencies(phase.name)]
+            if len(deps) > 0:
+                await asyncio.gather(*deps)
+            # Each task runs in its own copy of the context
+            current_phase.set(phase.name)
+            phase.started = time.time()
+            print("Starting " + phase.name + "...", flush=True)
+            try:
+                with self.tracer.span(phase.name, "phase"):
+                    await phase.func()
+            finally:
+                phase.finished = time.time()
+            self.print_finished(phase)
+
+        for name in self.order:
+            tasks[name] = asyncio.ensure_future(run_phase(self.phases[name]))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        self.finished = time.time()
+        return self.get_timings()
+
+    ##################################################
+    # Timing report
+    ##################################################
+
+    def get_timings(self):
+        timings = {}
+        for name in self.order:
+            timings[name] = round(self.phases[name].duration(), 3)
+        return timings
+
+    # The chain of phases that determined the total wall time
+    def get_critical_path(self):
+        if len(self.order) == 0:
+            return []
+        name = max(self.order, key=lambda n: self.phases[n].finished)
+        path = [name]
+        while True:
+            deps = self.get_dependencies(name)
+            if len(deps) == 0:
+                break
+            name = max(deps, key=lambda n: self.phases[n].finished)
+            path.insert(0, name)
+        return path
+
+    def print_report(self):
+        print("Phase timings:")
+        for name in self.order:
+            phase = self.phases[name]
+            print(
+                "  - "
+                + name.ljust(24)
+                + str(round(phase.started - self.started, 2)).rjust(9)
+                + "s start"
+                + str(round(phase.duration(), 2)).rjust(9)
+                + "s"
+            )
+        total = round(self.finished - self.started, 2)
+        print(
+            "  Critical path: "
+            + " -> ".join(self.get_critical_path())
+            + " ("
+            + str(total)
+            + "s wall time)"
+        )
+        print("")
@@ -0,0 +1,433 @@
+import math
+import multiprocessing
+import threading
+import time
+
+
+class TokenBucket:
+    tokens = None
+    capacity = 0
+    reset_at = 0.0
+    window = 0.0
+    server_reset = 0.0
+    latency = 0.0
+    known = False
+    probe_at = None
+    probe_timeout = 5.0
+    lock = None
+
+    def __init__(self):
+        self.tokens = None
+        self.capacity = 0
+        self.reset_at = 0.0
+        self.window = 0.0
+        self.server_reset = 0.0
+        self.latency = 0.0
+        self.known = False
+        self.probe_at = None
+        self.lock = threading.Lock()
+
+    ##################################################
+    # Take a token, returning how long to wait first
+    ##################################################
+
+    # Past the budget, tokens goes negative: each reservation is pushed out
+    # by whole windows, so no more than capacity of them are sent in any
+    # window after the reset. Until the budget is known, one request is sent
+    # to learn it, and None is returned to the others to ask again
+    def acquire(self):
+        with self.lock:
+            if self.tokens is None:
+                # The responses carry no rate limit headers for this bucket
+                if self.known:
+                    return 0
+                now = time.time()
+                if self.probe_at is None or now - self.probe_at > self.probe_timeout:
+                    self.probe_at = now
+                    return 0
+                return None
+
+            now = time.time()
+            self.roll(now)
+            # A request sent this close to the reset may be counted in the
+            # next window, so it waits for the reset and takes a token there
+            if self.reset_at - now < self.latency:
+                self.tokens = min(self.tokens, 0)
+
+            wait = 0
+            self.tokens -= 1
+            if self.tokens < 0 and self.reset_at > now:
+                windows = (-self.tokens - 1) // max(1, self.capacity)
+                wait = self.reset_at - now + self.window * windows
+            return wait
+
+    # Hands back a token taken for a request which was not sent
+    def release(self):
+        with self.lock:
+            if self.tokens is None:
+                self.probe_at = None
+            else:
+                self.tokens += 1
+
+    # The server refills the bucket every window, which first pays for the
+    # reservations pushed into it
+    def roll(self, now):
+        if now < self.reset_at or self.tokens >= self.capacity:
+            return
+        if self.window <= 0:
+            self.tokens = self.capacity
+            return
+        windows = (now - self.reset_at) // self.window + 1
+        self.tokens = min(self.capacity, self.tokens + self.capacity * windows)
+        self.reset_at += self.window * windows
+
+    ##################################################
+    # Update the bucket from the rate limit headers
+    ##################################################
+
+    # sent_at is when the request was sent. The window started no earlier,
+    # so the window is never taken to be shorter than it is. server_reset is
+    # the latest reset the server has sent, while reset_at may have been
+    # rolled past it on our own
+    def update(self, remaining, reset_at, sent_at=None):
+        if sent_at is None:
+            sent_at = time.time()
+        with self.lock:
+            self.known = True
+            # The slowest recent response
+            self.latency = max(time.time() - sent_at, self.latency * 0.9)
+            if remaining + 1 > self.capacity:
+                self.capacity = remaining + 1
+            if self.tokens is None:
+                self.tokens = remaining
+                self.reset_at = reset_at
+                self.server_reset = reset_at
+                self.window = max(self.window, reset_at - sent_at)
+                return
+            if reset_at > self.server_reset:
+                if self.reset_at <= self.server_reset:
+                    # The window ended before we rolled it, or the server
+                    # moves its reset with every request: either way its
+                    # budget is back
+                    self.tokens = min(self.capacity, self.tokens + self.capacity)
+                # Otherwise the roll already paid for the new window, and the
+                # server only says when it really ends
+                self.reset_at = reset_at
+                self.server_reset = reset_at
+                # The longest time to a reset seen is the closest to the
+                # length of the window
+                self.window = max(self.window, reset_at - sent_at)
+            elif reset_at < self.server_reset or self.reset_at > self.server_reset:
+                # A response from a window which has already ended
+                return
+            # The server count is current, but does not know about the
+            # reservations already pushed into its window. Responses can
+            # arrive out of order, so the lowest count seen is kept
+            self.tokens = min(self.tokens, remaining)
+
+    # Requests per second the observed budget allows, or None before any
+    # rate limit headers have been seen
+    def rate(self):
+        with self.lock:
+            if self.tokens is None or self.window <= 0:
+                return None
+            return self.capacity / self.window
+
+    # A response without rate limit headers for this bucket ends the probe
+    def settle(self):
+        with self.lock:
+            self.known = True
+
+    # A probe which got no response learned nothing, so the next request
+    # probes straight away rather than after probe_timeout
+    def end_probe(self):
+        with self.lock:
+            if self.tokens is None:
+                self.probe_at = None
+
+    ##################################################
+    # Drain the bucket until the given time
+    ##################################################
+
+    def block_until(self, reset_at):
+        with self.lock:
+            self.tokens = 0 if self.tokens is None else min(self.tokens, 0)
+            if reset_at > self.reset_at:
+                self.reset_at = reset_at
+
+
+class RateLimiter:
+    # Path segments which are part of a route rather than a resource key
+    route_literals = [
+        "api",
+        "v2",
+        "internal",
+        "projects",
+        "environments",
+        "flags",
+        "segments",
+        "metrics",
+        "members",
+        "flag-templates",
+        "flag-defaults",
+        "context-kinds",
+        "payload-filters",
+        "metric-groups",
+        "experimentation-settings",
+        "release-pipelines",
+    ]
+    buckets = {}
+    global_bucket = None
+    probe_interval = 0.01
+    lock = None
+
+    def __init__(self):
+        self.buckets = {}
+        self.global_bucket = TokenBucket()
+        self.lock = threading.Lock()
+
+    ##################################################
+    # Normalize a request path to its route template
+    ##################################################
+
+    def normalize_route(self, http_method, path):
+        path = path.split("?")[0]
+        parts = []
+        for part in path.strip("/").split("/"):
+            if part in self.route_literals:
+                parts.append(part)
+            else:
+                parts.append("*")
+        return http_method + " /" + "/".join(parts)
+
+    def get_bucket(self, route):
+        with self.lock:
+            if route not in self.buckets:
+                self.buckets[route] = TokenBucket()
+            return self.buckets[route]
+
+    ##################################################
+    # Reserve budget for a request, returning how long to wait
+    ##################################################
+
+    # Returns None while a probe is learning the route's or the account's
+    # budget, and the caller asks again after probe_interval
+    def reserve(self, route):
+        bucket = self.get_bucket(route)
+        route_wait = bucket.acquire()
+        if route_wait is None:
+            return None
+        global_wait = self.global_bucket.acquire()
+        if global_wait is None:
+            bucket.release()
+            return None
+        wait = max(global_wait, route_wait)
+        if wait >= 1:
+            print(
+                " --- Rate limit reached for "
+                + route
+                + ". Waiting for "
+                + str(round(wait, 1))
+                + " seconds."
+            )
+        return wait
+
+    ##################################################
+    # Wait until the route and the account have budget
+    ##################################################
+
+    def acquire(self, route):
+        probed = 0.0
+        wait = self.reserve(route)
+        while wait is None:
+            time.sleep(self.probe_interval)
+            probed += self.probe_interval
+            wait = self.reserve(route)
+        if wait > 0:
+            time.sleep(wait)
+        return probed + wait
+
+    ##################################################
+    # Feed the rate limit headers back into the buckets
+    ##################################################
+
+    def update(self, route, headers, sent_at=None):
+        reset_at = self.get_reset_time(headers)
+        if "X-Ratelimit-Route-Remaining" in headers:
+            self.get_bucket(route).update(
+                int(headers["X-Ratelimit-Route-Remaining"]), reset_at, sent_at
+            )
+        else:
+            self.get_bucket(route).settle()
+        if "X-Ratelimit-Global-Remaining" in headers:
+            self.global_bucket.update(
+                int(headers["X-Ratelimit-Global-Remaining"]), reset_at, sent_at
+            )
+        else:
+            self.global_bucket.settle()
+
+    # A request which failed without a response
+    def end_probe(self, route):
+        self.get_bucket(route).end_probe()
+        self.global_bucket.end_probe()
+
+    ##################################################
+    # Requests per second the account allows, as observed so far
+    ##################################################
+
+    # The global budget when the headers include it, otherwise the tightest
+    # route seen. None until a response with rate limit headers arrives
+    def get_rate(self):
+        rate = self.global_bucket.rate()
+        if rate is not None:
+            return rate
+        with self.lock:
+            buckets = list(self.buckets.values())
+        rates = [bucket.rate() for bucket in buckets if bucket.rate() is not None]
+        if len(rates) == 0:
+            return None
+        return min(rates)
+
+    ##################################################
+    # Back off after a 429 response
+    ##################################################
+
+    def throttle(self, route, headers):
+        reset_at = self.get_reset_time(headers)
+        if "Retry-After" in headers:
+            reset_at = max(reset_at, time.time() + float(headers["Retry-After"]))
+        if reset_at <= time.time():
+            reset_at = time.time() + 1
+        if "X-Ratelimit-Global-Remaining" in headers and int(
+            headers["X-Ratelimit-Global-Remaining"]
+        ) <= 0:
+            self.global_bucket.block_until(reset_at)
+        else:
+            self.get_bucket(route).block_until(reset_at)
+
+    def get_reset_time(self, headers):
+        if "X-Ratelimit-Reset" in headers:
+            return int(headers["X-Ratelimit-Reset"]) / 1000
+        return 0.0
+
+
+class SharedTokenBucket(TokenBucket):
+    state = None
+    offset = 0
+
+    # A bucket whose fields live in shared memory, so worker processes using
+    # the same account draw from one budget. The lock is shared with them
+    def __init__(self, state, offset, lock):
+        self.state = state
+        self.offset = offset
+        self.lock = lock
+
+    @property
+    def tokens(self):
+        tokens = self.state[self.offset]
+        if math.isnan(tokens):
+            return None
+        return tokens
+
+    @tokens.setter
+    def tokens(self, tokens):
+        self.state[self.offset] = math.nan if tokens is None else tokens
+
+    @property
+    def capacity(self):
+        return self.state[self.offset + 1]
+
+    @capacity.setter
+    def capacity(self, capacity):
+        self.state[self.offset + 1] = capacity
+
+    @property
+    def reset_at(self):
+        return self.state[self.offset + 2]
+
+    @reset_at.setter
+    def reset_at(self, reset_at):
+        self.state[self.offset + 2] = reset_at
+
+    @property
+    def window(self):
+        return self.state[self.offset + 3]
+
+    @window.setter
+    def window(self, window):
+        self.state[self.offset + 3] = window
+
+    @property
+    def server_reset(self):
+        return self.state[self.offset + 4]
+
+    @server_reset.setter
+    def server_reset(self, server_reset):
+        self.state[self.offset + 4] = server_reset
+
+
+class SharedRateLimiter(RateLimiter):
+    max_routes = 128
+    route_size = 128
+    bucket_size = 5
+    state = None
+
+    # A RateLimiter for one account shared by several processes. The state
+    # is created once with create_state() and handed to every process, and
+    # routes are given a slot in it the first time any process uses them
+    def __init__(self, state):
+        super().__init__()
+        self.state = state
+        self.global_bucket = SharedTokenBucket(state["buckets"], 0, state["lock"])
+
+    @classmethod
+    def create_state(cls, context=None):
+        if context is None:
+            context = multiprocessing.get_context()
+        # Five fields per bucket, with the global bucket first
+        buckets = context.RawArray("d", (cls.max_routes + 1) * cls.bucket_size)
+        for offset in range(0, len(buckets), cls.bucket_size):
+            buckets[offset] = math.nan
+        return {
+            "buckets": buckets,
+            "routes": context.RawArray("c", cls.max_routes * cls.route_size),
+            "num_routes": context.RawValue("i", 0),
+            "lock": context.Lock(),
+        }
+
+    ##################################################
+    # Find or assign the shared slot of a route
+    ##################################################
+
+    def get_bucket(self, route):
+        with self.lock:
+            if route in self.buckets:
+                return self.buckets[route]
+
+        name = route.encode()[: self.route_size]
+        routes = self.state["routes"]
+        num_routes = self.state["num_routes"]
+        with self.state["lock"]:
+            slot = None
+            for i in range(num_routes.value):
+                start = i * self.route_size
+                if routes[start : start + self.route_size].rstrip(b"\0") == name:
+                    slot = i
+                    break
+            if slot is None and num_routes.value < self.max_routes:
+                slot = num_routes.value
+                start = slot * self.route_size
+                routes[start : start + self.route_size] = name.ljust(self.route_size, b"\0")
+                num_routes.value += 1
+
+        if slot is None:
+            # Out of slots: the route is only paced within this process
+            bucket = TokenBucket()
+        else:
+            bucket = SharedTokenBucket(
+                self.state["buckets"],
+                (slot + 1) * self.bucket_size,
+                self.state["lock"],
+            )
+        with self.lock:
+            return self.buckets.setdefault(route, bucket)
@@ -0,0 +1,299 @@
+import contextvars
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# The migration phase requests are attributed to. PhaseScheduler sets it
+# for each phase, and asyncio tasks and ContextExecutor workers inherit it
+current_phase = contextvars.ContextVar("current_phase", default="setup")
+
+
+class ContextExecutor(ThreadPoolExecutor):
+    # Runs each call in a copy of the submitting thread's context, so work
+    # handed to a pool is still attributed to the phase that started it
+    def submit(self, fn, /, *args, **kwargs):
+        context = contextvars.copy_context()
+        return super().submit(context.run, fn, *args, **kwargs)
+
+
+class RouteStats:
+    requests = 0
+    statuses = {}
+    buckets = []
+    seconds = 0.0
+    bytes_sent = 0
+    bytes_received = 0
+    retries = 0
+    retry_seconds = 0.0
+    throttled = 0
+    waits = 0
+    wait_seconds = 0.0
+
+    def __init__(self, num_buckets):
+        self.statuses = {}
+        self.buckets = [0] * num_buckets
+
+
+class RequestMetrics:
+    # Upper bounds of the latency histogram buckets, in seconds
+    latency_buckets = [0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+    stats = {}
+    pauses = {}
+    lock = None
+    encoder = None
+
+    # Counters and latency histograms per phase, host and route template,
+    # shared by every adapter of a migration
+    def __init__(self):
+        self.stats = {}
+        self.pauses = {}
+        self.lock = threading.Lock()
+        # Bodies are measured the way the HTTP clients serialize json=
+        self.encoder = json.JSONEncoder()
+
+    ##################################################
+    # Record requests, retries and waits
+    ##################################################
+
+    def get_stats(self, host, route):
+        method, path = route.split(" ", 1)
+        key = (current_phase.get(), host, method, path)
+        if key not in self.stats:
+            self.stats[key] = RouteStats(len(self.latency_buckets))
+        return self.stats[key]
+
+    def body_size(self, body):
+        if not body:
+            return 0
+        return len(self.encoder.encode(body))
+
+    def record_response(self, host, route, status_code, seconds, sent, received):
+        with self.lock:
+            stats = self.get_stats(host, route)
+            stats.requests += 1
+            stats.statuses[status_code] = stats.statuses.get(status_code, 0) + 1
+            stats.seconds += seconds
+            stats.bytes_sent += sent
+            stats.bytes_received += received
+            for i, bound in enumerate(self.latency_buckets):
+                if seconds <= bound:
+                    stats.buckets[i] += 1
+                    break
+            if status_code == 429:
+                stats.throttled += 1
+
+    # A request which failed without a response and is sent again after
+    # sleeping for the given time
+    def record_retry(self, host, route, seconds):
+        with self.lock:
+            stats = self.get_stats(host, route)
+            stats.retries += 1
+            stats.retry_seconds += seconds
+
+    # Time spent waiting for rate limit budget before a request
+    def record_wait(self, host, route, seconds):
+        if seconds <= 0:
+            return
+        with self.lock:
+            stats = self.get_stats(host, route)
+            stats.waits += 1
+            stats.wait_seconds += seconds
+
+    # Sleeps of the migration itself, such as waiting between attempts to
+    # update environment approval settings
+    def record_pause(self, seconds):
+        with self.lock:
+            phase = current_phase.get()
+            self.pauses[phase] = self.pauses.get(phase, 0.0) + seconds
+
+    ##################################################
+    # Per-phase breakdown
+    ##################################################
+
+    def get_phases(self):
+        phases = {}
+        with self.lock:
+            items = list(self.stats.items())
+            pauses = dict(self.pauses)
+        for (phase, _, _, _), stats in items:
+            if phase not in phases:
+                phases[phase] = self.new_phase()
+            summary = phases[phase]
+            summary["requests"] += stats.requests
+            summary["request_seconds"] += stats.seconds
+            summary["bytes_sent"] += stats.bytes_sent
+            summary["bytes_received"] += stats.bytes_received
+            summary["retries"] += stats.retries
+            summary["retry_seconds"] += stats.retry_seconds
+            summary["throttled"] += stats.throttled
+            summary["rate_limit_waits"] += stats.waits
+            summary["rate_limit_wait_seconds"] += stats.wait_seconds
+            # 429s are sent again, so they are counted as throttled instead
+            summary["errors"] += sum(
+                num
+                for status, num in stats.statuses.items()
+                if status >= 400 and status != 429
+            )
+        for phase, seconds in pauses.items():
+            if phase not in phases:
+                phases[phase] = self.new_phase()
+            phases[phase]["pause_seconds"] += seconds
+        for summary in phases.values():
+            for key, value in summary.items():
+                if isinstance(value, float):
+                    summary[key] = round(value, 3)
+        return phases
+
+    def new_phase(self):
+        return {
+            "requests": 0,
+            "errors": 0,
+            "request_seconds": 0.0,
+            "bytes_sent": 0,
+            "bytes_received": 0,
+            "retries": 0,
+            "retry_seconds": 0.0,
+            "throttled": 0,
+            "rate_limit_waits": 0,
+            "rate_limit_wait_seconds": 0.0,
+            "pause_seconds": 0.0,
+        }
+
+    # Seconds are summed over concurrent requests, so they can exceed the
+    # wall time of the phase. They show where the time went, not how long
+    # the phase took
+    def print_report(self, order):
+        phases = self.get_phases()
+        print("Requests per phase:")
+        for name in [n for n in phases if n not in order] + list(order):
+            if name not in phases:
+                continue
+            summary = phases[name]
+            print(
+                "  - "
+                + name.ljust(24)
+                + str(summary["requests"]).rjust(7)
+                + " requests"
+                + str(round(summary["request_seconds"], 1)).rjust(9)
+                + "s in requests"
+                + str(round(summary["rate_limit_wait_seconds"], 1)).rjust(9)
+                + "s rate limited ("
+                + str(summary["throttled"])
+                + " throttled)"
+                + str(round(summary["retry_seconds"] + summary["pause_seconds"], 1)).rjust(9)
+                + "s sleeping"
+            )
+        print("")
+
+    ##################################################
+    # Prometheus text format
+    ##################################################
+
+    def write_prometheus(self, path):
+        with open(path, "w") as f:
+            f.write(self.get_prometheus())
+
+    def get_prometheus(self):
+        with self.lock:
+            items = sorted(self.stats.items())
+            pauses = sorted(self.pauses.items())
+        lines = []
+
+        def family(name, kind, help):
+            lines.append("# HELP " + name + " " + help)
+            lines.append("# TYPE " + name + " " + kind)
+
+        def sample(name, labels, value):
+            text = ",".join(k + '="' + self.escape(str(v)) + '"' for k, v in labels)
+            lines.append(name + "{" + text + "} " + self.format_value(value))
+
+        family("ldmigrate_requests_total", "counter", "HTTP responses received.")
+        for key, stats in items:
+            for status, num in sorted(stats.statuses.items()):
+                sample(
+                    "ldmigrate_requests_total",
+                    self.labels(key) + [("status", status)],
+                    num,
+                )
+
+        family(
+            "ldmigrate_request_duration_seconds",
+            "histogram",
+            "Time from sending a request to reading its response.",
+        )
+        for key, stats in items:
+            labels = self.labels(key)
+            count = 0
+            for bound, num in zip(self.latency_buckets, stats.buckets):
+                count += num
+                sample(
+                    "ldmigrate_request_duration_seconds_bucket",
+                    labels + [("le", self.format_value(bound))],
+                    count,
+                )
+            sample(
+                "ldmigrate_request_duration_seconds_bucket",
+                labels + [("le", "+Inf")],
+                stats.requests,
+            )
+            sample("ldmigrate_request_duration_seconds_sum", labels, stats.seconds)
+            sample("ldmigrate_request_duration_seconds_count", labels, stats.requests)
+
+        counters = [
+            ("ldmigrate_sent_bytes_total", "bytes_sent", "JSON request body bytes sent."),
+            (
+                "ldmigrate_received_bytes_total",
+                "bytes_received",
+                "Response body bytes received.",
+            ),
+            (
+                "ldmigrate_retries_total",
+                "retries",
+                "Requests sent again after failing without a response.",
+            ),
+            (
+                "ldmigrate_retry_sleep_seconds_total",
+                "retry_seconds",
+                "Time slept before retrying failed requests.",
+            ),
+            (
+                "ldmigrate_throttled_total",
+                "throttled",
+                "Responses with status 429.",
+            ),
+            (
+                "ldmigrate_rate_limit_waits_total",
+                "waits",
+                "Requests delayed to stay within the rate limit.",
+            ),
+            (
+                "ldmigrate_rate_limit_wait_seconds_total",
+                "wait_seconds",
+                "Time spent waiting for rate limit budget.",
+            ),
+        ]
+        for name, field, help in counters:
+            family(name, "counter", help)
+            for key, stats in items:
+                sample(name, self.labels(key), getattr(stats, field))
+
+        family(
+            "ldmigrate_pause_seconds_total",
+            "counter",
+            "Time the migration slept between attempts of its own.",
+        )
+        for phase, seconds in pauses:
+            sample("ldmigrate_pause_seconds_total", [("phase", phase)], seconds)
+        return "\n".join(lines) + "\n"
+
+    def labels(self, key):
+        phase, host, method, path = key
+        return [("phase", phase), ("host", host), ("method", method), ("route", path)]
+
+    def format_value(self, value):
+        if isinstance(value, float):
+            return repr(round(value, 6))
+        return str(value)
+
+    def escape(self, value):
+        return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,218 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+
+##################################################
+# On-disk cache layout
+#
+#   <key>   one line of JSON with the response's validators, then the
+#           zlib-compressed response body
+#
+# The file's modification time is its last use, so the least recently used
+# entries are evicted first, also by later runs
+##################################################
+
+
+class ResponseCache:
+    path = ""
+    max_bytes = 256 * 1024 * 1024
+    entries = None
+    total_bytes = 0
+    hits = 0
+    misses = 0
+    stores = 0
+    evictions = 0
+    bytes_saved = 0
+    lock = None
+
+    # Keeps GET responses which carry an ETag or Last-Modified header, and
+    # sends their validators with the next GET of the same URL, so an
+    # unchanged resource comes back as a 304 without a body. Entries are
+    # evicted least recently used first once they take up max_bytes
+    def __init__(self, path, max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self.load_index()
+
+    def load_index(self):
+        files = []
+        for name in os.listdir(self.path):
+            if name.endswith(".tmp"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            files.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self.entries[name] = size
+            self.total_bytes += size
+        self.evict()
+
+    ##################################################
+    # Look up a URL before requesting it
+    ##################################################
+
+    # Responses depend on the token and API version as well as the URL
+    def key(self, url, params, headers):
+        parts = [
+            headers.get("Authorization", ""),
+            headers.get("LD-API-Version", ""),
+            url,
+            json.dumps(params, sort_keys=True),
+        ]
+        return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+    # Returns the cached entry and adds its validators to the headers
+    def prepare(self, key, headers):
+        entry = self.get(key)
+        if entry is None:
+            return None
+        if entry["etag"] is not None:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"] is not None:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return entry
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+        file_path = os.path.join(self.path, key)
+        try:
+            with open(file_path, "rb") as f:
+                entry = json.loads(f.readline())
+                entry["body"] = zlib.decompress(f.read())
+        # Evicted by another process, or cut short
+        except (OSError, ValueError, zlib.error):
+            self.remove(key)
+            return None
+        return entry
+
+    ##################################################
+    # Handle the response
+    ##################################################
+
+    # Returns the cached body when the server answered 304 Not Modified,
+    # and otherwise stores a cacheable response and returns None. Callers
+    # parse a cached body like a downloaded one, so a hit saves the transfer
+    # but not the decoding
+    def update(self, key, entry, status_code, headers, content):
+        if status_code == 304 and entry is not None:
+            self.touch(key)
+            with self.lock:
+                self.hits += 1
+                self.bytes_saved += len(entry["body"])
+            return entry["body"]
+        if status_code != 200:
+            return None
+        with self.lock:
+            self.misses += 1
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if etag is not None or last_modified is not None:
+            self.store(key, etag, last_modified, content)
+        elif entry is not None:
+            self.remove(key)
+        return None
+
+    def store(self, key, etag, last_modified, content):
+        meta = {"etag": etag, "last_modified": last_modified}
+        data = json.dumps(meta).encode() + b"\n" + zlib.compress(content)
+        file_path = os.path.join(self.path, key)
+        temp_path = (
+            file_path + "." + str(os.getpid()) + "-" + str(threading.get_ident()) + ".tmp"
+        )
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, file_path)
+        except OSError as e:
+            print("!!! Could not write to the response cache: " + str(e))
+            return
+        with self.lock:
+            self.total_bytes += len(data) - self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+            self.stores += 1
+        self.evict()
+
+    ##################################################
+    # Least recently used eviction
+    ##################################################
+
+    def touch(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+        try:
+            now = time.time()
+            os.utime(os.path.join(self.path, key), (now, now))
+        except OSError:
+            pass
+
+    def remove(self, key):
+        with self.lock:
+            self.total_bytes -= self.entries.pop(key, 0)
+        try:
+            os.remove(os.path.join(self.path, key))
+        except OSError:
+            pass
+
+    def evict(self):
+        while True:
+            with self.lock:
+                if self.total_bytes <= self.max_bytes or len(self.entries) == 0:
+                    return
+                key, size = self.entries.popitem(last=False)
+                self.total_bytes -= size
+                self.evictions += 1
+            try:
+                os.remove(os.path.join(self.path, key))
+            except OSError:
+                pass
+
+    ##################################################
+    # Hit and miss counters
+    ##################################################
+
+    # A hit is a 304 answered from the cache, whose body was neither sent
+    # by the server nor read off the network
+    def get_stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "bytes_saved": self.bytes_saved,
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+            }
+
+    def print_report(self):
+        stats = self.get_stats()
+        lookups = stats["hits"] + stats["misses"]
+        rate = 0 if lookups == 0 else round(stats["hits"] * 100 / lookups)
+        print(
+            "Response cache: "
+            + str(stats["hits"])
+            + " hits, "
+            + str(stats["misses"])
+            + " misses ("
+            + str(rate)
+            + "% hit rate), "
+            + str(round(stats["bytes_saved"] / 1024 / 1024, 1))
+            + " MB not downloaded, "
+            + str(stats["evictions"])
+            + " evicted.",
+            end="\n\n",
+        )
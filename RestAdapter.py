@@ -1,21 +1,138 @@
 import requests
+import urllib3
 import json
 import time
+from collections import deque
+from requests.adapters import HTTPAdapter
+from Pagination import Pagination
+from RateLimiter import RateLimiter
+from RetryPolicy import RetryPolicy
+from Tracer import Tracer
+from RequestMetrics import ContextExecutor
 
 
 class RestAdapter:
     url = ""
     url_int = ""
+    version = ""
     api_token = ""
+    pool_size = 10
+    verify = True
+    session = None
+    rate_limiter = None
+    pagination = None
+    metrics = None
+    tracer = None
+    cache = None
+    retry_policy = None
+    name = ""
 
-    def __init__(self, hostname, version, api_token):
-        self.url = f"https://{hostname}/api/{version}"
-        self.url_int = f"https://{hostname}/internal"
+    def __init__(
+        self,
+        hostname,
+        version,
+        api_token,
+        pool_size=10,
+        verify=True,
+        rate_limiter=None,
+        metrics=None,
+        tracer=None,
+        cache=None,
+        retry_policy=None,
+        name="",
+    ):
+        base_url = hostname
+        if not base_url.startswith("http://") and not base_url.startswith("https://"):
+            base_url = f"https://{hostname}"
+        self.url = f"{base_url}/api/{version}"
+        self.url_int = f"{base_url}/internal"
+        self.version = version
         self.api_token = api_token
+        self.pool_size = pool_size
+        self.verify = verify
         self.headers = {
             "Authorization": f"{self.api_token}",
             "Content-Type": "application/json",
         }
+        self.session = self.create_session()
+        if rate_limiter is None:
+            rate_limiter = RateLimiter()
+        self.rate_limiter = rate_limiter
+        self.pagination = Pagination()
+        self.metrics = metrics
+        if tracer is None:
+            tracer = Tracer()
+        self.tracer = tracer
+        self.cache = cache
+        if retry_policy is None:
+            retry_policy = RetryPolicy()
+        self.retry_policy = retry_policy
+        self.name = name
+
+    ##################################################
+    # Pooled keep-alive session for this host
+    ##################################################
+
+    def create_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            pool_block=True,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def close(self):
+        self.session.close()
+
+    # A request whose connection could not be made never reached the server
+    def was_sent(self, error):
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return False
+        if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+            reason = getattr(error.args[0], "reason", None)
+            if isinstance(reason, urllib3.exceptions.ConnectTimeoutError):
+                return False
+        return True
+
+    ##################################################
+    # Page through a listing, yielding results as they arrive
+    ##################################################
+
+    def paginate(self, path, beta=False, internal=False):
+        for page in self.paginate_pages(path, beta=beta, internal=internal):
+            yield from page
+
+    # After the first page, the rest are fetched up to pool_size at a time
+    # by offset and yielded in order
+    def paginate_pages(self, path, beta=False, internal=False):
+        path = self.pagination.first_path(path)
+        data = self.get_page(path, beta, internal)
+        yield data.get("items", [])
+
+        paths = self.pagination.offset_paths(path, data)
+        if paths is None:
+            path = self.pagination.next_path(data, self.version)
+            while path is not None:
+                data = self.get_page(path, beta, internal)
+                yield data.get("items", [])
+                path = self.pagination.next_path(data, self.version)
+            return
+
+        with ContextExecutor(max_workers=self.pool_size) as executor:
+            pending = deque()
+            for path in paths:
+                if len(pending) == self.pool_size:
+                    yield pending.popleft().result().get("items", [])
+                pending.append(executor.submit(self.get_page, path, beta, internal))
+            while len(pending) > 0:
+                yield pending.popleft().result().get("items", [])
+
+    def get_page(self, path, beta=False, internal=False):
+        response = self.get(path, beta=beta, internal=internal)
+        return json.loads(response.text)
 
     def get(self, path, params=None, json=None, beta=False, internal=False):
         return self.request(
@@ -56,62 +173,123 @@ class RestAdapter:
         if beta:
             temp_headers["LD-API-Version"] = "beta"
 
-        retry = 0
-        got_response = False
-        while retry < 5:
-            try:
-                response = requests.request(
-                    method=http_method,
-                    url=url,
-                    headers=temp_headers,
-                    params=params,
-                    json=json if json else None,
+        route = self.rate_limiter.normalize_route(
+            http_method, ("/internal" if internal else "") + new_path
+        )
+
+        # A GET seen before is sent with its validators
+        cache_key = None
+        cache_entry = None
+        if self.cache is not None and http_method == "GET":
+            cache_key = self.cache.key(url, params, temp_headers)
+            cache_entry = self.cache.prepare(cache_key, temp_headers)
+
+        with self.tracer.span(route, "http", host=self.name, path=new_path) as span:
+            throttled = 0
+            attempt = 1
+            slept = 0.0
+            while True:
+                wait = self.rate_limiter.acquire(route)
+                if self.metrics is not None:
+                    self.metrics.record_wait(self.name, route, wait)
+                self.tracer.record("rate limit wait", "wait", wait)
+
+                response = None
+                error = None
+                try:
+                    started = time.time()
+                    response = self.session.request(
+                        method=http_method,
+                        url=url,
+                        headers=temp_headers,
+                        params=params,
+                        json=json if json else None,
+                        verify=self.verify,
+                    )
+                except requests.exceptions.RequestException as e:
+                    error = e
+
+                if response is not None:
+                    if self.metrics is not None:
+                        self.metrics.record_response(
+                            self.name,
+                            route,
+                            response.status_code,
+                            time.time() - started,
+                            self.metrics.body_size(json),
+                            len(response.content),
+                        )
+
+                    #########################
+                    # Rate limiting Logic
+                    #########################
+
+                    self.rate_limiter.update(route, response.headers, started)
+                    if response.status_code == 429:
+                        # Throttled requests are not applied, so they are safe to resend
+                        throttled += 1
+                        self.rate_limiter.throttle(route, response.headers)
+                else:
+                    self.rate_limiter.end_probe(route)
+
+                #########################
+                # Retry Logic
+                #########################
+
+                # Raises a RequestError when there is no response to return
+                delay = self.retry_policy.get_delay(
+                    http_method,
+                    new_path,
+                    attempt,
+                    slept,
+                    status_code=None if response is None else response.status_code,
+                    headers=None if response is None else response.headers,
+                    error=error,
+                    sent=self.was_sent(error),
                 )
-                got_response = True
-                break
-            except requests.exceptions.RequestException as e:
-                print("!!! Request failed. Retrying...")
-                print(f"    Error: {e}")
-                time.sleep(3)
-            retry += 1
-
-        if not got_response:
-            print("!!! Request failed after 5 retries.")
-            print("    Exiting...")
-            exit(1)
-
-        #########################
-        # Rate limiting Logic
-        #########################
-
-        if "X-Ratelimit-Route-Remaining" in response.headers:
-            call_limit = 5
-            delay = 5
-            tries = 5
-            limit_remaining = response.headers["X-Ratelimit-Route-Remaining"]
-
-            if int(limit_remaining) <= call_limit:
-                resetTime = int(response.headers["X-Ratelimit-Reset"])
-                currentMilliTime = round(time.time() * 1000)
-                if resetTime - currentMilliTime > 0:
-                    delay = round((resetTime - currentMilliTime) // 1000)
+                if delay is None:
+                    break
+
+                if response is not None and response.status_code == 429:
+                    if self.metrics is not None:
+                        self.metrics.record_wait(self.name, route, delay)
+                    time.sleep(delay)
+                    self.tracer.record("rate limit wait", "wait", delay)
                 else:
-                    delay = 0
+                    reason = str(error) if response is None else str(response.status_code)
+                    print(
+                        "!!! Request failed ("
+                        + reason
+                        + "). Retrying in "
+                        + str(round(delay, 1))
+                        + " seconds..."
+                    )
+                    if self.metrics is not None:
+                        self.metrics.record_retry(self.name, route, delay)
+                    time.sleep(delay)
+                    self.tracer.record("retry sleep", "wait", delay)
+                slept += delay
+                attempt += 1
 
-                if delay < 1:
-                    delay = 0.5
+            span.set("status", response.status_code)
+            if throttled > 0:
+                span.set("throttled", throttled)
+            if attempt > 1:
+                span.set("attempts", attempt)
 
-                tries -= 1
-                print(
-                    " --- Rate limit reached. Waiting for "
-                    + str(delay)
-                    + " seconds. Remaining tries: "
-                    + str(tries)
+            if cache_key is not None:
+                content = self.cache.update(
+                    cache_key,
+                    cache_entry,
+                    response.status_code,
+                    response.headers,
+                    response.content,
                 )
-                time.sleep(delay)
-                if tries == 0:
-                    return "Rate limit exceeded. Please try again later."
-            else:
-                tries = 5
+                # Not modified: callers get the cached body as a 200
+                if content is not None:
+                    response.status_code = 200
+                    response._content = content
+                    response.encoding = "utf-8"
+                    span.set("cache", "hit")
 
         return response
@@ -0,0 +1,181 @@
+import email.utils
+import random
+import threading
+import time
+
+
+class RequestError(Exception):
+    method = ""
+    path = ""
+    attempts = 0
+
+    # A request which failed without a response to return. Phases catch it
+    # like any other error, and MigrateRetry resumes after it
+    def __init__(self, message, method, path, attempts):
+        super().__init__(message)
+        self.method = method
+        self.path = path
+        self.attempts = attempts
+
+
+# Every attempt the request was allowed failed
+class RetriesExhaustedError(RequestError):
+    pass
+
+
+# The migration has used up the retries it is allowed in total
+class RetryBudgetExhaustedError(RequestError):
+    pass
+
+
+# A request which is not idempotent failed after it may have reached the
+# server, so it is not sent again
+class UnsafeRetryError(RequestError):
+    pass
+
+
+class RetryPolicy:
+    # Requests which have the same effect however often they are sent.
+    # Flag and segment PATCHes can append to lists, so they are not
+    idempotent_methods = ["GET", "HEAD", "OPTIONS", "PUT", "DELETE"]
+    retry_statuses = [500, 502, 503, 504]
+    max_attempts = 6
+    base_delay = 0.5
+    max_delay = 30.0
+    max_request_seconds = 300.0
+    max_run_retries = 1000
+    run_retries = 0
+    lock = None
+
+    # Decides whether a failed request is sent again and how long to sleep
+    # first: exponential backoff with full jitter, but never sooner than
+    # Retry-After or X-Ratelimit-Reset allow. Each request gets up to
+    # max_attempts attempts and max_request_seconds of sleep, and the
+    # retries of a whole migration are capped at max_run_retries. 429s are
+    # paced by the server and do not count towards the run's budget
+    def __init__(
+        self,
+        max_attempts=6,
+        base_delay=0.5,
+        max_delay=30.0,
+        max_request_seconds=300.0,
+        max_run_retries=1000,
+    ):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_request_seconds = max_request_seconds
+        self.max_run_retries = max_run_retries
+        self.run_retries = 0
+        self.lock = threading.Lock()
+
+    ##################################################
+    # Retry or give up
+    ##################################################
+
+    # Returns how long to sleep before the next attempt, or None when the
+    # response is final. A request which got no response has nothing to
+    # return, so it raises a RequestError instead of returning None. sent is
+    # False when the connection could not be made at all
+    def get_delay(
+        self,
+        method,
+        path,
+        attempt,
+        slept,
+        status_code=None,
+        headers=None,
+        error=None,
+        sent=True,
+    ):
+        description = method + " " + path
+        if error is not None:
+            if sent and method not in self.idempotent_methods:
+                raise UnsafeRetryError(
+                    description + " failed after it may have been applied: " + str(error),
+                    method,
+                    path,
+                    attempt,
+                )
+        elif status_code == 429:
+            pass
+        elif status_code not in self.retry_statuses:
+            return None
+        # A 503 is refused before the request is handled
+        elif method not in self.idempotent_methods and status_code != 503:
+            return None
+
+        delay = self.backoff(attempt, headers)
+        if attempt >= self.max_attempts or slept + delay > self.max_request_seconds:
+            if error is not None:
+                raise RetriesExhaustedError(
+                    description
+                    + " failed after "
+                    + str(attempt)
+                    + " attempts: "
+                    + str(error),
+                    method,
+                    path,
+                    attempt,
+                )
+            return None
+        if status_code != 429 and not self.take_run_retry():
+            if error is not None:
+                raise RetryBudgetExhaustedError(
+                    description
+                    + " failed and the migration has used all "
+                    + str(self.max_run_retries)
+                    + " retries: "
+                    + str(error),
+                    method,
+                    path,
+                    attempt,
+                )
+            return None
+        return delay
+
+    def take_run_retry(self):
+        with self.lock:
+            if self.run_retries >= self.max_run_retries:
+                return False
+            self.run_retries += 1
+            return True
+
+    ##################################################
+    # Backoff
+    ##################################################
+
+    # Full jitter spreads out requests which failed at the same time. When
+    # the server says when to come back, the wait is at least that long
+    def backoff(self, attempt, headers):
+        delay = random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        )
+        server_delay = self.get_server_delay(headers)
+        if server_delay is not None:
+            delay = max(delay, server_delay + random.uniform(0, self.base_delay))
+        return delay
+
+    def get_server_delay(self, headers):
+        if headers is None:
+            return None
+        delays = []
+        if "Retry-After" in headers:
+            retry_after = headers["Retry-After"]
+            try:
+                delays.append(float(retry_after))
+            except ValueError:
+                # An HTTP date rather than a number of seconds
+                try:
+                    retry_at = email.utils.parsedate_to_datetime(retry_after)
+                    delays.append(retry_at.timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass
+        if "X-Ratelimit-Reset" in headers:
+            try:
+                delays.append(int(headers["X-Ratelimit-Reset"]) / 1000 - time.time())
+            except ValueError:
+                pass
+        if len(delays) == 0:
+            return None
+        return max(0.0, max(delays))
@@ -0,0 +1,110 @@
+class SegmentGraph:
+    dependencies = {}
+    levels = []
+    unordered = []
+    cycles = []
+
+    # Orders one environment's segments by the segments their segmentMatch
+    # clauses reference. Each level only references segments in earlier
+    # levels, so a level can be created all at once. Segments in a cycle,
+    # or referencing one, cannot be ordered and are left in unordered, with
+    # the cycles themselves in cycles. References to segments which are not
+    # in the graph (e.g. already migrated) are already satisfied
+    def __init__(self, segments):
+        self.dependencies = {}
+        for segment in segments:
+            self.dependencies[segment["key"]] = self.get_references(segment)
+        for key, references in self.dependencies.items():
+            self.dependencies[key] = {
+                reference for reference in references if reference in self.dependencies
+            }
+        self.levels = self.sort()
+        ordered = {key for level in self.levels for key in level}
+        self.unordered = [key for key in self.dependencies if key not in ordered]
+        self.cycles = self.find_cycles(self.unordered)
+
+    def get_references(self, segment):
+        references = set()
+        for rule in segment.get("rules", []):
+            for clause in rule.get("clauses", []):
+                if "segmentMatch" in [clause.get("attribute"), clause.get("op")]:
+                    references.update(clause.get("values", []))
+        return references
+
+    ##################################################
+    # Topological levels
+    ##################################################
+
+    # Kahn's algorithm, one level at a time. Segments keep their listing
+    # order within a level
+    def sort(self):
+        position = {key: i for i, key in enumerate(self.dependencies)}
+        dependents = {key: [] for key in self.dependencies}
+        waiting = {}
+        for key, references in self.dependencies.items():
+            waiting[key] = len(references)
+            for reference in references:
+                dependents[reference].append(key)
+
+        levels = []
+        level = [key for key in self.dependencies if waiting[key] == 0]
+        while len(level) > 0:
+            levels.append(level)
+            next_level = []
+            for key in level:
+                for dependent in dependents[key]:
+                    waiting[dependent] -= 1
+                    if waiting[dependent] == 0:
+                        next_level.append(dependent)
+            level = sorted(next_level, key=position.get)
+        return levels
+
+    ##################################################
+    # Cycles among the segments which could not be ordered
+    ##################################################
+
+    # The strongly connected components of the unordered segments, found
+    # with an iterative Tarjan's algorithm. A component of several segments,
+    # or a segment referencing itself, is a cycle
+    def find_cycles(self, keys):
+        keys = set(keys)
+        index = {}
+        low = {}
+        stack = []
+        on_stack = set()
+        cycles = []
+        for root in self.dependencies:
+            if root not in keys or root in index:
+                continue
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(sorted(self.dependencies[root] & keys)))]
+            while len(work) > 0:
+                key, references = work[-1]
+                for reference in references:
+                    if reference not in index:
+                        index[reference] = low[reference] = len(index)
+                        stack.append(reference)
+                        on_stack.add(reference)
+                        nested = iter(sorted(self.dependencies[reference] & keys))
+                        work.append((reference, nested))
+                        break
+                    if reference in on_stack:
+                        low[key] = min(low[key], index[reference])
+                else:
+                    work.pop()
+                    if len(work) > 0:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[key])
+                    if low[key] == index[key]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == key:
+                                break
+                        if len(component) > 1 or key in self.dependencies[key]:
+                            cycles.append(sorted(component))
+        return cycles
@@ -0,0 +1,325 @@
+import json
+import mmap
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+
+##################################################
+# On-disk snapshot layout
+#
+#   data.bin    zlib-compressed JSON records, one after another
+#   index.json  {collection: {"keys": [...], "offsets": {key: [offset, length]}}}
+##################################################
+
+
+class SnapshotWriter:
+    path = ""
+    data_file = None
+    index = {}
+    offset = 0
+    lock = None
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.data_file = open(os.path.join(path, "data.bin"), "wb")
+        self.index = {}
+        self.offset = 0
+        self.lock = threading.Lock()
+
+    def put(self, collection, key, record):
+        data = zlib.compress(json.dumps(record, separators=(",", ":")).encode())
+        with self.lock:
+            if collection not in self.index:
+                self.index[collection] = {"keys": [], "offsets": {}}
+            if key not in self.index[collection]["offsets"]:
+                self.index[collection]["keys"].append(key)
+            self.index[collection]["offsets"][key] = [self.offset, len(data)]
+            self.data_file.write(data)
+            self.offset += len(data)
+
+    def put_items(self, collection, items, key_field="key"):
+        for item in items:
+            self.put(collection, item[key_field], item)
+
+    def close(self):
+        self.data_file.close()
+        with open(os.path.join(self.path, "index.json"), "w") as f:
+            json.dump(self.index, f, separators=(",", ":"))
+
+
+class SnapshotReader:
+    path = ""
+    index = {}
+    data_file = None
+    data = None
+
+    def __init__(self, path):
+        if not os.path.isfile(os.path.join(path, "index.json")):
+            print("Snapshot not found: " + path)
+            exit(1)
+        self.path = path
+        with open(os.path.join(path, "index.json")) as f:
+            self.index = json.load(f)
+        self.data_file = open(os.path.join(path, "data.bin"), "rb")
+        self.data = b""
+        if os.path.getsize(os.path.join(path, "data.bin")) > 0:
+            self.data = mmap.mmap(self.data_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    ##################################################
+    # Read records by key through the memory map
+    ##################################################
+
+    def get(self, collection, key):
+        if collection not in self.index:
+            return None
+        if key not in self.index[collection]["offsets"]:
+            return None
+        offset, length = self.index[collection]["offsets"][key]
+        return json.loads(zlib.decompress(self.data[offset : offset + length]))
+
+    def keys(self, collection):
+        if collection not in self.index:
+            return []
+        return self.index[collection]["keys"]
+
+    def items(self, collection):
+        for key in self.keys(collection):
+            yield self.get(collection, key)
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.data_file.close()
+
+
+class SnapshotResponse:
+    status_code = 200
+    text = ""
+    headers = {}
+
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self.text = json.dumps(data)
+        self.headers = {}
+
+
+class SnapshotAdapter:
+    reader = None
+    page_size = 50
+    verify = True
+    rate_limiter = None
+
+    # Answers the source GET requests LDMigrate makes from a snapshot, so a
+    # migration can use it in place of http_source
+    def __init__(self, reader):
+        self.reader = reader
+
+    def get(self, path, params=None, json=None, beta=False, internal=False):
+        parts = path.split("?")[0].strip("/").split("/")
+        data = self.route(parts)
+        if data is None:
+            return SnapshotResponse(
+                404, {"code": "not_found", "message": "Not in snapshot: " + path}
+            )
+        return SnapshotResponse(200, data)
+
+    def request(
+        self, http_method, path, params=None, json=None, beta=False, internal=False
+    ):
+        if http_method == "GET":
+            return self.get(path, params=params, json=json, beta=beta, internal=internal)
+        return SnapshotResponse(
+            405, {"code": "method_not_allowed", "message": "Snapshots are read-only"}
+        )
+
+    def close(self):
+        self.reader.close()
+
+    # Listings are read from the memory map a page at a time
+    def paginate(self, path, beta=False, internal=False):
+        for page in self.paginate_pages(path, beta=beta, internal=internal):
+            yield from page
+
+    def paginate_pages(self, path, beta=False, internal=False):
+        collection = self.collection(path.split("?")[0].strip("/").split("/"))
+        if collection is None:
+            yield json.loads(self.get(path).text).get("items", [])
+            return
+        page = []
+        for item in self.reader.items(collection):
+            page.append(item)
+            if len(page) == self.page_size:
+                yield page
+                page = []
+        yield page
+
+    def page(self, items):
+        items = list(items)
+        return {"items": items, "totalCount": len(items), "_links": {}}
+
+    def collection(self, parts):
+        match parts:
+            case ["members"]:
+                return "members"
+            case ["projects", _, "payload-filters"]:
+                return "payload filters"
+            case ["projects", _, "environments"]:
+                return "environments"
+            case ["projects", _, "metric-groups"]:
+                return "metric groups"
+            case ["metrics", _]:
+                return "metrics"
+            case ["segments", _, env]:
+                return "segments/" + env
+            case ["flags", _]:
+                return "flags"
+        return None
+
+    def route(self, parts):
+        r = self.reader
+        collection = self.collection(parts)
+        if collection is not None:
+            return self.page(r.items(collection))
+        match parts:
+            case ["projects", _]:
+                return r.get("documents", "project")
+            case ["projects", _, "flag-templates"]:
+                return r.get("documents", "flag templates")
+            case ["projects", _, "experimentation-settings"]:
+                return r.get("documents", "experiment settings")
+            case ["projects", _, "context-kinds"]:
+                return r.get("documents", "context kinds")
+            case ["metrics", _, key]:
+                return r.get("metrics", key)
+            case ["segments", _, env, key]:
+                return r.get("segments/" + env, key)
+            case ["flags", _, key]:
+                return r.get("flag details", key)
+        return None
+
+
+class AsyncSnapshotAdapter:
+    adapter = None
+
+    def __init__(self, adapter):
+        self.adapter = adapter
+
+    async def open(self):
+        return
+
+    async def close(self):
+        return
+
+    async def get(self, path, params=None, json=None, beta=False, internal=False):
+        return self.adapter.get(path, params=params, json=json, beta=beta, internal=internal)
+
+    async def request(
+        self, http_method, path, params=None, json=None, beta=False, internal=False
+    ):
+        return self.adapter.request(
+            http_method, path, params=params, json=json, beta=beta, internal=internal
+        )
+
+    async def paginate(self, path, beta=False, internal=False):
+        for item in self.adapter.paginate(path, beta=beta, internal=internal):
+            yield item
+
+    async def paginate_pages(self, path, beta=False, internal=False):
+        for page in self.adapter.paginate_pages(path, beta=beta, internal=internal):
+            yield page
+
+
+class SnapshotExporter:
+    migrator = None
+    writer = None
+
+    def __init__(self, migrator):
+        self.migrator = migrator
+
+    def get_all_items(self, path, beta=False):
+        return list(self.migrator.http_source.paginate(path, beta=beta))
+
+    def get_document(self, path, beta=False, internal=False):
+        response = self.migrator.http_source.get(path, beta=beta, internal=internal)
+        return json.loads(response.text)
+
+    ##################################################
+    # Export the whole source project
+    ##################################################
+
+    def export(self, path):
+        m = self.migrator
+        project = "/projects/" + m.project_key_source
+        self.writer = SnapshotWriter(path)
+        w = self.writer
+
+        print("Exporting project settings...", flush=True)
+        w.put("documents", "project", self.get_document(project))
+        w.put(
+            "documents",
+            "flag templates",
+            self.get_document(project + "/flag-templates", beta=True, internal=True),
+        )
+        w.put(
+            "documents",
+            "experiment settings",
+            self.get_document(project + "/experimentation-settings", beta=True),
+        )
+        w.put("documents", "context kinds", self.get_document(project + "/context-kinds"))
+        w.put_items(
+            "payload filters",
+            self.get_all_items(project + "/payload-filters?limit=20", beta=True),
+        )
+        w.put_items("members", self.get_all_items("/members"), key_field="_id")
+
+        print("Exporting environments...", flush=True)
+        environments = self.get_all_items(project + "/environments?limit=20")
+        w.put_items("environments", environments)
+
+        print("Exporting metrics...", flush=True)
+        w.put_items(
+            "metric groups", self.get_all_items(project + "/metric-groups?limit=20")
+        )
+        metric_keys = [
+            item["key"]
+            for item in self.get_all_items("/metrics/" + m.project_key_source + "?limit=20")
+        ]
+        self.export_details(
+            "metrics", "/metrics/" + m.project_key_source + "/", metric_keys
+        )
+
+        print("Exporting segments...", flush=True)
+        for env in environments:
+            segments_path = "/segments/" + m.project_key_source + "/" + env["key"]
+            segment_keys = [
+                item["key"] for item in self.get_all_items(segments_path + "?limit=50")
+            ]
+            self.export_details("segments/" + env["key"], segments_path + "/", segment_keys)
+
+        print("Exporting flags...", flush=True)
+        flags = self.get_all_items("/flags/" + m.project_key_source + "?limit=50")
+        w.put_items("flags", flags)
+        self.export_details(
+            "flag details",
+            "/flags/" + m.project_key_source + "/",
+            [flag["key"] for flag in flags],
+        )
+
+        w.close()
+        print("...exported " + str(len(flags)) + " flags to " + path)
+        return {
+            "total_environments": len(environments),
+            "total_metrics": len(metric_keys),
+            "total_flags": len(flags),
+        }
+
+    # Detail records are fetched concurrently and written as they arrive
+    def export_details(self, collection, path, keys):
+        def export_one(key):
+            self.writer.put(collection, key, self.get_document(path + key))
+
+        with ThreadPoolExecutor(max_workers=self.migrator.concurrency) as executor:
+            list(executor.map(export_one, keys))
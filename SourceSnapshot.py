@@ -0,0 +1,66 @@
+import asyncio
+import threading
+
+
+class SourceSnapshot:
+    collections = {}
+    locks = {}
+    tasks = {}
+    lock = None
+
+    # Each collection is listed the first time a phase asks for it and every
+    # later caller reads the same result, so a listing is only paged once
+    def __init__(self):
+        self.collections = {}
+        self.locks = {}
+        self.tasks = {}
+        self.lock = threading.Lock()
+
+    ##################################################
+    # Get a collection, listing it on first use
+    ##################################################
+
+    def get(self, name, loader):
+        with self.lock:
+            if name in self.collections:
+                return self.collections[name]
+            if name not in self.locks:
+                self.locks[name] = threading.Lock()
+            collection_lock = self.locks[name]
+
+        # Other phases asking for the same collection wait for this listing
+        with collection_lock:
+            if name not in self.collections:
+                data = loader()
+                with self.lock:
+                    self.collections[name] = data
+            return self.collections[name]
+
+    async def get_async(self, name, loader):
+        if name in self.collections:
+            return self.collections[name]
+        if name not in self.tasks:
+            self.tasks[name] = asyncio.ensure_future(loader())
+        data = await self.tasks[name]
+        self.collections[name] = data
+        return data
+
+    # Single-use collections are streamed rather than held, unless an earlier
+    # phase already listed them
+    def iter(self, name, loader):
+        with self.lock:
+            if name in self.collections:
+                return iter(self.collections[name])
+        return loader()
+
+    def set(self, name, data):
+        with self.lock:
+            self.collections[name] = data
+
+    def has(self, name):
+        return name in self.collections
+
+    def clear(self):
+        with self.lock:
+            self.collections = {}
+            self.tasks = {}
@@ -0,0 +1,185 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+
+# The innermost open span, which new spans record as their parent
+current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    tracer = None
+    name = ""
+    category = ""
+    args = {}
+    id = 0
+    parent = 0
+    lane_key = None
+    started = 0.0
+    token = None
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    # Adds to the span's arguments, e.g. the status once it is known
+    def set(self, key, value):
+        self.args[key] = value
+
+    def __enter__(self):
+        if self.tracer is not None:
+            self.tracer.start(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.tracer is not None:
+            if exc_type is not None and "status" not in self.args:
+                self.args["status"] = "error"
+                self.args["error"] = exc_type.__name__ + ": " + str(exc)
+            self.tracer.finish(self)
+        return False
+
+
+class Tracer:
+    path = None
+    buffer_size = 1000
+    buffer = []
+    file = None
+    started = 0.0
+    ids = None
+    lanes = {}
+    free_lanes = []
+    num_lanes = 0
+    lock = None
+
+    # Writes a span for every phase, resource and request in the Chrome
+    # trace event format, one event per line. The file is a JSON array
+    # once closed, and trace viewers also load it if the run never got to
+    # close it. Without a path, spans cost nothing and nothing is written
+    def __init__(self, path=None, buffer_size=1000):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.file = None
+        self.started = time.perf_counter()
+        self.ids = itertools.count(1)
+        self.lanes = {}
+        self.free_lanes = []
+        self.num_lanes = 0
+        self.lock = threading.Lock()
+
+    def span(self, name, category, **args):
+        if self.path is None:
+            return Span(None, name, category, args)
+        return Span(self, name, category, args)
+
+    ##################################################
+    # Open and close spans
+    ##################################################
+
+    def start(self, span):
+        span.id = next(self.ids)
+        parent = current_span.get()
+        span.parent = parent.id if parent is not None else 0
+        span.lane_key = self.get_lane_key()
+        with self.lock:
+            if span.lane_key in self.lanes:
+                self.lanes[span.lane_key][1] += 1
+            else:
+                self.lanes[span.lane_key] = [self.take_lane(), 1]
+        span.token = current_span.set(span)
+        span.started = time.perf_counter()
+
+    def finish(self, span):
+        finished = time.perf_counter()
+        current_span.reset(span.token)
+        args = dict(span.args, span=span.id)
+        if span.parent != 0:
+            args["parent"] = span.parent
+        with self.lock:
+            lane = self.lanes[span.lane_key]
+            lane[1] -= 1
+            if lane[1] == 0:
+                # The outermost span of its thread or task: the lane can be
+                # reused, as nothing else is drawn on it until then
+                del self.lanes[span.lane_key]
+                heapq.heappush(self.free_lanes, lane[0])
+            event = {
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": round((span.started - self.started) * 1000000, 1),
+                "dur": round((finished - span.started) * 1000000, 1),
+                "pid": 1,
+                "tid": lane[0],
+                "args": args,
+            }
+            self.buffer.append(json.dumps(event) + ",\n")
+            if len(self.buffer) >= self.buffer_size:
+                self.flush()
+
+    # A span which just ended after the given number of seconds, such as a
+    # wait timed by the rate limiter
+    def record(self, name, category, seconds, **args):
+        if self.path is None or seconds <= 0:
+            return
+        span = Span(self, name, category, args)
+        self.start(span)
+        span.started -= seconds
+        self.finish(span)
+
+    ##################################################
+    # Lanes: spans on one lane must nest, so each thread, and each asyncio
+    # task within it, draws on its own
+    ##################################################
+
+    def get_lane_key(self):
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        return (threading.get_ident(), id(task) if task is not None else 0)
+
+    def take_lane(self):
+        if len(self.free_lanes) > 0:
+            return heapq.heappop(self.free_lanes)
+        self.num_lanes += 1
+        return self.num_lanes
+
+    ##################################################
+    # Buffered writer
+    ##################################################
+
+    # Called with the lock held
+    def flush(self):
+        if self.file is None:
+            directory = os.path.dirname(self.path)
+            if directory != "":
+                os.makedirs(directory, exist_ok=True)
+            self.file = open(self.path, "w")
+            self.file.write("[\n")
+        self.file.write("".join(self.buffer))
+        self.file.flush()
+        self.buffer = []
+
+    def close(self):
+        if self.path is None:
+            return
+        with self.lock:
+            self.flush()
+            metadata = {
+                "name": "process_name",
+                "ph": "M",
+                "pid": 1,
+                "args": {"name": "ldmigrate"},
+            }
+            self.file.write(json.dumps(metadata) + "\n]\n")
+            self.file.close()
+            self.file = None
+        print("Wrote trace to " + self.path + ".", end="\n\n")
@@ -1,31 +1,44 @@
 from __version__ import __version__
 import json
+import sys
 import LDMigrate
 import LDConfig
+from BatchMigrate import BatchMigrate
+from RetryPolicy import RequestError
 
-config = LDConfig.LDConfig("app.ini")
-settings = config.get_config()
+# Batch workers are spawned processes which import this module, so nothing
+# runs unless it is the script being run
+if __name__ == "__main__":
+    config = LDConfig.LDConfig("app.ini")
+    settings = config.get_config()
 
-ldmigrator = LDMigrate.LDMigrate(
-    settings["source_api_token"],
-    settings["source_project_key"],
-    settings["target_api_token"],
-    project_key_target=settings["target_project_key"],
-    source_is_federal=settings["source_is_federal"],
-    target_is_federal=settings["target_is_federal"],
-    ignore_pauses=settings["ignore_pauses"],
-    flags_to_ignore=settings["flags_to_ignore"],
-    flags_to_migrate=settings["flags_to_migrate"],
-    migration_mode=settings["migration_mode"],
-    migrate_flag_templates=settings["migrate_flag_templates"],
-    migrate_context_kinds=settings["migrate_context_kinds"],
-    migrate_payload_filters=settings["migrate_payload_filters"],
-    migrate_segments=settings["migrate_segments"],
-    migrate_metrics=settings["migrate_metrics"],
-    ignore_duplicate_flags=settings["ignore_duplicate_flags"],
-    ignore_duplicate_segments=settings["ignore_duplicate_segments"],
-)
+    ldmigrator = LDMigrate.LDMigrate.from_settings(settings)
 
-result = ldmigrator.migrate()
+    # python app.py export <directory> writes the source project to a snapshot
+    # which SourceSnapshot=<directory> can later migrate from
+    if len(sys.argv) > 1 and sys.argv[1] == "export":
+        if len(sys.argv) < 3:
+            print("Usage: python app.py export <directory>")
+            exit(1)
+        result = ldmigrator.export_snapshot(sys.argv[2])
+    # python app.py plan estimates the API calls and wall time of each phase
+    elif len(sys.argv) > 1 and sys.argv[1] == "plan":
+        result = ldmigrator.plan()
+    # python app.py batch migrates every project listed in the [Batch] section
+    elif len(sys.argv) > 1 and sys.argv[1] == "batch":
+        if len(settings["batch_projects"]) == 0:
+            print("No [Batch] Projects are listed in app.ini.")
+            exit(1)
+        result = BatchMigrate(
+            settings, settings["batch_projects"], workers=settings["batch_workers"]
+        ).migrate()
+    else:
+        try:
+            result = ldmigrator.migrate()
+        # The journal keeps everything migrated before the failure
+        except RequestError as e:
+            print("!!! Migration stopped: " + str(e))
+            print("    Run again with MigrationMode=MigrateRetry to resume.")
+            exit(1)
 
-print(json.dumps(result))
+    print(json.dumps(result))
@@ -0,0 +1,177 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from LDMigrate import LDMigrate
+from mock_server import MockStore, start_server
+from synthetic_project import generate_project
+
+##################################################
+# End-to-end throughput benchmark for LDMigrate.migrate().
+#
+# Runs the local API stand-in (mock_server.py) in its own process, serving
+# a synthetic project of N flags x M environments x S segments, and migrates
+# it to a second account on the same stand-in. Reports requests per second,
+# the wall time of each phase and the peak memory of the migrating process.
+#
+# Usage: python benchmarks/bench_migrate.py [--flags N] [--environments M]
+#            [--segments S] [--latency SECONDS] [--engine sync|async]
+#            [--concurrency C] [--route-limit R] [--json]
+##################################################
+
+SOURCE_TOKEN = "api-source"
+TARGET_TOKEN = "api-target"
+PROJECT_KEY = "support-service"
+
+
+def serve(args, connection):
+    store = MockStore()
+    store.add_project(
+        SOURCE_TOKEN,
+        generate_project(
+            PROJECT_KEY,
+            num_flags=args.flags,
+            num_environments=args.environments,
+            num_segments=args.segments,
+            num_metrics=args.metrics,
+            num_targets=args.targets,
+        ),
+    )
+    # The target account shares the source members, so maintainers match
+    store.account(TARGET_TOKEN)["members"] = list(store.account(SOURCE_TOKEN)["members"])
+    server = start_server(
+        store,
+        latency=args.latency,
+        route_limit=args.route_limit,
+        global_limit=args.global_limit,
+        window=args.window,
+    )
+    connection.send(server.server_address[1])
+    # Serve until the benchmark asks the process to stop
+    connection.recv()
+    server.shutdown()
+
+
+def get_stats(host):
+    with urllib.request.urlopen(host + "/__stats") as response:
+        return json.loads(response.read())
+
+
+def get_peak_memory_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak = peak / 1024
+    return peak / 1024
+
+
+def run(args, host, journal_path):
+    migrator = LDMigrate(
+        SOURCE_TOKEN,
+        PROJECT_KEY,
+        TARGET_TOKEN,
+        ignore_pauses=True,
+        concurrency=args.concurrency,
+        engine=args.engine,
+        source_host=host,
+        target_host=host,
+        journal_path=journal_path,
+    )
+    memory_before = get_peak_memory_mb()
+    stats_before = get_stats(host)
+    start = time.perf_counter()
+    result = migrator.migrate()
+    elapsed = time.perf_counter() - start
+    stats = get_stats(host)
+    return {
+        "flags": args.flags,
+        "environments": args.environments,
+        "segments": args.segments,
+        "engine": args.engine,
+        "concurrency": args.concurrency,
+        "latency": args.latency,
+        "wall_time": round(elapsed, 3),
+        "requests": stats["requests"] - stats_before["requests"],
+        "throttled": stats["throttled"] - stats_before["throttled"],
+        "requests_per_second": round(
+            (stats["requests"] - stats_before["requests"]) / elapsed, 1
+        ),
+        "peak_memory_mb": round(get_peak_memory_mb(), 1),
+        "memory_growth_mb": round(get_peak_memory_mb() - memory_before, 1),
+        "phase_timings": result["phase_timings"],
+        "migrated_flags": result["total_flags"],
+    }
+
+
+def report(result):
+    print("")
+    print(
+        f"{result['flags']} flags x {result['environments']} environments x "
+        f"{result['segments']} segments, {result['engine']} engine, "
+        f"concurrency {result['concurrency']}, {result['latency'] * 1000:.0f} ms latency"
+    )
+    print(f"  Wall time            {result['wall_time']:10.2f} s")
+    print(f"  Requests             {result['requests']:10d}")
+    print(f"  Throttled (429)      {result['throttled']:10d}")
+    print(f"  Requests per second  {result['requests_per_second']:10.1f}")
+    print(
+        f"  Peak memory          {result['peak_memory_mb']:10.1f} MB"
+        f" ({result['memory_growth_mb']:.1f} MB during the migration)"
+    )
+    print("  Phase wall times:")
+    for name, seconds in result["phase_timings"].items():
+        print(f"    {name:<22}{seconds:10.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--flags", type=int, default=500)
+    parser.add_argument("--environments", type=int, default=3)
+    parser.add_argument("--segments", type=int, default=20)
+    parser.add_argument("--metrics", type=int, default=20)
+    parser.add_argument("--targets", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--engine", choices=["sync", "async"], default="sync")
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--route-limit", type=int, default=0)
+    parser.add_argument("--global-limit", type=int, default=0)
+    parser.add_argument("--window", type=float, default=10.0)
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args()
+
+    parent, child = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=serve, args=(args, child), daemon=True)
+    server.start()
+    host = f"http://127.0.0.1:{parent.recv()}"
+    directory = tempfile.mkdtemp()
+    try:
+        result = run(args, host, os.path.join(directory, "bench.journal"))
+    finally:
+        parent.send("stop")
+        server.join(5)
+        shutil.rmtree(directory)
+
+    if result["migrated_flags"] != args.flags:
+        print(
+            f"!!! Only {result['migrated_flags']} of {args.flags} flags were migrated."
+        )
+    if args.json:
+        print(json.dumps(result))
+    else:
+        report(result)
+    # The rate limiter paces requests to the budget, so a 429 is a regression
+    if result["throttled"] > 0:
+        print(f"!!! {result['throttled']} requests were throttled (429).")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
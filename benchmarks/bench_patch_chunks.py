@@ -0,0 +1,141 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from LDMigrate import LDMigrate
+
+##################################################
+# Throughput benchmark for size-bounded flag PATCHes.
+#
+# Starts a local stand-in for the flags API which, like the real gateway,
+# rejects request bodies over a size limit and spends time proportional to
+# the body size parsing it. Synthetic flags with very large target lists are
+# migrated once with a single JSON Patch per flag and once with the patch
+# split by PatchChunker.
+#
+# Usage: python benchmarks/bench_patch_chunks.py [num_flags] [targets_per_env]
+##################################################
+
+BODY_LIMIT = 1024 * 1024
+SECONDS_PER_MB = 0.05
+ENVIRONMENTS = ["production", "staging", "test", "development"]
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_PATCH(self):
+        length = int(self.headers["Content-Length"])
+        body = self.rfile.read(length)
+        if length > BODY_LIMIT:
+            self.send(413, {"code": "request_entity_too_large"})
+            return
+        time.sleep(length / (1024 * 1024) * SECONDS_PER_MB)
+        self.server.bytes_accepted += length
+        self.send(200, {"ops": len(json.loads(body))})
+
+    def send(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    server.bytes_accepted = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def make_flag(key, targets_per_env):
+    environments = {}
+    for env in ENVIRONMENTS:
+        environments[env] = {
+            "on": True,
+            "archived": False,
+            "targets": [
+                {
+                    "variation": variation,
+                    "values": [
+                        f"{key}-{env}-user-{i:07d}" for i in range(targets_per_env // 2)
+                    ],
+                    "contextKind": "user",
+                }
+                for variation in range(2)
+            ],
+            "contextTargets": [],
+            "fallthrough": {"variation": 0},
+            "offVariation": 1,
+            "prerequisites": [],
+            "trackEvents": False,
+            "trackEventsFallthrough": False,
+            "rules": [],
+        }
+    return {"key": key, "environments": environments}
+
+
+def run(host, flags, max_patch_size):
+    migrator = LDMigrate(
+        "api-benchmark",
+        "support-service",
+        "api-benchmark",
+        target_host=host,
+        max_patch_size=max_patch_size,
+    )
+    migrator.env_keys = ENVIRONMENTS
+    start = time.perf_counter()
+    updated = 0
+    for flag in flags:
+        details = json.loads(json.dumps(flag))
+        if migrator.create_target_flag_environment(flag["key"], details):
+            updated += 1
+    elapsed = time.perf_counter() - start
+    migrator.http_target.close()
+    return updated, elapsed
+
+
+def report(label, updated, elapsed, num_flags, accepted):
+    print(
+        f"{label:<28} {updated:4d}/{num_flags} flags"
+        f"   {elapsed:6.2f} s"
+        f"   {updated / elapsed:7.2f} flags/s"
+        f"   {accepted / (1024 * 1024) / elapsed:7.2f} MB/s accepted"
+    )
+
+
+def main():
+    num_flags = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    targets_per_env = int(sys.argv[2]) if len(sys.argv) > 2 else 40000
+    server = start_server()
+    host = f"http://127.0.0.1:{server.server_address[1]}"
+    flags = [make_flag(f"flag-{i:03d}", targets_per_env) for i in range(num_flags)]
+
+    print(
+        f"{num_flags} flags, {len(ENVIRONMENTS)} environments,"
+        f" {targets_per_env} targets per environment,"
+        f" {BODY_LIMIT // 1024} KB body limit"
+    )
+    server.bytes_accepted = 0
+    updated, elapsed = run(host, flags, 1024 * 1024 * 1024)
+    report("Before (one patch per flag)", updated, elapsed, num_flags, server.bytes_accepted)
+    server.bytes_accepted = 0
+    updated, elapsed = run(host, flags, 256 * 1024)
+    report("After (256 KB chunks)", updated, elapsed, num_flags, server.bytes_accepted)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
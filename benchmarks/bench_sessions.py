@@ -0,0 +1,120 @@
+import json
+import os
+import shutil
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from RestAdapter import RestAdapter
+
+##################################################
+# Before/after benchmark for pooled keep-alive sessions.
+#
+# Starts a local HTTPS stand-in for app.launchdarkly.com and times the same
+# GET issued through a fresh connection per call (the old module-level
+# requests.request) and through RestAdapter's pooled session.
+#
+# Usage: python benchmarks/bench_sessions.py [num_requests]
+##################################################
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        body = json.dumps({"key": "support-service", "name": "Support Service"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def create_certificate(directory):
+    cert_file = os.path.join(directory, "cert.pem")
+    key_file = os.path.join(directory, "key.pem")
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+            "-keyout", key_file, "-out", cert_file, "-days", "1",
+            "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return cert_file, key_file
+
+
+def start_server(cert_file, key_file):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_file, key_file)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def time_calls(call, num_requests):
+    timings = []
+    for _ in range(num_requests):
+        start = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(label, timings):
+    print(
+        f"{label:<32} mean {statistics.mean(timings):7.2f} ms"
+        f"   p50 {statistics.median(timings):7.2f} ms"
+        f"   p95 {sorted(timings)[int(len(timings) * 0.95) - 1]:7.2f} ms"
+    )
+
+
+def main():
+    num_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    directory = tempfile.mkdtemp()
+    try:
+        cert_file, key_file = create_certificate(directory)
+        server = start_server(cert_file, key_file)
+        host = f"127.0.0.1:{server.server_address[1]}"
+        url = f"https://{host}/api/v2/projects/support-service"
+
+        before = time_calls(
+            lambda: requests.request("GET", url, verify=cert_file), num_requests
+        )
+        http = RestAdapter(host, "v2", "api-benchmark", verify=cert_file)
+        after = time_calls(
+            lambda: http.get("/projects/support-service"), num_requests
+        )
+        http.close()
+        server.shutdown()
+
+        print(f"{num_requests} GET requests against {host}")
+        report("Before (new connection per call)", before)
+        report("After (pooled keep-alive)", after)
+        saved = statistics.mean(before) - statistics.mean(after)
+        print(
+            f"Saved {saved:.2f} ms per request "
+            f"({saved / statistics.mean(before) * 100:.0f}%)"
+        )
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
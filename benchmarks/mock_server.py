@@ -0,0 +1,542 @@
+import copy
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from Pagination import Pagination
+from RateLimiter import RateLimiter
+
+##################################################
+# Local stand-in for the LaunchDarkly REST API endpoints LDMigrate calls.
+#
+# Projects, flags, segments, metrics, members, environments, context kinds,
+# flag templates (under /internal), payload filters and metric groups are
+# kept in memory per API token. Listings are paged with limit/offset,
+# totalCount and _links.next, every response carries X-Ratelimit-* headers
+# when limits are set, GET responses carry an ETag and answer a matching
+# If-None-Match with a 304, and a fixed latency can be added to every request.
+#
+# Usage: python benchmarks/mock_server.py [port]
+#   serves a synthetic project "support-service" for the token "api-source"
+##################################################
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class MockStore:
+    accounts = {}
+    windows = {}
+    lock = None
+    num_requests = 0
+    num_throttled = 0
+    num_errors = 0
+    routes = {}
+
+    def __init__(self):
+        self.accounts = {}
+        self.windows = {}
+        self.lock = threading.Lock()
+        self.num_requests = 0
+        self.num_throttled = 0
+        self.num_errors = 0
+        self.routes = {}
+
+    def account(self, token):
+        if token not in self.accounts:
+            self.accounts[token] = {"members": [], "projects": {}}
+        return self.accounts[token]
+
+    # project is a dict made by synthetic_project.generate_project()
+    def add_project(self, token, project):
+        account = self.account(token)
+        account["projects"][project["project"]["key"]] = copy.deepcopy(project)
+        known = {member["email"] for member in account["members"]}
+        for member in project["members"]:
+            if member["email"] not in known:
+                account["members"].append(copy.deepcopy(member))
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "requests": self.num_requests,
+                "throttled": self.num_throttled,
+                "errors": self.num_errors,
+                "routes": dict(self.routes),
+            }
+
+    def reset_stats(self):
+        with self.lock:
+            self.num_requests = 0
+            self.num_throttled = 0
+            self.num_errors = 0
+            self.routes = {}
+
+    ##################################################
+    # Fixed-window rate limits per route and per account
+    ##################################################
+
+    # Returns the rate limit headers for the response, and whether the
+    # request is throttled. Nothing is counted against a throttled request
+    def take(self, token, route, route_limit, global_limit, window):
+        now = time.time()
+        limits = {"Route": ((token, route), route_limit), "Global": (token, global_limit)}
+        headers = {}
+        windows = {}
+        throttled = False
+        with self.lock:
+            for kind, (key, limit) in limits.items():
+                if limit <= 0:
+                    continue
+                remaining, reset_at = self.windows.get(key, (limit, now + window))
+                if now >= reset_at:
+                    remaining, reset_at = limit, now + window
+                windows[key] = (remaining, reset_at)
+                throttled = throttled or remaining <= 0
+                headers["X-Ratelimit-" + kind + "-Remaining"] = str(max(0, remaining - 1))
+                headers["X-Ratelimit-Reset"] = str(int(reset_at * 1000))
+            if throttled:
+                self.num_throttled += 1
+                for kind, (key, limit) in limits.items():
+                    if key in windows:
+                        headers["X-Ratelimit-" + kind + "-Remaining"] = str(windows[key][0])
+                return headers, True
+            for key, (remaining, reset_at) in windows.items():
+                self.windows[key] = (remaining - 1, reset_at)
+        return headers, False
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    # Fields only in the single metric response, not in the listing
+    metric_detail_fields = [
+        "eventKey",
+        "urls",
+        "selector",
+        "successCriteria",
+        "unit",
+        "percentileValue",
+    ]
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_PATCH(self):
+        self.handle_request("PATCH")
+
+    def do_PUT(self):
+        self.handle_request("PUT")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+    def send(self, status, data, headers=None):
+        body = data if isinstance(data, bytes) else json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    ##################################################
+    # Rate limit, then route the request
+    ##################################################
+
+    def handle_request(self, method):
+        server = self.server
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length > 0 else None
+        if server.latency > 0:
+            time.sleep(server.latency)
+
+        if url.path == "/__stats":
+            self.send(200, server.store.get_stats())
+            return
+
+        token = self.headers.get("Authorization", "")
+        route = server.route_names.normalize_route(method, url.path)
+        headers, throttled = server.store.take(
+            token, route, server.route_limit, server.global_limit, server.window
+        )
+        if throttled:
+            self.send(429, {"code": "rate_limited", "message": "Slow down"}, headers)
+            return
+        # Injected outages are refused before the request is handled
+        if server.error_rate > 0 and random.random() < server.error_rate:
+            with server.store.lock:
+                server.store.num_errors += 1
+            headers["Retry-After"] = "0"
+            self.send(503, {"code": "unavailable", "message": "Try again"}, headers)
+            return
+        with server.store.lock:
+            server.store.num_requests += 1
+            server.store.routes[route] = server.store.routes.get(route, 0) + 1
+
+        parts = url.path.strip("/").split("/")
+        if parts[:1] == ["internal"]:
+            parts = parts[1:]
+        elif parts[:2] == ["api", "v2"]:
+            parts = parts[2:]
+        query = dict(parse_qsl(url.query))
+        with server.store.lock:
+            account = server.store.account(token)
+            try:
+                status, data = self.route(method, parts, query, body, account)
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                status, data = 400, {"code": "invalid_request", "message": repr(e)}
+            # Serialized under the lock, as the data is the stored objects
+            data = json.dumps(data).encode()
+        # Bodies are tagged, and a GET revalidating the current tag gets a
+        # 304 without one
+        if method == "GET" and status == 200:
+            etag = '"' + hashlib.sha1(data).hexdigest() + '"'
+            headers["ETag"] = etag
+            if self.headers.get("If-None-Match") == etag:
+                status, data = 304, b""
+        self.send(status, data, headers)
+
+    def route(self, method, parts, query, body, account):
+        projects = account["projects"]
+        if len(parts) > 1 and parts[0] in ["projects", "metrics", "segments", "flags"]:
+            if parts[1] not in projects:
+                return 404, {"code": "not_found", "message": "Unknown project " + parts[1]}
+        match parts:
+            case ["members"]:
+                members = account["members"]
+                # filter=query:<text> searches the member emails
+                if query.get("filter", "").startswith("query:"):
+                    text = query["filter"][len("query:") :].lower()
+                    members = [m for m in members if text in m["email"].lower()]
+                return self.page(members, parts, query)
+            case ["projects"] if method == "POST":
+                return self.create_project(projects, body)
+            case ["projects", key]:
+                return 200, projects[key]["project"]
+            case ["projects", key, "flag-templates"]:
+                return 200, {"items": projects[key]["flag_templates"]}
+            case ["projects", key, "flag-templates", template_key]:
+                return self.patch_item(
+                    projects[key]["flag_templates"], template_key, body
+                )
+            case ["projects", key, "context-kinds"]:
+                return 200, {"items": projects[key]["context_kinds"]}
+            case ["projects", key, "context-kinds", kind_key]:
+                kinds = projects[key]["context_kinds"]
+                kinds[:] = [kind for kind in kinds if kind["key"] != kind_key]
+                kinds.append(dict(body, key=kind_key))
+                return 200, kinds[-1]
+            case ["projects", key, "experimentation-settings"]:
+                if method == "PUT":
+                    projects[key]["experimentation_settings"] = body
+                return 200, projects[key]["experimentation_settings"]
+            case ["projects", key, "payload-filters"]:
+                return self.list_or_create(
+                    method, projects[key]["payload_filters"], parts, query, body
+                )
+            case ["projects", key, "metric-groups"]:
+                return self.list_or_create(
+                    method, projects[key]["metric_groups"], parts, query, body
+                )
+            case ["projects", key, "environments"]:
+                if method == "GET":
+                    environments = list(projects[key]["environments"].values())
+                    return self.page(environments, parts, query)
+                return self.create_environment(projects[key], body)
+            case ["projects", key, "environments", env]:
+                return self.get_or_patch(projects[key]["environments"], env, method, body)
+            case ["metrics", key]:
+                if method == "GET":
+                    metrics = [
+                        self.metric_listing(metric)
+                        for metric in projects[key]["metrics"].values()
+                    ]
+                    return self.page(metrics, parts, query)
+                return self.create_keyed(projects[key]["metrics"], body)
+            case ["metrics", key, metric_key]:
+                return self.get_or_patch(projects[key]["metrics"], metric_key, method, body)
+            case ["segments", key, env] if env in projects[key]["segments"]:
+                segments = projects[key]["segments"][env]
+                if method == "GET":
+                    return self.page(list(segments.values()), parts, query)
+                segment = dict(
+                    body,
+                    included=[],
+                    excluded=[],
+                    includedContexts=[],
+                    excludedContexts=[],
+                    rules=[],
+                )
+                return self.create_keyed(segments, segment)
+            case ["segments", key, env, segment_key] if env in projects[key]["segments"]:
+                segments = projects[key]["segments"][env]
+                previous = copy.deepcopy(segments.get(segment_key))
+                status, data = self.get_or_patch(segments, segment_key, method, body)
+                # Rules may only match segments which exist
+                missing = self.missing_segments(segments, segment_key)
+                if status == 200 and len(missing) > 0:
+                    segments[segment_key] = previous
+                    message = "Unknown segments " + ", ".join(missing)
+                    return 400, {"code": "invalid_request", "message": message}
+                return status, data
+            case ["flags", key]:
+                if method == "GET":
+                    flags = [
+                        self.flag_listing(flag, query.get("summary", "true"))
+                        for flag in projects[key]["flags"].values()
+                    ]
+                    return self.page(flags, parts, query)
+                return self.create_flag(projects[key], body)
+            case ["flags", key, flag_key]:
+                return self.get_or_patch(projects[key]["flags"], flag_key, method, body)
+        return 404, {"code": "not_found", "message": "Unknown path /" + "/".join(parts)}
+
+    ##################################################
+    # Listings
+    ##################################################
+
+    def page(self, items, parts, query):
+        resource = self.server.pagination.resource("/".join(parts))
+        max_limit = MAX_PAGE_SIZE
+        if resource is not None:
+            max_limit = self.server.pagination.page_limits[resource]
+        limit = min(int(query.get("limit", DEFAULT_PAGE_SIZE)), max_limit)
+        offset = int(query.get("offset", 0))
+        data = {
+            "items": items[offset : offset + limit],
+            "totalCount": len(items),
+            "_links": {},
+        }
+        if offset + limit < len(items):
+            next_query = dict(query, limit=str(limit), offset=str(offset + limit))
+            data["_links"]["next"] = {
+                "href": "/api/v2/" + "/".join(parts) + "?" + urlencode(next_query),
+                "type": "application/json",
+            }
+        return 200, data
+
+    # Flag listings leave out each environment's targeting unless summary=0
+    def flag_listing(self, flag, summary):
+        if summary in ["0", "false"]:
+            return flag
+        listing = {key: value for key, value in flag.items() if key != "environments"}
+        listing["environments"] = {
+            env: {"on": settings["on"], "archived": settings["archived"]}
+            for env, settings in flag["environments"].items()
+        }
+        return listing
+
+    # Metric listings leave out the event details and the analysis options,
+    # which are only in the single metric response
+    def metric_listing(self, metric):
+        return {
+            key: value
+            for key, value in metric.items()
+            if key not in self.metric_detail_fields
+        }
+
+    ##################################################
+    # Writes
+    ##################################################
+
+    def create_project(self, projects, body):
+        if body["key"] in projects:
+            return 409, {"code": "conflict", "message": "Project already exists"}
+        projects[body["key"]] = {
+            "project": dict(body),
+            # New projects start with the built-in templates, which the
+            # migration patches rather than creates
+            "flag_templates": [
+                {"key": key, "tags": []}
+                for key in ["release", "kill-switch", "experiment", "migration"]
+            ],
+            "context_kinds": [],
+            "experimentation_settings": {"randomizationUnits": []},
+            "payload_filters": [],
+            "metric_groups": [],
+            "environments": {},
+            "segments": {},
+            "metrics": {},
+            "flags": {},
+        }
+        return 201, body
+
+    def create_environment(self, project, body):
+        if body["key"] in project["environments"]:
+            return 409, {"code": "conflict", "message": "Environment already exists"}
+        # New environments get the API's default approval settings
+        approvals = {
+            "required": False,
+            "bypassApprovalsForPendingChanges": False,
+            "minNumApprovals": 1,
+            "canReviewOwnRequest": False,
+            "canApplyDeclinedChanges": True,
+            "requiredApprovalTags": [],
+        }
+        environment = dict(
+            body,
+            approvalSettings=dict(approvals),
+            resourceApprovalSettings={"segment": dict(approvals)},
+        )
+        project["environments"][body["key"]] = environment
+        project["segments"][body["key"]] = {}
+        for flag in project["flags"].values():
+            flag["environments"][body["key"]] = new_flag_environment()
+        return 201, environment
+
+    def create_flag(self, project, body):
+        flag = dict(body)
+        flag["environments"] = {
+            env: new_flag_environment() for env in project["environments"]
+        }
+        return self.create_keyed(project["flags"], flag)
+
+    def create_keyed(self, items, body):
+        if body["key"] in items:
+            return 409, {"code": "conflict", "message": body["key"] + " already exists"}
+        items[body["key"]] = copy.deepcopy(body)
+        return 201, items[body["key"]]
+
+    def list_or_create(self, method, items, parts, query, body):
+        if method == "GET":
+            return self.page(items, parts, query)
+        if any(item["key"] == body["key"] for item in items):
+            return 409, {"code": "conflict", "message": body["key"] + " already exists"}
+        items.append(copy.deepcopy(body))
+        return 201, body
+
+    def get_or_patch(self, items, key, method, body):
+        if key not in items:
+            return 404, {"code": "not_found", "message": "Unknown key " + key}
+        if method == "PATCH":
+            if isinstance(body, dict):
+                body = body["patch"]
+            apply_patch(items[key], body)
+        return 200, items[key]
+
+    def missing_segments(self, segments, key):
+        missing = []
+        for rule in segments.get(key, {}).get("rules", []):
+            for clause in rule["clauses"]:
+                if clause["op"] == "segmentMatch":
+                    missing.extend(v for v in clause["values"] if v not in segments)
+        return missing
+
+    def patch_item(self, items, key, body):
+        for item in items:
+            if item["key"] == key:
+                apply_patch(item, body)
+                return 200, item
+        return 404, {"code": "not_found", "message": "Unknown key " + key}
+
+
+def new_flag_environment():
+    return {
+        "on": False,
+        "archived": False,
+        "targets": [],
+        "contextTargets": [],
+        "fallthrough": {"variation": 0},
+        "offVariation": 1,
+        "prerequisites": [],
+        "trackEvents": False,
+        "trackEventsFallthrough": False,
+        "rules": [],
+    }
+
+
+##################################################
+# JSON Patch (RFC 6902) add, replace and remove
+##################################################
+
+
+def apply_patch(document, ops):
+    for op in ops:
+        parts = [
+            part.replace("~1", "/").replace("~0", "~")
+            for part in op["path"].strip("/").split("/")
+        ]
+        parent = document
+        for part in parts[:-1]:
+            if isinstance(parent, list):
+                parent = parent[int(part)]
+            else:
+                parent = parent.setdefault(part, {})
+        last = parts[-1]
+        value = copy.deepcopy(op.get("value"))
+        if isinstance(parent, list):
+            index = len(parent) if last == "-" else int(last)
+            if op["op"] == "add":
+                parent.insert(index, value)
+            elif op["op"] == "replace":
+                parent[index] = value
+            elif op["op"] == "remove":
+                del parent[index]
+        elif op["op"] in ["add", "replace"]:
+            parent[last] = value
+        elif op["op"] == "remove":
+            parent.pop(last, None)
+
+
+##################################################
+# Start the stand-in on a background thread
+##################################################
+
+
+def start_server(
+    store,
+    port=0,
+    latency=0.0,
+    route_limit=0,
+    global_limit=0,
+    window=10.0,
+    error_rate=0.0,
+):
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockHandler)
+    server.daemon_threads = True
+    server.store = store
+    server.latency = latency
+    server.route_limit = route_limit
+    server.global_limit = global_limit
+    server.window = window
+    server.error_rate = error_rate
+    server.route_names = RateLimiter()
+    server.pagination = Pagination()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    from synthetic_project import generate_project
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
+    store = MockStore()
+    store.add_project("api-source", generate_project("support-service"))
+    server = start_server(store, port=port)
+    print(f"Serving http://127.0.0.1:{server.server_address[1]} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
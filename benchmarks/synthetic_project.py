@@ -0,0 +1,224 @@
+##################################################
+# Synthetic LaunchDarkly projects for the local stand-in (mock_server.py).
+#
+# generate_project() builds N flags x M environments x S segments, along
+# with metrics, members, context kinds, flag templates and payload filters,
+# in the layout MockStore.add_project() serves. Flags target users directly
+# and through rules matching segments, and every other segment has a rule
+# matching the segment before it, so segments are created in reference order.
+##################################################
+
+
+def generate_project(
+    key,
+    num_flags=100,
+    num_environments=3,
+    num_segments=10,
+    num_metrics=10,
+    num_members=10,
+    num_targets=10,
+):
+    members = [
+        {"_id": f"member-{i:04d}", "email": f"member-{i:04d}@example.com"}
+        for i in range(num_members)
+    ]
+    environments = {}
+    segments = {}
+    for e in range(num_environments):
+        env = generate_environment(e)
+        environments[env["key"]] = env
+        segments[env["key"]] = {}
+        for s in range(num_segments):
+            segment = generate_segment(s, num_targets)
+            segments[env["key"]][segment["key"]] = segment
+    flags = {}
+    for f in range(num_flags):
+        flag = generate_flag(f, environments, num_segments, num_targets, members)
+        flags[flag["key"]] = flag
+    metrics = {}
+    for m in range(num_metrics):
+        metric = generate_metric(m, members)
+        metrics[metric["key"]] = metric
+
+    return {
+        "project": {
+            "key": key,
+            "name": key.replace("-", " ").title(),
+            "defaultClientSideAvailability": {
+                "usingEnvironmentId": False,
+                "usingMobileKey": True,
+            },
+            "tags": ["synthetic"],
+        },
+        "flag_templates": [
+            {
+                "key": "release",
+                "temporary": True,
+                "tags": [],
+                "defaultVariations": {"onVariation": 0, "offVariation": 1},
+                "variations": [
+                    {"value": True, "name": "Available"},
+                    {"value": False, "name": "Unavailable"},
+                ],
+            },
+            {"key": "experiment", "tags": ["experiment"]},
+        ],
+        "context_kinds": [
+            {"key": "user", "name": "User", "description": "", "hideInTargeting": False},
+            {"key": "device", "name": "Device", "description": "", "hideInTargeting": False},
+        ],
+        "experimentation_settings": {
+            "randomizationUnits": [{"randomizationUnit": "user", "standardRandomizationUnit": "user"}]
+        },
+        "payload_filters": [
+            {
+                "key": "mobile",
+                "name": "Mobile",
+                "description": "",
+                "enabled": True,
+                "archived": False,
+                "rules": [{"kind": "tag", "action": "include", "values": ["mobile"]}],
+            }
+        ],
+        "metric_groups": [],
+        "environments": environments,
+        "segments": segments,
+        "metrics": metrics,
+        "flags": flags,
+        "members": members,
+    }
+
+
+def generate_environment(index):
+    approvals = {
+        "required": False,
+        "bypassApprovalsForPendingChanges": False,
+        "minNumApprovals": 1,
+        "canReviewOwnRequest": False,
+        "canApplyDeclinedChanges": True,
+        "requiredApprovalTags": [],
+    }
+    return {
+        "key": f"environment-{index:02d}",
+        "name": f"Environment {index:02d}",
+        "color": "417505",
+        "defaultTtl": 0,
+        "tags": [],
+        "secureMode": False,
+        "defaultTrackEvents": False,
+        "confirmChanges": False,
+        "requireComments": False,
+        "critical": index == 0,
+        "approvalSettings": dict(approvals),
+        "resourceApprovalSettings": {"segment": dict(approvals)},
+    }
+
+
+def generate_segment(index, num_targets):
+    rules = []
+    if index % 2 == 1:
+        rules.append(
+            {
+                "_id": f"segment-rule-{index}",
+                "clauses": [
+                    {
+                        "_id": f"segment-clause-{index}",
+                        "attribute": "segmentMatch",
+                        "op": "segmentMatch",
+                        "values": [f"segment-{index - 1:04d}"],
+                        "contextKind": "user",
+                        "negate": False,
+                    }
+                ],
+            }
+        )
+    return {
+        "key": f"segment-{index:04d}",
+        "name": f"Segment {index:04d}",
+        "description": "Synthetic segment",
+        "tags": [],
+        "included": [f"user-{i:06d}" for i in range(num_targets)],
+        "excluded": [],
+        "includedContexts": [],
+        "excludedContexts": [],
+        "rules": rules,
+    }
+
+
+def generate_flag(index, environments, num_segments, num_targets, members):
+    flag_environments = {}
+    for env in environments:
+        rules = []
+        if num_segments > 0:
+            rules.append(
+                {
+                    "_id": f"rule-{index}",
+                    "clauses": [
+                        {
+                            "_id": f"clause-{index}",
+                            "attribute": "segmentMatch",
+                            "op": "segmentMatch",
+                            "values": [f"segment-{index % num_segments:04d}"],
+                            "contextKind": "user",
+                            "negate": False,
+                        }
+                    ],
+                    "variation": 0,
+                    "trackEvents": False,
+                }
+            )
+        flag_environments[env] = {
+            "on": index % 3 != 0,
+            "archived": False,
+            "targets": [
+                {
+                    "variation": 0,
+                    "values": [f"user-{i:06d}" for i in range(num_targets)],
+                    "contextKind": "user",
+                }
+            ],
+            "contextTargets": [],
+            "fallthrough": {"variation": 1},
+            "offVariation": 1,
+            "prerequisites": [],
+            "trackEvents": False,
+            "trackEventsFallthrough": False,
+            "rules": rules,
+        }
+    flag = {
+        "key": f"flag-{index:05d}",
+        "name": f"Flag {index:05d}",
+        "kind": "boolean",
+        "description": "Synthetic flag",
+        "clientSideAvailability": {"usingEnvironmentId": False, "usingMobileKey": True},
+        "variations": [{"value": True}, {"value": False}],
+        "temporary": True,
+        "tags": ["synthetic"],
+        "archived": False,
+        "deprecated": False,
+        "environments": flag_environments,
+    }
+    if len(members) > 0:
+        flag["_maintainer"] = {"email": members[index % len(members)]["email"]}
+    return flag
+
+
+def generate_metric(index, members):
+    metric = {
+        "key": f"metric-{index:04d}",
+        "name": f"Metric {index:04d}",
+        "description": "",
+        "kind": "custom",
+        "eventKey": f"event-{index:04d}",
+        "isActive": True,
+        "isNumeric": False,
+        "tags": [],
+        "randomizationUnits": ["user"],
+        "unitAggregationType": "average",
+        "analysisType": "mean",
+        "eventDefault": {"disabled": True},
+        "successCriteria": "HigherThanBaseline",
+    }
+    if len(members) > 0:
+        metric["_maintainer"] = {"email": members[index % len(members)]["email"]}
+    return metric
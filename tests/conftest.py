@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The modules live at the top of the repository, and the mock server the
+# migration tests run against is in benchmarks/
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, "benchmarks"))
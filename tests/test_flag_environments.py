@@ -0,0 +1,109 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from LDMigrate import LDMigrate
+from LDMigrateAsync import LDMigrateAsync
+from mock_server import MockStore, start_server
+from synthetic_project import generate_project
+
+
+class Held:
+    count = 0
+    peak = 0
+    lock = None
+
+    # Counts the flags whose details have been read but not yet written
+    def __init__(self):
+        self.count = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def add(self, num):
+        with self.lock:
+            self.count += num
+            self.peak = max(self.peak, self.count)
+
+
+def track_sync(monkeypatch, held):
+    read = LDMigrate.get_source_flag_details
+    write = LDMigrate.create_target_flag_environment
+
+    def get_source_flag_details(self, flag):
+        details = read(self, flag)
+        held.add(1)
+        return details
+
+    def create_target_flag_environment(self, flag, flag_details):
+        try:
+            time.sleep(0.02)
+            return write(self, flag, flag_details)
+        finally:
+            held.add(-1)
+
+    monkeypatch.setattr(LDMigrate, "get_source_flag_details", get_source_flag_details)
+    monkeypatch.setattr(
+        LDMigrate, "create_target_flag_environment", create_target_flag_environment
+    )
+
+
+def track_async(monkeypatch, held):
+    read = LDMigrateAsync.get_source_flag_details
+    write = LDMigrateAsync.create_target_flag_environment
+
+    async def get_source_flag_details(self, flag):
+        details = await read(self, flag)
+        held.add(1)
+        return details
+
+    async def create_target_flag_environment(self, flag, flag_details):
+        try:
+            await asyncio.sleep(0.02)
+            return await write(self, flag, flag_details)
+        finally:
+            held.add(-1)
+
+    monkeypatch.setattr(
+        LDMigrateAsync, "get_source_flag_details", get_source_flag_details
+    )
+    monkeypatch.setattr(
+        LDMigrateAsync, "create_target_flag_environment", create_target_flag_environment
+    )
+
+
+# The writers are slowed down, so the readers run ahead of them until the
+# queue is full
+@pytest.mark.parametrize("engine", ["sync", "async"])
+def test_flag_details_held_in_memory_are_bounded(engine, tmp_path, monkeypatch):
+    held = Held()
+    if engine == "sync":
+        track_sync(monkeypatch, held)
+    else:
+        track_async(monkeypatch, held)
+    store = MockStore()
+    store.add_project(
+        "api-source",
+        generate_project("source", num_flags=60, num_environments=1, num_segments=0),
+    )
+    server = start_server(store)
+    host = "http://127.0.0.1:" + str(server.server_address[1])
+    try:
+        result = LDMigrate(
+            "api-source",
+            "source",
+            "api-target",
+            ignore_pauses=True,
+            concurrency=2,
+            engine=engine,
+            source_host=host,
+            target_host=host,
+            journal_path=str(tmp_path / "migration.journal"),
+        ).migrate()
+    finally:
+        server.shutdown()
+
+    assert result["total_flags"] == 60
+    assert held.count == 0
+    assert held.peak <= 4 * 2
@@ -0,0 +1,121 @@
+import pytest
+
+from LDMigrate import LDMigrate, MigrationMode
+from LDMigrateAsync import LDMigrateAsync
+from MigrationJournal import MigrationJournal
+from mock_server import MockStore, start_server
+from synthetic_project import generate_project
+
+
+def start_source(num_flags):
+    store = MockStore()
+    store.add_project(
+        "api-source",
+        generate_project(
+            "source", num_flags=num_flags, num_environments=1, num_segments=2
+        ),
+    )
+    server = start_server(store)
+    return store, server, "http://127.0.0.1:" + str(server.server_address[1])
+
+
+def make_migrator(host, engine, mode, journal_path=None):
+    return LDMigrate(
+        "api-source",
+        "source",
+        "api-target",
+        migration_mode=mode,
+        ignore_pauses=True,
+        concurrency=1,
+        engine=engine,
+        source_host=host,
+        target_host=host,
+        journal_path=journal_path,
+    )
+
+
+def test_no_journal_is_written_without_a_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store, server, host = start_source(3)
+    try:
+        migrator = make_migrator(host, "sync", MigrationMode.MIGRATE)
+        result = migrator.migrate()
+    finally:
+        server.shutdown()
+
+    assert migrator.journal.path is None
+    assert result["total_flags"] == 3
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_starting_a_journal_over_is_reported(tmp_path, capsys):
+    path = tmp_path / "migration.journal"
+    path.write_text('["flags", "flag-0000"]\n["flags", "flag-0001"]\n')
+    journal = MigrationJournal(str(path))
+
+    assert journal.open(resume=False) == 0
+    journal.close()
+    assert journal.replaced == 2
+    assert path.read_text() == ""
+
+
+def record_writes(monkeypatch, cls):
+    write = cls.create_target_flag_environment
+    written = []
+
+    def create_target_flag_environment(self, flag, flag_details):
+        written.append(flag)
+        return write(self, flag, flag_details)
+
+    async def create_target_flag_environment_async(self, flag, flag_details):
+        written.append(flag)
+        return await write(self, flag, flag_details)
+
+    if cls is LDMigrate:
+        monkeypatch.setattr(
+            cls, "create_target_flag_environment", create_target_flag_environment
+        )
+    else:
+        monkeypatch.setattr(
+            cls, "create_target_flag_environment", create_target_flag_environment_async
+        )
+    return written
+
+
+def read_entries(path):
+    journal = MigrationJournal(str(path))
+    journal.open(resume=True)
+    journal.close()
+    return journal.completed
+
+
+# The journal of a finished run loses its last six lines, with the next
+# one half written, as if the run had crashed part way through the
+# targeting rules. The retry only
+# writes what the journal does not hold, and ends with the full journal
+@pytest.mark.parametrize("engine", ["sync", "async"])
+def test_migrate_retry_resumes_after_a_partial_journal(
+    engine, tmp_path, monkeypatch, capsys
+):
+    path = tmp_path / "migration.journal"
+    cls = LDMigrate if engine == "sync" else LDMigrateAsync
+    store, server, host = start_source(10)
+    try:
+        make_migrator(host, engine, MigrationMode.MIGRATE, str(path)).migrate()
+        completed = read_entries(path)
+        lines = path.read_text().splitlines(keepends=True)
+        kept = lines[:-6]
+        path.write_text("".join(kept) + lines[len(kept)][:10])
+        capsys.readouterr()
+
+        written = record_writes(monkeypatch, cls)
+        result = make_migrator(host, engine, MigrationMode.RETRY, str(path)).migrate()
+    finally:
+        server.shutdown()
+
+    out = capsys.readouterr().out
+    assert "Resuming from " + str(path) + " with " + str(len(kept)) in out
+    assert "Skipped " + str(len(kept)) + " resources" in out
+    assert len(written) == 6
+    assert result["total_flags"] == 10
+    assert read_entries(path) == completed
@@ -0,0 +1,138 @@
+import pytest
+
+from LDMigrate import LDMigrate
+from mock_server import MockHandler, MockStore, start_server
+from synthetic_project import generate_project
+
+
+def make_metric(**fields):
+    metric = {
+        "key": "revenue",
+        "name": "Revenue",
+        "description": "",
+        "kind": "custom",
+        "eventKey": "purchase",
+        "isActive": True,
+        "isNumeric": True,
+        "tags": [],
+        "randomizationUnits": ["user"],
+        "unitAggregationType": "sum",
+        "analysisType": "mean",
+        "eventDefault": {"disabled": True},
+    }
+    metric.update(fields)
+    return metric
+
+
+def test_listing_with_every_field_skips_the_metric_get():
+    migrator = LDMigrate("api-source", "source", "api-target", ignore_pauses=True)
+    item = make_metric(unit="USD", successCriteria="HigherThanBaseline")
+
+    assert migrator.has_metric_details(item)
+    assert not migrator.has_metric_details(make_metric(unit="USD"))
+    assert not migrator.has_metric_details(
+        make_metric(successCriteria="HigherThanBaseline")
+    )
+    # A unit only matters for numeric metrics
+    assert migrator.has_metric_details(
+        make_metric(isNumeric=False, successCriteria="HigherThanBaseline")
+    )
+    assert not migrator.has_metric_details(
+        make_metric(
+            unit="USD", successCriteria="HigherThanBaseline", analysisType="percentile"
+        )
+    )
+
+
+# The listing has everything else the payload needs, so only unit and
+# successCriteria call for the single metric response
+@pytest.mark.parametrize("engine", ["sync", "async"])
+def test_metric_details_missing_from_the_listing_are_migrated(
+    engine, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(
+        MockHandler, "metric_detail_fields", ["unit", "successCriteria"]
+    )
+    project = generate_project(
+        "source", num_flags=1, num_environments=1, num_segments=0, num_metrics=0
+    )
+    project["metrics"]["revenue"] = make_metric(
+        unit="USD", successCriteria="HigherThanBaseline"
+    )
+    store = MockStore()
+    store.add_project("api-source", project)
+    server = start_server(store)
+    host = "http://127.0.0.1:" + str(server.server_address[1])
+    try:
+        LDMigrate(
+            "api-source",
+            "source",
+            "api-target",
+            ignore_pauses=True,
+            engine=engine,
+            source_host=host,
+            target_host=host,
+            journal_path=str(tmp_path / "migration.journal"),
+        ).migrate()
+    finally:
+        server.shutdown()
+
+    metric = store.account("api-target")["projects"]["source"]["metrics"]["revenue"]
+    assert metric["unit"] == "USD"
+    assert metric["successCriteria"] == "HigherThanBaseline"
+
+
+# The POST bodies name the target member with the maintainer's email,
+# and leave out the fields only responses have
+@pytest.mark.parametrize("engine", ["sync", "async"])
+def test_metrics_and_groups_are_posted_with_the_target_maintainer(engine, tmp_path):
+    project = generate_project(
+        "source", num_flags=1, num_environments=1, num_segments=0, num_metrics=1
+    )
+    email = project["metrics"]["metric-0000"]["_maintainer"]["email"]
+    project["metric_groups"] = [
+        {
+            "key": "checkout",
+            "name": "Checkout",
+            "kind": "standard",
+            "description": "",
+            "tags": [],
+            "maintainer": {"email": email},
+            "metrics": [{"key": "metric-0000", "nameInGroup": "first", "_links": {}}],
+            "_version": 1,
+        }
+    ]
+    store = MockStore()
+    store.add_project("api-source", project)
+    store.account("api-target")["members"] = [{"_id": "target-member", "email": email}]
+    server = start_server(store)
+    host = "http://127.0.0.1:" + str(server.server_address[1])
+    try:
+        LDMigrate(
+            "api-source",
+            "source",
+            "api-target",
+            ignore_pauses=True,
+            engine=engine,
+            source_host=host,
+            target_host=host,
+            journal_path=str(tmp_path / "migration.journal"),
+        ).migrate()
+    finally:
+        server.shutdown()
+
+    target = store.account("api-target")["projects"]["source"]
+    metric = target["metrics"]["metric-0000"]
+    assert metric["maintainerId"] == "target-member"
+    assert "_maintainer" not in metric
+    assert target["metric_groups"] == [
+        {
+            "key": "checkout",
+            "name": "Checkout",
+            "kind": "standard",
+            "description": "",
+            "tags": [],
+            "metrics": [{"key": "metric-0000", "nameInGroup": "first"}],
+            "maintainerId": "target-member",
+        }
+    ]
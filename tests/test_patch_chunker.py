@@ -0,0 +1,121 @@
+import copy
+
+import pytest
+
+from mock_server import apply_patch
+from PatchChunker import PatchChunker
+
+
+def make_environment(env, num_values):
+    return {
+        "on": True,
+        "targets": [
+            {
+                "variation": variation,
+                "values": [env + "-user-" + str(i) for i in range(num_values)],
+                "contextKind": "user",
+            }
+            for variation in range(2)
+        ],
+        "rules": [],
+    }
+
+
+def make_payload(num_values):
+    payload = []
+    for env in ["production", "staging"]:
+        environment = make_environment(env, num_values)
+        for field in ["on", "targets", "rules"]:
+            payload.append(
+                {
+                    "op": "replace",
+                    "path": "/environments/" + env + "/" + field,
+                    "value": environment[field],
+                }
+            )
+    payload.append(
+        {
+            "op": "replace",
+            "path": "/environments/test",
+            "value": make_environment("test", num_values),
+        }
+    )
+    payload.append(
+        {
+            "op": "add",
+            "path": "/tags/a~1b~0c",
+            "value": {"values~1": ["tag-" + str(i) for i in range(num_values)]},
+        }
+    )
+    return payload
+
+
+def apply_chunks(document, chunks):
+    for chunk in chunks:
+        apply_patch(document, chunk)
+    return document
+
+
+def make_document():
+    return {
+        "environments": {
+            env: make_environment(env, 3) for env in ["production", "staging", "test"]
+        },
+        "tags": {},
+    }
+
+
+@pytest.mark.parametrize("num_values", [10, 2000])
+@pytest.mark.parametrize("max_bytes", [1024, 4096, 64 * 1024])
+def test_chunks_apply_to_the_unchunked_patch(num_values, max_bytes):
+    chunker = PatchChunker(max_bytes)
+    payload = make_payload(num_values)
+    chunks = chunker.chunk(copy.deepcopy(payload))
+
+    expected = apply_chunks(make_document(), [payload])
+    assert apply_chunks(make_document(), chunks) == expected
+    for chunk in chunks:
+        assert chunker.size(chunk) <= max_bytes
+
+
+# Each list is cut into its leading elements and the ones appended after
+def test_a_large_list_keeps_the_elements_which_fit():
+    chunker = PatchChunker(1024)
+    values = ["user-" + str(i) for i in range(1000)]
+    op = {"op": "replace", "path": "/values", "value": values}
+    ops = [split for split, _ in chunker.split_op(op)]
+
+    assert ops[0]["op"] == "replace"
+    assert len(ops[0]["value"]) > 0
+    assert chunker.size(ops[0]) + 2 <= 1024
+    assert all(split["path"] == "/values/-" for split in ops[1:])
+    assert ops[0]["value"] + [split["value"] for split in ops[1:]] == values
+
+
+# The [] around the patch counts towards the limit
+def test_an_op_which_only_fits_without_the_brackets_is_split():
+    chunker = PatchChunker(1024)
+    op = {"op": "replace", "path": "/values", "value": [""]}
+    padding = 1024 - chunker.size(op)
+
+    op["value"] = ["x" * (padding - 2)]
+    assert chunker.size(op) == 1022
+    assert chunker.chunk([op]) == [[op]]
+    assert chunker.size([op]) == 1024
+
+    op["value"] = ["x" * (padding - 1)]
+    chunks = chunker.chunk([op])
+    assert len(chunks) == 2
+    for chunk in chunks:
+        assert chunker.size(chunk) <= 1024
+    assert apply_chunks({}, chunks) == apply_chunks({}, [[op]])
+
+
+def test_a_value_which_can_never_fit_is_reported(capsys):
+    chunker = PatchChunker(1024)
+    op = {"op": "replace", "path": "/description", "value": "x" * 2000}
+    small = {"op": "replace", "path": "/name", "value": "flag"}
+    chunks = chunker.chunk([small, op])
+
+    assert chunks == [[small], [op]]
+    assert "...patch op for /description is" in capsys.readouterr().out
@@ -0,0 +1,171 @@
+import copy
+
+import pytest
+
+from LDMigrate import LDMigrate, MigrationMode
+from mock_server import MockStore, apply_patch, start_server
+from PatchDiff import PatchDiff
+from synthetic_project import generate_project
+
+
+def make_target():
+    return {
+        "_id": "1234",
+        "_version": 3,
+        "name": "Checkout",
+        "tags": ["a", "b"],
+        "settings": {"a/b": 1, "c~d": {"e": [1, 2]}, "kept": "x"},
+        "environments": {
+            "production": {
+                "_site": {"href": "/production"},
+                "on": True,
+                "targets": [{"variation": 0, "values": ["user-1", "user-2"]}],
+                "rules": [
+                    {
+                        "_id": "rule-1",
+                        "clauses": [{"_id": "clause-1", "values": [["a"], ["b"]]}],
+                    }
+                ],
+            }
+        },
+    }
+
+
+# Applying the minimal ops to the target gives what the full ops would
+def assert_round_trip(target, ops):
+    expected = apply_patch_copy(target, ops)
+    minimal = PatchDiff().diff(copy.deepcopy(target), copy.deepcopy(ops))
+    assert apply_patch_copy(target, minimal) == expected
+    return minimal
+
+
+def apply_patch_copy(document, ops):
+    document = PatchDiff().normalize(copy.deepcopy(document))
+    apply_patch(document, copy.deepcopy(ops))
+    return document
+
+
+def test_matching_ops_are_dropped():
+    target = make_target()
+    ops = [
+        {"op": "replace", "path": "/name", "value": "Checkout"},
+        {
+            "op": "replace",
+            "path": "/environments/production",
+            "value": {
+                "on": True,
+                "targets": [{"variation": 0, "values": ["user-1", "user-2"]}],
+                "rules": [{"clauses": [{"values": [["a"], ["b"]]}]}],
+            },
+        },
+    ]
+
+    assert assert_round_trip(target, ops) == []
+
+
+def test_nested_lists_are_replaced_whole():
+    target = make_target()
+    rules = [{"clauses": [{"values": [["a"], ["b", "c"]]}]}]
+    ops = [
+        {
+            "op": "replace",
+            "path": "/environments/production",
+            "value": {
+                "on": True,
+                "targets": [{"variation": 0, "values": ["user-1", "user-2"]}],
+                "rules": rules,
+            },
+        }
+    ]
+
+    minimal = assert_round_trip(target, ops)
+    assert minimal == [
+        {"op": "replace", "path": "/environments/production/rules", "value": rules}
+    ]
+
+
+# An object the target has extra keys in is replaced whole, so the keys
+# are removed as the original op would have done
+def test_keys_missing_from_the_source_are_removed():
+    target = make_target()
+    ops = [
+        {"op": "replace", "path": "/settings", "value": {"a/b": 1, "c~d": {"e": [1]}}},
+        {"op": "replace", "path": "/environments/production", "value": {"on": False}},
+    ]
+
+    minimal = assert_round_trip(target, ops)
+    assert minimal == ops
+    assert "kept" not in apply_patch_copy(target, minimal)["settings"]
+
+
+def test_keys_are_escaped_in_the_paths():
+    target = make_target()
+    ops = [
+        {
+            "op": "replace",
+            "path": "/settings",
+            "value": {"a/b": 2, "c~d": {"e": [1, 2], "f~/g": True}, "kept": "x"},
+        }
+    ]
+
+    minimal = assert_round_trip(target, ops)
+    assert minimal == [
+        {"op": "replace", "path": "/settings/a~1b", "value": 2},
+        {"op": "add", "path": "/settings/c~0d/f~0~1g", "value": True},
+    ]
+
+
+def test_ops_outside_the_target_are_kept():
+    target = make_target()
+    ops = [
+        {"op": "add", "path": "/description", "value": "New"},
+        {"op": "replace", "path": "/settings/c~0d/e/5", "value": 3},
+        {"op": "remove", "path": "/tags/0"},
+    ]
+
+    assert PatchDiff().diff(target, ops) == ops
+
+
+# A second run in merge mode only sends what changed in the source since
+# the first
+@pytest.mark.parametrize("engine", ["sync", "async"])
+def test_merge_only_updates_the_changed_flag(engine, tmp_path):
+    project = generate_project(
+        "source", num_flags=3, num_environments=1, num_segments=0, num_metrics=0
+    )
+    store = MockStore()
+    store.add_project("api-source", project)
+    server = start_server(store)
+    host = "http://127.0.0.1:" + str(server.server_address[1])
+
+    def migrate(mode, journal):
+        return LDMigrate(
+            "api-source",
+            "source",
+            "api-target",
+            migration_mode=mode,
+            ignore_pauses=True,
+            ignore_duplicate_flags=True,
+            ignore_duplicate_segments=True,
+            engine=engine,
+            source_host=host,
+            target_host=host,
+            journal_path=str(tmp_path / journal),
+        ).migrate()
+
+    try:
+        migrate(MigrationMode.MIGRATE, "migrate.journal")
+        source_flags = store.account("api-source")["projects"]["source"]["flags"]
+        flag_key = sorted(source_flags)[0]
+        source_flags[flag_key]["name"] = "Renamed"
+        source_flags[flag_key]["tags"] = ["changed"]
+        store.reset_stats()
+        result = migrate(MigrationMode.MERGE, "merge.journal")
+    finally:
+        server.shutdown()
+
+    target_flags = store.account("api-target")["projects"]["source"]["flags"]
+    assert target_flags[flag_key]["name"] == "Renamed"
+    assert target_flags[flag_key]["tags"] == ["changed"]
+    assert result["total_flags"] == 3
+    assert result["total_unchanged"] >= 2
@@ -0,0 +1,93 @@
+from LDMigrate import LDMigrate
+from MigrationPlanner import MigrationPlanner
+from PhaseScheduler import PhaseScheduler
+
+
+def make_planner(engine):
+    migrator = LDMigrate(
+        "api-source", "source", "api-target", concurrency=8, engine=engine
+    )
+    planner = MigrationPlanner(migrator)
+    planner.latency = {"source": 0.1, "target": 0.1}
+    planner.rates = {"source": None, "target": None}
+    return planner
+
+
+# Each phase makes 16 requests at 100ms, so its estimate is 1.6s over the
+# number of requests it has in flight at once
+def estimate(planner, names):
+    scheduler = PhaseScheduler()
+    for name in names:
+        scheduler.add(name, None)
+        planner.calls[name] = {"target POST": 16}
+    planner.estimate(scheduler)
+    return planner.estimates
+
+
+def test_sync_engine_runs_only_its_pooled_phases_in_parallel():
+    estimates = estimate(make_planner("sync"), ["project", "environments", "flags"])
+
+    assert abs(estimates["project"] - 1.6) < 1e-9
+    assert abs(estimates["environments"] - 0.2) < 1e-9
+    assert abs(estimates["flags"] - 1.6) < 1e-9
+
+
+def test_async_engine_runs_every_phase_but_the_project_in_parallel():
+    estimates = estimate(make_planner("async"), ["project", "environments", "flags"])
+
+    assert abs(estimates["project"] - 1.6) < 1e-9
+    assert abs(estimates["environments"] - 0.2) < 1e-9
+    assert abs(estimates["flags"] - 0.2) < 1e-9
+
+
+def make_segment(key, references=()):
+    rules = []
+    if len(references) > 0:
+        clause = {"_id": key + "-clause", "attribute": "segmentMatch"}
+        clause.update({"op": "segmentMatch", "values": list(references)})
+        rules.append({"_id": key + "-rule", "clauses": [clause]})
+    return {
+        "key": key,
+        "name": key,
+        "tags": [],
+        "included": [],
+        "excluded": [],
+        "includedContexts": [],
+        "excludedContexts": [],
+        "rules": rules,
+    }
+
+
+# Production has three segments in its first level and one which matches a
+# segment of it, and staging has one segment
+def plan_segments(planner):
+    segments = [
+        {
+            "environment": "production",
+            "segments": [
+                make_segment("beta"),
+                make_segment("staff"),
+                make_segment("internal", ["staff"]),
+                make_segment("partners"),
+            ],
+        },
+        {"environment": "staging", "segments": [make_segment("beta")]},
+    ]
+    planner.migrator.get_source_segments = lambda: segments
+    planner.phase = "segments"
+    planner.calls["segments"] = {}
+    planner.create_target_segments()
+
+
+def test_segments_run_no_wider_than_the_widest_level():
+    planner = make_planner("sync")
+    plan_segments(planner)
+
+    assert planner.get_parallel("segments") == 3
+
+
+def test_async_engine_runs_the_segments_of_every_environment_at_once():
+    planner = make_planner("async")
+    plan_segments(planner)
+
+    assert planner.get_parallel("segments") == 4
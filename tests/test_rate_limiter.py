@@ -0,0 +1,110 @@
+import time
+
+from RateLimiter import RateLimiter, TokenBucket
+
+
+def test_reservations_past_the_budget_step_by_window():
+    bucket = TokenBucket()
+    now = time.time()
+    # 10 requests per 1 second window, one of them already used
+    bucket.update(9, now + 1.0, sent_at=now)
+
+    waits = [bucket.acquire() for _ in range(30)]
+
+    assert waits[:9] == [0] * 9
+    for i, wait in enumerate(waits[9:]):
+        expected = 1.0 + i // 10
+        assert abs(wait - expected) < 0.05, (i, wait)
+
+
+def test_window_rollover_keeps_reservations_pushed_into_it():
+    bucket = TokenBucket()
+    now = time.time()
+    bucket.update(0, now + 1.0, sent_at=now)
+    bucket.capacity = 10
+    bucket.tokens = -15
+
+    # Half a window into the next window: its budget went to 10 of the 15
+    # reservations already pushed into it, so the other 5 and this one wait
+    # for the window after it, and the 5 after them for one more
+    bucket.reset_at = now - 0.5
+    waits = [bucket.acquire() for _ in range(10)]
+
+    for i, wait in enumerate(waits):
+        expected = 0.5 if i < 5 else 1.5
+        assert abs(wait - expected) < 0.05, (i, wait)
+
+
+def test_unknown_budget_is_probed_by_one_request():
+    limiter = RateLimiter()
+    route = limiter.normalize_route("GET", "/api/v2/flags/project")
+
+    assert limiter.reserve(route) == 0
+    assert limiter.reserve(route) is None
+
+    limiter.update(
+        route,
+        {
+            "X-Ratelimit-Route-Remaining": "5",
+            "X-Ratelimit-Reset": str(int((time.time() + 10) * 1000)),
+        },
+    )
+    assert limiter.reserve(route) == 0
+
+
+def test_responses_without_rate_limit_headers_end_the_probe():
+    limiter = RateLimiter()
+    route = limiter.normalize_route("GET", "/api/v2/flags/project")
+
+    assert limiter.reserve(route) == 0
+    limiter.update(route, {})
+    assert [limiter.reserve(route) for _ in range(20)] == [0] * 20
+
+
+# A request which got no response lets the next one probe straight away
+def test_a_probe_without_a_response_is_ended():
+    limiter = RateLimiter()
+    route = limiter.normalize_route("GET", "/api/v2/flags/project")
+
+    assert limiter.reserve(route) == 0
+    assert limiter.reserve(route) is None
+    limiter.end_probe(route)
+    assert limiter.reserve(route) == 0
+    assert limiter.reserve(route) is None
+
+
+# A server whose reset is always a window away never rolls over, so the
+# budget comes back with each of its responses
+def test_reset_moving_with_every_response_does_not_starve_the_bucket():
+    bucket = TokenBucket()
+    waits = []
+    for _ in range(300):
+        now = time.time()
+        wait = bucket.acquire()
+        if wait is not None:
+            waits.append(wait)
+            bucket.update(100, now + 10.0, sent_at=now)
+
+    assert waits == [0] * 300
+
+
+def test_window_the_roll_paid_for_is_not_paid_for_again():
+    bucket = TokenBucket()
+    now = time.time()
+    bucket.update(9, now + 1.0, sent_at=now)
+    for _ in range(25):
+        bucket.acquire()
+
+    # The window ended half a window ago, and the roll gives the next one
+    # to the reservations pushed into it
+    bucket.reset_at = bucket.server_reset = now - 0.5
+    assert abs(bucket.acquire() - 0.5) < 0.05
+    tokens = bucket.tokens
+
+    # A late response from the window which ended is ignored, and the
+    # server's reset for the new one only moves it
+    bucket.update(5, now - 0.5, sent_at=now - 1.0)
+    bucket.update(9, now + 0.55, sent_at=now - 0.45)
+
+    assert bucket.tokens == tokens
+    assert abs(bucket.reset_at - (now + 0.55)) < 1e-9
@@ -0,0 +1,178 @@
+import email.utils
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from RestAdapter import RestAdapter
+from RetryPolicy import (
+    RetriesExhaustedError,
+    RetryBudgetExhaustedError,
+    RetryPolicy,
+    UnsafeRetryError,
+)
+
+
+def test_writes_are_not_resent_once_they_may_have_been_applied():
+    policy = RetryPolicy()
+    for method in ["POST", "PATCH"]:
+        with pytest.raises(UnsafeRetryError):
+            policy.get_delay(method, "/flags/a", 1, 0.0, error=OSError("reset"))
+        assert policy.get_delay(method, "/flags/a", 1, 0.0, status_code=500) is None
+
+
+# A connection which was never made, or a 503, means the request was not
+# handled, so writes are sent again
+def test_writes_are_resent_when_they_never_reached_the_server():
+    policy = RetryPolicy()
+    for method in ["POST", "PATCH"]:
+        error = requests.exceptions.ConnectTimeout("connect timeout")
+        delay = policy.get_delay(method, "/flags/a", 1, 0.0, error=error, sent=False)
+        assert delay >= 0
+        assert policy.get_delay(method, "/flags/a", 1, 0.0, status_code=503) >= 0
+    assert policy.get_delay("GET", "/flags/a", 1, 0.0, status_code=500) >= 0
+    assert policy.get_delay("GET", "/flags/a", 1, 0.0, status_code=404) is None
+
+
+def test_retry_after_is_honoured():
+    policy = RetryPolicy(base_delay=0.5)
+    delay = policy.get_delay(
+        "GET", "/flags/a", 1, 0.0, status_code=503, headers={"Retry-After": "7"}
+    )
+    assert 7.0 <= delay <= 7.5
+
+    retry_at = email.utils.formatdate(time.time() + 20, usegmt=True)
+    delay = policy.get_delay(
+        "GET", "/flags/a", 1, 0.0, status_code=429, headers={"Retry-After": retry_at}
+    )
+    assert 18.0 <= delay <= 21.5
+
+
+def test_the_rate_limit_reset_is_honoured():
+    policy = RetryPolicy(base_delay=0.5)
+    reset = str(int((time.time() + 10) * 1000))
+    headers = {"X-Ratelimit-Reset": reset}
+    delay = policy.get_delay("PATCH", "/flags/a", 1, 0.0, status_code=429, headers=headers)
+    assert 9.0 <= delay <= 10.5
+
+    # The later of the two wins
+    headers = {"Retry-After": "3", "X-Ratelimit-Reset": reset}
+    delay = policy.get_delay("GET", "/flags/a", 1, 0.0, status_code=429, headers=headers)
+    assert delay >= 9.0
+
+
+def test_a_request_gives_up_after_its_attempts():
+    policy = RetryPolicy(max_attempts=3)
+    assert policy.get_delay("GET", "/flags/a", 2, 0.0, status_code=502) is not None
+    assert policy.get_delay("GET", "/flags/a", 3, 0.0, status_code=502) is None
+    with pytest.raises(RetriesExhaustedError):
+        policy.get_delay("GET", "/flags/a", 3, 0.0, error=OSError("reset"))
+
+
+# 429s are paced by the server, so they do not use up the run's retries
+def test_the_run_budget_raises_once_used_up():
+    policy = RetryPolicy(max_run_retries=2)
+    for _ in range(3):
+        assert policy.get_delay("GET", "/flags/a", 1, 0.0, status_code=429) is not None
+    assert policy.run_retries == 0
+    assert policy.get_delay("GET", "/flags/a", 1, 0.0, status_code=500) is not None
+    assert policy.get_delay("GET", "/flags/a", 1, 0.0, error=OSError("reset")) is not None
+
+    assert policy.get_delay("GET", "/flags/b", 1, 0.0, status_code=500) is None
+    with pytest.raises(RetryBudgetExhaustedError):
+        policy.get_delay("GET", "/flags/b", 1, 0.0, error=OSError("reset"))
+
+
+##################################################
+# Through the sync REST adapter
+##################################################
+
+
+class DroppingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    # Every request is read and counted, then the connection is closed
+    # without a response
+    def handle_one_request(self):
+        self.raw_requestline = self.rfile.readline(65537)
+        if not self.raw_requestline or not self.parse_request():
+            self.close_connection = True
+            return
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.requests.append(self.command)
+        self.close_connection = True
+
+
+class CreatedHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.requests.append(self.command)
+        body = b'{"key": "a"}'
+        self.send_response(201)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:" + str(server.server_address[1])
+
+
+def make_adapter(host):
+    return RestAdapter(host, "v2", "api-test", retry_policy=RetryPolicy(base_delay=0.01))
+
+
+def test_a_post_which_reached_the_server_is_sent_once():
+    server, host = start(DroppingHandler)
+    adapter = make_adapter(host)
+    try:
+        with pytest.raises(UnsafeRetryError):
+            adapter.post("/flags/a", json={"key": "a"})
+        with pytest.raises(RetriesExhaustedError):
+            adapter.get("/flags/a")
+    finally:
+        adapter.close()
+        server.shutdown()
+
+    assert server.requests == ["POST"] + ["GET"] * RetryPolicy.max_attempts
+
+
+def test_a_post_whose_connection_timed_out_is_sent_again(monkeypatch):
+    server, host = start(CreatedHandler)
+    adapter = make_adapter(host)
+    send = adapter.session.request
+    timeouts = []
+
+    def request(**kwargs):
+        if len(timeouts) == 0:
+            timeouts.append(kwargs["url"])
+            raise requests.exceptions.ConnectTimeout("connect timeout")
+        return send(**kwargs)
+
+    monkeypatch.setattr(adapter.session, "request", request)
+    try:
+        response = adapter.post("/flags/a", json={"key": "a"})
+    finally:
+        adapter.close()
+        server.shutdown()
+
+    assert response.status_code == 201
+    assert len(timeouts) == 1
+    assert server.requests == ["POST"]
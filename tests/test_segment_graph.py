@@ -0,0 +1,151 @@
+import pytest
+
+from LDMigrate import LDMigrate
+from mock_server import MockStore, start_server
+from SegmentGraph import SegmentGraph
+from synthetic_project import generate_project
+
+
+def make_segment(key, references=()):
+    rules = []
+    if len(references) > 0:
+        clause = {"_id": key + "-clause", "attribute": "segmentMatch"}
+        clause.update({"op": "segmentMatch", "values": list(references)})
+        clause.update({"contextKind": "user", "negate": False})
+        rules.append({"_id": key + "-rule", "clauses": [clause]})
+    return {
+        "key": key,
+        "name": key,
+        "tags": [],
+        "included": [],
+        "excluded": [],
+        "includedContexts": [],
+        "excludedContexts": [],
+        "rules": rules,
+    }
+
+
+# staff and beta both match base, and internal matches both of them
+def test_a_diamond_is_ordered_by_level():
+    graph = SegmentGraph(
+        [
+            make_segment("internal", ["staff", "beta"]),
+            make_segment("staff", ["base"]),
+            make_segment("beta", ["base"]),
+            make_segment("base"),
+        ]
+    )
+
+    assert graph.levels == [["base"], ["staff", "beta"], ["internal"]]
+    assert graph.unordered == []
+    assert graph.cycles == []
+
+
+def test_references_outside_the_graph_are_satisfied():
+    graph = SegmentGraph([make_segment("staff", ["migrated"])])
+
+    assert graph.levels == [["staff"]]
+
+
+def test_a_segment_matching_itself_is_a_cycle():
+    graph = SegmentGraph([make_segment("base"), make_segment("loop", ["loop", "base"])])
+
+    assert graph.levels == [["base"]]
+    assert graph.unordered == ["loop"]
+    assert graph.cycles == [["loop"]]
+
+
+# internal is behind the cycle, so it cannot be ordered either, but it is
+# not part of it
+def test_two_segments_matching_each_other_are_a_cycle():
+    graph = SegmentGraph(
+        [
+            make_segment("alpha", ["beta"]),
+            make_segment("base"),
+            make_segment("beta", ["alpha"]),
+            make_segment("internal", ["alpha"]),
+        ]
+    )
+
+    assert graph.levels == [["base"]]
+    assert graph.unordered == ["alpha", "beta", "internal"]
+    assert graph.cycles == [["alpha", "beta"]]
+
+
+def make_project():
+    project = generate_project(
+        "source", num_flags=1, num_environments=1, num_segments=0, num_metrics=0
+    )
+    env = list(project["segments"])[0]
+    for segment in [
+        make_segment("alpha", ["beta"]),
+        make_segment("base"),
+        make_segment("beta", ["alpha"]),
+        make_segment("internal", ["alpha"]),
+        make_segment("staff", ["base"]),
+    ]:
+        project["segments"][env][segment["key"]] = segment
+    return project, env
+
+
+def record_segment_calls(monkeypatch, calls):
+    create = LDMigrate.create_target_segment
+    patch_rules = LDMigrate.patch_target_segment_rules
+
+    def create_target_segment(self, environment, segment_data, ordered):
+        calls.append(("create", segment_data["key"], ordered))
+        return create(self, environment, segment_data, ordered)
+
+    def patch_target_segment_rules(self, segment_path, rules_payload):
+        calls.append(("rules", segment_path.split("/")[-1], False))
+        return patch_rules(self, segment_path, rules_payload)
+
+    monkeypatch.setattr(LDMigrate, "create_target_segment", create_target_segment)
+    monkeypatch.setattr(
+        LDMigrate, "patch_target_segment_rules", patch_target_segment_rules
+    )
+
+
+# The target rejects rules matching a segment it does not have yet, so the
+# cycle only migrates if its rules are patched once every segment exists
+@pytest.mark.parametrize("engine", ["sync", "async"])
+def test_a_cycle_is_reported_and_its_rules_patched_last(
+    engine, tmp_path, monkeypatch, capsys
+):
+    calls = []
+    record_segment_calls(monkeypatch, calls)
+    project, env = make_project()
+    store = MockStore()
+    store.add_project("api-source", project)
+    server = start_server(store)
+    host = "http://127.0.0.1:" + str(server.server_address[1])
+    try:
+        result = LDMigrate(
+            "api-source",
+            "source",
+            "api-target",
+            ignore_pauses=True,
+            engine=engine,
+            source_host=host,
+            target_host=host,
+            journal_path=str(tmp_path / "migration.journal"),
+        ).migrate()
+    finally:
+        server.shutdown()
+
+    out = capsys.readouterr().out
+    assert "reference each other in a cycle: alpha, beta" in out
+    assert "3 segments in " + env + " cannot be ordered" in out
+    assert result["total_segments"] == 5
+    segments = store.account("api-target")["projects"]["source"]["segments"][env]
+    for key, references in [("alpha", ["beta"]), ("beta", ["alpha"]), ("staff", ["base"])]:
+        assert segments[key]["rules"][0]["clauses"][0]["values"] == references
+
+    # The async engine creates segments in its own closures
+    if engine == "sync":
+        rules = [call[1] for call in calls if call[0] == "rules"]
+        assert sorted(rules) == ["alpha", "beta", "internal"]
+        first_rules = calls.index(("rules", rules[0], False))
+        assert all(call[0] == "rules" for call in calls[first_rules:])
+        assert ("create", "staff", True) in calls
+        assert ("create", "alpha", False) in calls